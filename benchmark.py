@@ -0,0 +1,584 @@
+"""Воспроизводимый бенчмарк конвейера генерации сертификатов.
+
+Создает синтетические шаблоны (1080p, 4K, A4 300 dpi) и списки ФИО разной
+длины (по умолчанию 1k/10k/100k строк), прогоняет их через этапы генерации
+в режимах area и point и выводит JSON с временем, пропускной способностью и
+пиковой памятью каждого этапа: чтение списка, копия шаблона, разметка
+(перенос строк), рисование текста, кодирование и запись файла. Отдельно
+сравнивается рисование строк через draw.text и через кэш глифов (GlyphAtlas)
+на одних и тех же строках, с попиксельной сверкой каждой строки в нескольких
+размерах шрифта; при расхождении бенчмарк завершается с кодом 1.
+
+Пример:
+    python benchmark.py --output bench.json
+    python benchmark.py --quick --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import PIL
+from PIL import Image, ImageChops, ImageDraw
+
+from certificate_renderer import (RenderSettings, Roster, CertificateRenderer, calculate_text_position,
+                                  certificate_filename, draw_border, draw_line, draw_lines, layout_lines,
+                                  load_font, text_metrics)
+from font_resolver import default_resolver
+from glyph_atlas import GlyphAtlas
+from output_formats import OUTPUT_PRESETS, OutputFormat
+
+
+BENCHMARK_VERSION = 2
+
+# Синтетические шаблоны: имя -> (ширина, высота)
+TEMPLATES = {
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+    "a4-300dpi": (2480, 3508),
+}
+
+ROSTER_SIZES = (1000, 10000, 100000)
+
+MODES = ("area", "point")
+
+# Размеры шрифта, на которых атлас дополнительно сверяется с draw.text по всем
+# строкам: мелкие и нечетные размеры, где глифы чаще заходят друг на друга
+ATLAS_CHECK_SIZES = (13, 24, 27)
+
+STAGES = ("roster_read", "template_copy", "layout", "draw", "encode", "write")
+
+SURNAMES = ("Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+            "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семенов", "Егоров",
+            "Павлов", "Козлов", "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин",
+            "Захаров", "Зайцев", "Соловьев", "Борисов", "Яковлев", "Григорьев", "Романов", "Воробьев",
+            "Константинопольский", "Преображенский", "Рождественский", "Вознесенский")
+FIRST_NAMES = (("Александр", "Алексей", "Дмитрий", "Сергей", "Андрей", "Максим", "Иван", "Михаил",
+                "Артем", "Никита", "Владимир", "Константин", "Святослав", "Ярослав"),
+               ("Анна", "Мария", "Елена", "Ольга", "Наталья", "Татьяна", "Ирина", "Екатерина",
+                "Светлана", "Юлия", "Анастасия", "Александра", "Евгения", "Ксения"))
+PATRONYMICS = (("Александрович", "Алексеевич", "Дмитриевич", "Сергеевич", "Андреевич", "Иванович",
+                "Михайлович", "Владимирович", "Константинович", "Вячеславович"),
+               ("Александровна", "Алексеевна", "Дмитриевна", "Сергеевна", "Андреевна", "Ивановна",
+                "Михайловна", "Владимировна", "Константиновна", "Вячеславовна"))
+
+
+def synthetic_names(count, seed=0):
+    """Детерминированный список ФИО разной длины"""
+    rng = random.Random(seed)
+    names = []
+    for _ in range(count):
+        female = rng.random() < 0.5
+        surname = rng.choice(SURNAMES) + ("а" if female else "")
+        kind = rng.random()
+        if kind < 0.1:
+            # Двойная фамилия
+            surname += "-" + rng.choice(SURNAMES) + ("а" if female else "")
+        name = f"{surname} {rng.choice(FIRST_NAMES[female])}"
+        if kind < 0.95:
+            name += " " + rng.choice(PATRONYMICS[female])
+        if kind > 0.97:
+            # Очень длинная строка, которая переносится на несколько строк
+            name += " " + " ".join(rng.choice(SURNAMES) for _ in range(rng.randint(3, 6)))
+        names.append(name)
+    return names
+
+
+def synthetic_template(size, seed=0):
+    """Шаблон с градиентом и рамкой, чтобы кодирование не было тривиальным"""
+    width, height = size
+    gradient = Image.linear_gradient("L").resize(size)
+    template = Image.merge("RGB", (gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+                                   Image.new("L", size, 200)))
+    draw = ImageDraw.Draw(template)
+    rng = random.Random(seed)
+    margin = min(size) // 20
+    draw.rectangle([margin, margin, width - margin, height - margin], outline="#8B6914", width=margin // 4)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randint(margin // 4, margin)
+        draw.ellipse([x - r, y - r, x + r, y + r], outline="#C0A060", width=3)
+    return template
+
+
+def write_roster_csv(path, names):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("№,ФИО\n")
+        for i, name in enumerate(names, 1):
+            f.write(f"{i},{name}\n")
+
+
+def template_settings(size, mode, font_name, output_preset):
+    """Настройки, пропорциональные размеру шаблона"""
+    width, height = size
+    values = {
+        "text_mode": mode,
+        "text_alignment": "center",
+        "text_x": width // 5,
+        "text_y": height * 9 // 20,
+        "text_area_x1": width // 5,
+        "text_area_y1": height * 2 // 5,
+        "text_area_x2": width * 4 // 5,
+        "text_area_y2": height * 3 // 5,
+        "font_size": max(12, width // 30),
+        "line_spacing": max(2, width // 300),
+        "selected_font": font_name,
+    }
+    values.update(OUTPUT_PRESETS[output_preset])
+    return RenderSettings.from_dict(values)
+
+
+def read_hwm_kb():
+    """Пиковый RSS процесса в КБ (Linux) или None"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            return int(re.search(r"VmHWM:\s+(\d+)", f.read()).group(1))
+    except (OSError, AttributeError):
+        return None
+
+
+def read_rss_kb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            return int(re.search(r"VmRSS:\s+(\d+)", f.read()).group(1))
+    except (OSError, AttributeError):
+        return None
+
+
+def reset_hwm():
+    """Сбрасывает пиковый RSS (Linux); False, если не поддерживается"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageMeter:
+    """Суммирует время этапов; в режиме памяти также пиковую память"""
+
+    def __init__(self, measure_memory=False):
+        self.measure_memory = measure_memory
+        self.seconds = {}
+        self.items = {}
+        self.peak_python_kb = {}
+        self.peak_rss_kb = {}
+        self._stage = None
+
+    def start(self, stage):
+        self._stage = stage
+        if self.measure_memory:
+            tracemalloc.reset_peak()
+            self._python_before = tracemalloc.get_traced_memory()[0]
+            self._rss_before = read_rss_kb() if reset_hwm() else None
+        self._start = time.perf_counter()
+
+    def stop(self, items=1):
+        elapsed = time.perf_counter() - self._start
+        stage = self._stage
+        if self.measure_memory:
+            python_peak = (tracemalloc.get_traced_memory()[1] - self._python_before) / 1024
+            self.peak_python_kb[stage] = max(self.peak_python_kb.get(stage, 0), python_peak)
+            if self._rss_before is not None:
+                rss_peak = max(0, read_hwm_kb() - self._rss_before)
+                self.peak_rss_kb[stage] = max(self.peak_rss_kb.get(stage, 0), rss_peak)
+        else:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed
+            self.items[stage] = self.items.get(stage, 0) + items
+
+
+def sample_names(names, limit):
+    """Равномерная выборка по всему списку, чтобы попали и длинные ФИО"""
+    if len(names) <= limit:
+        return list(names)
+    step = len(names) / limit
+    return [names[int(i * step)] for i in range(limit)]
+
+
+def run_render_stages(meter, template, settings, names, output_dir):
+    """Прогоняет ФИО через этапы генерации, повторяя путь generate_batch"""
+    renderer = CertificateRenderer(template, settings)
+    font = renderer.font
+    output_format = OutputFormat.from_settings(settings)
+    for i, name in enumerate(names):
+        meter.start("template_copy")
+        cert_img = renderer.working_copy()
+        meter.stop()
+
+        meter.start("layout")
+        if settings.text_mode == "point":
+            placed = [(name,) + tuple(calculate_text_position(settings))]
+        else:
+            x, y, max_width = calculate_text_position(settings)
+            placed = layout_lines(name, font, x, y, settings.text_alignment, max_width,
+                                  settings.line_spacing)
+        meter.stop()
+
+        meter.start("draw")
+        draw = ImageDraw.Draw(cert_img)
+        draw_border(draw, cert_img.size)
+        if settings.text_mode == "point":
+            text, x, y = placed[0]
+            draw_line(draw, (x, y), text, font, settings.font_color)
+        else:
+            draw_lines(draw, placed, font, settings.font_color)
+        meter.stop()
+
+        meter.start("encode")
+        data = output_format.encode(cert_img)
+        meter.stop()
+
+        meter.start("write")
+        with open(os.path.join(output_dir, certificate_filename(i, name, output_format.extension)), "wb") as f:
+            f.write(data)
+        meter.stop()
+
+
+def placed_lines(settings, font, names):
+    """Строки (текст, x, y) всех ФИО в разметке генерации"""
+    lines = []
+    for name in names:
+        if settings.text_mode == "point":
+            x, y = calculate_text_position(settings)
+            lines.append((name, x, y))
+        else:
+            x, y, max_width = calculate_text_position(settings)
+            lines.extend(line[:3] for line in layout_lines(name, font, x, y, settings.text_alignment,
+                                                           max_width, settings.line_spacing))
+    return lines
+
+
+def line_difference(template, font, atlas, line, x, y, fill):
+    """Наибольшая разница канала между draw.text и атласом для одной строки на шаблоне.
+
+    Обе версии рисуются на вырезке шаблона вокруг строки с запасом на выносы глифов.
+    """
+    margin = text_metrics(font).overhang
+    left, top, right, bottom = font.getbbox(line)
+    box = (x + left - margin, y + top - margin, x + right + margin, y + bottom + margin)
+    expected = template.crop(box)
+    actual = expected.copy()
+    origin = (x - box[0], y - box[1])
+    ImageDraw.Draw(expected).text(origin, line, fill=fill, font=font)
+    atlas.draw(ImageDraw.Draw(actual), origin, line, fill)
+    extrema = ImageChops.difference(expected, actual).getextrema()
+    if isinstance(extrema[0], tuple):
+        return max(high for _low, high in extrema)
+    return extrema[1]
+
+
+def compare_lines(template, font, atlas, lines, fill):
+    """Сверяет с draw.text каждую строку: (строк с разницей, наибольшая разница, первая такая строка)"""
+    mismatched = 0
+    max_diff = 0
+    example = None
+    for line, x, y in lines:
+        diff = line_difference(template, font, atlas, line, x, y, fill)
+        if diff:
+            mismatched += 1
+            max_diff = max(max_diff, diff)
+            example = example or line
+    return mismatched, max_diff, example
+
+
+def run_text_comparison(template, settings, names):
+    """draw.text против сборки строк из кэша глифов на одном холсте.
+
+    Атлас создается заново: cold - первый проход с растеризацией глифов,
+    warm - повторный проход из кэша. Затем каждая строка отдельно сверяется
+    с draw.text: mismatched_lines - сколько строк отличается хотя бы одним
+    пикселем, max_pixel_diff - наибольшая разница канала.
+    """
+    font = load_font(settings.selected_font, settings.font_size)
+    lines = placed_lines(settings, font, names)
+    fill = settings.font_color
+    canvas = template.copy()
+    draw = ImageDraw.Draw(canvas)
+
+    start = time.perf_counter()
+    for line, x, y in lines:
+        draw.text((x, y), line, fill=fill, font=font)
+    plain = time.perf_counter() - start
+
+    start = time.perf_counter()
+    atlas = GlyphAtlas(font)
+    if atlas.enabled:
+        for line, x, y in lines:
+            atlas.draw(draw, (x, y), line, fill)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    if atlas.enabled:
+        for line, x, y in lines:
+            atlas.draw(draw, (x, y), line, fill)
+    warm = time.perf_counter() - start
+
+    mismatched = max_diff = example = None
+    if atlas.enabled:
+        mismatched, max_diff, example = compare_lines(template, font, atlas, lines, fill)
+
+    count = len(lines)
+    return {
+        "enabled": atlas.enabled,
+        "font_size": settings.font_size,
+        "lines": count,
+        "glyphs": len(atlas),
+        "plain_ms_per_line": round(plain * 1000 / count, 4) if count else None,
+        "atlas_cold_ms_per_line": round(cold * 1000 / count, 4) if count and atlas.enabled else None,
+        "atlas_warm_ms_per_line": round(warm * 1000 / count, 4) if count and atlas.enabled else None,
+        "speedup": round(plain / warm, 2) if warm and atlas.enabled else None,
+        "mismatched_lines": mismatched,
+        "max_pixel_diff": max_diff,
+        "first_mismatch": example,
+    }
+
+
+def run_atlas_check(template, settings, names, sizes):
+    """Сверка атласа с draw.text по всем строкам для каждого размера шрифта из sizes"""
+    checks = []
+    for size in sizes:
+        sized = RenderSettings.from_dict(dict(settings.to_dict(), font_size=size))
+        font = load_font(sized.selected_font, size)
+        lines = placed_lines(sized, font, names)
+        atlas = GlyphAtlas(font)
+        check = {"font_size": size, "enabled": atlas.enabled, "lines": len(lines),
+                 "mismatched_lines": None, "max_pixel_diff": None, "first_mismatch": None}
+        if atlas.enabled:
+            mismatched, max_diff, example = compare_lines(template, font, atlas, lines, sized.font_color)
+            check.update(mismatched_lines=mismatched, max_pixel_diff=max_diff, first_mismatch=example)
+        checks.append(check)
+    return checks
+
+
+def atlas_mismatches(report):
+    """Описания случаев, где атлас включен, но расходится с draw.text"""
+    found = []
+    for case in report["results"]:
+        for check in [case["glyph_atlas"]] + case["glyph_atlas_sizes"]:
+            if check["mismatched_lines"]:
+                found.append(f"{case['template']} / {case['roster']} ФИО / {case['mode']}, "
+                             f"размер {check['font_size']}: отличается строк {check['mismatched_lines']} "
+                             f"из {check['lines']}, разница до {check['max_pixel_diff']} "
+                             f"(например, '{check['first_mismatch']}')")
+    return found
+
+
+def run_roster_read(meter, roster_path):
+    meter.start("roster_read")
+    count = sum(1 for _ in Roster(roster_path))
+    meter.stop(count)
+    return count
+
+
+def run_case(template_name, template, roster_size, roster_path, names, mode, args, work_dir):
+    settings = template_settings(template.size, mode, args.font, args.preset)
+    # Новый объект шрифта - пустой кэш ширин слов, как в начале реального запуска
+    default_resolver().clear_cache()
+    sample = sample_names(names, args.render_limit)
+
+    timing = StageMeter()
+    read_count = run_roster_read(timing, roster_path)
+    output_dir = tempfile.mkdtemp(dir=work_dir)
+    run_render_stages(timing, template, settings, sample, output_dir)
+
+    memory = StageMeter(measure_memory=True)
+    tracemalloc.start()
+    try:
+        run_roster_read(memory, roster_path)
+        run_render_stages(memory, template, settings, sample[:args.memory_sample], output_dir)
+    finally:
+        tracemalloc.stop()
+
+    stages = {}
+    for stage in STAGES:
+        seconds = timing.seconds.get(stage, 0.0)
+        items = timing.items.get(stage, 0)
+        stages[stage] = {
+            "seconds": round(seconds, 6),
+            "items": items,
+            "per_second": round(items / seconds, 2) if seconds else None,
+            "ms_per_item": round(seconds * 1000 / items, 4) if items else None,
+            "peak_python_kb": round(memory.peak_python_kb.get(stage, 0), 1),
+            "peak_rss_kb": memory.peak_rss_kb.get(stage),
+        }
+    render_seconds = sum(stages[stage]["seconds"] for stage in STAGES[1:])
+    atlas_names = sample_names(names, args.atlas_sample)
+    glyph_cache = run_text_comparison(template, settings, atlas_names)
+    atlas_sizes = run_atlas_check(template, settings, atlas_names, args.atlas_sizes)
+    font = load_font(settings.selected_font, settings.font_size)
+    return {
+        "template": template_name,
+        "template_size": list(template.size),
+        "roster": roster_size,
+        "roster_rows_read": read_count,
+        "mode": mode,
+        "rendered": len(sample),
+        "font": getattr(font, "path", None),
+        "font_size": settings.font_size,
+        "output": output_format_name(settings),
+        "stages": stages,
+        "certificates_per_second": round(len(sample) / render_seconds, 2) if render_seconds else None,
+        "glyph_atlas": glyph_cache,
+        "glyph_atlas_sizes": atlas_sizes,
+    }
+
+
+def output_format_name(settings):
+    return OutputFormat.from_settings(settings).describe()
+
+
+def environment_info():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        revision = ""
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "revision": revision or None,
+    }
+
+
+def run_benchmark(args, log=print):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="certgen-bench-") as work_dir:
+        rosters = {}
+        for size in args.rosters:
+            names = synthetic_names(size, seed=args.seed)
+            path = os.path.join(work_dir, f"roster_{size}.csv")
+            write_roster_csv(path, names)
+            rosters[size] = (path, names)
+        for template_name in args.templates:
+            template = synthetic_template(TEMPLATES[template_name], seed=args.seed)
+            for size in args.rosters:
+                path, names = rosters[size]
+                for mode in args.modes:
+                    log(f"{template_name} / {size} ФИО / {mode}...")
+                    results.append(run_case(template_name, template, size, path, names, mode, args, work_dir))
+    return {
+        "benchmark_version": BENCHMARK_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment_info(),
+        "parameters": {
+            "templates": args.templates, "rosters": args.rosters, "modes": args.modes,
+            "render_limit": args.render_limit, "memory_sample": args.memory_sample,
+            "preset": args.preset, "font": args.font, "seed": args.seed,
+            "atlas_sample": args.atlas_sample, "atlas_sizes": args.atlas_sizes,
+        },
+        "results": results,
+    }
+
+
+def format_results(report, baseline=None):
+    """Текстовая таблица: мс на элемент по этапам, с отношением к baseline"""
+    previous = {}
+    if baseline:
+        for case in baseline.get("results", []):
+            previous[(case["template"], case["roster"], case["mode"])] = case["stages"]
+    lines = [f"{'Шаблон':<10} {'ФИО':>7} {'Режим':<6} " + " ".join(f"{stage:>14}" for stage in STAGES)]
+    for case in report["results"]:
+        old = previous.get((case["template"], case["roster"], case["mode"]), {})
+        cells = []
+        for stage in STAGES:
+            value = case["stages"][stage]["ms_per_item"]
+            old_value = old.get(stage, {}).get("ms_per_item")
+            cell = f"{value:.3f}" if value is not None else "-"
+            if value and old_value:
+                cell += f" x{old_value / value:.2f}"
+            cells.append(f"{cell:>14}")
+        lines.append(f"{case['template']:<10} {case['roster']:>7} {case['mode']:<6} " + " ".join(cells))
+    lines.append("Значения - мс на элемент; xN - ускорение относительно baseline (больше 1 - быстрее)")
+    lines.append("")
+    lines.append(f"{'Шаблон':<10} {'ФИО':>7} {'Режим':<6} {'draw.text':>10} {'атлас':>10} {'ускорение':>10}"
+                 f" {'разница':>8} {'строк':>7}")
+    for case in report["results"]:
+        atlas = case.get("glyph_atlas")
+        if not atlas or not atlas["enabled"]:
+            continue
+        lines.append(f"{case['template']:<10} {case['roster']:>7} {case['mode']:<6}"
+                     f" {atlas['plain_ms_per_line']:>10.3f} {atlas['atlas_warm_ms_per_line']:>10.3f}"
+                     f" {'x' + str(atlas['speedup']):>10} {atlas['max_pixel_diff']:>8}"
+                     f" {atlas['mismatched_lines']:>7}")
+    lines.append("draw.text и атлас - мс на строку текста; разница - наибольшее отличие канала пикселя;"
+                 " строк - сколько строк отличается от draw.text")
+    checks = {}
+    for case in report["results"]:
+        for check in case.get("glyph_atlas_sizes", []):
+            total = checks.setdefault(check["font_size"], [0, 0, 0, check["enabled"]])
+            total[0] += check["lines"]
+            total[1] += check["mismatched_lines"] or 0
+            total[2] = max(total[2], check["max_pixel_diff"] or 0)
+            total[3] = total[3] and check["enabled"]
+    if checks:
+        lines.append("")
+        lines.append("Сверка атласа с draw.text по всем строкам (размер: отличается строк / всего, разница):")
+        for size, (count, mismatched, max_diff, enabled) in sorted(checks.items()):
+            state = f"{mismatched} / {count}, {max_diff}" if enabled else "атлас отключен проверкой"
+            lines.append(f"  {size}: {state}")
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов генерации сертификатов")
+    parser.add_argument("--templates", nargs="+", choices=sorted(TEMPLATES), default=list(TEMPLATES))
+    parser.add_argument("--rosters", nargs="+", type=int, default=list(ROSTER_SIZES),
+                        help="Размеры синтетических списков ФИО")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--render-limit", type=int, default=20,
+                        help="Сколько сертификатов рисовать в каждом случае (выборка по всему списку)")
+    parser.add_argument("--memory-sample", type=int, default=3,
+                        help="Сколько сертификатов прогонять отдельно для замера памяти")
+    parser.add_argument("--atlas-sample", type=int, default=500,
+                        help="Сколько ФИО рисовать при сравнении draw.text и кэша глифов")
+    parser.add_argument("--atlas-sizes", nargs="+", type=int, default=list(ATLAS_CHECK_SIZES),
+                        help="Дополнительные размеры шрифта для сверки атласа с draw.text")
+    parser.add_argument("--preset", choices=sorted(OUTPUT_PRESETS), default="default")
+    parser.add_argument("--font", default="DejaVu Sans", help="Шрифт (по умолчанию DejaVu Sans или запасной)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true",
+                        help="Короткий прогон: 1080p, 1000 ФИО, 5 сертификатов")
+    parser.add_argument("--output", default="-", help="Файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.quick:
+        args.templates, args.rosters, args.render_limit, args.atlas_sample = ["1080p"], [1000], 5, 100
+
+    report = run_benchmark(args, log=lambda message: print(message, file=sys.stderr))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_results(report, baseline), file=sys.stderr)
+    mismatches = atlas_mismatches(report)
+    if mismatches:
+        print("Ошибка: кэш глифов рисует не так, как draw.text:", file=sys.stderr)
+        for text in mismatches:
+            print(f"  {text}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
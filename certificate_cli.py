@@ -0,0 +1,259 @@
+"""Пакетная генерация сертификатов из командной строки (без tkinter).
+
+Пример:
+    python certificate_cli.py project.json --roster participants.xlsx
+"""
+import argparse
+import os
+import sys
+
+from PIL import Image
+
+from certificate_renderer import (RenderSettings, Roster, RosterError, open_template,
+                                  generate_batch, generate_batch_parallel, create_output_folder,
+                                  RenderManifest, FONT_FIT_MODES, fit_settings,
+                                  field_columns, compare_sample_formats)
+from output_formats import FORMATS, OUTPUT_PRESETS, format_comparison
+from output_sinks import ZIP_COMPRESSION, FolderSink, ZipSink
+from pdf_output import PdfFontError, generate_pdf
+from layout_plan import LayoutPlan, dry_run, write_plan
+from large_template import LARGE_TEMPLATE_PIXELS, TemplateCache
+from run_stats import StageTimer, configure_logging
+from sharding import Shard, ShardError, ShardManifest
+
+
+def shard_argument(text):
+    """Тип аргумента --shard: строка i/N"""
+    try:
+        return Shard.parse(text)
+    except ShardError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Генерация сертификатов по сохраненному проекту без графического интерфейса")
+    parser.add_argument("project", nargs="?",
+                        help="JSON файл проекта (кнопка 'Сохранить настройки'); не нужен вместе с --from-plan")
+    parser.add_argument("--roster", help="Excel/CSV файл с колонкой 'ФИО' (по умолчанию из проекта)")
+    parser.add_argument("--template", help="Шаблон сертификата (по умолчанию из проекта)")
+    parser.add_argument("--output", help="Папка для сохранения (по умолчанию создается дата-время-сертификаты). "
+                                         "В существующей папке рисуются только новые и измененные строки")
+    parser.add_argument("--force", action="store_true",
+                        help="Перерисовать все сертификаты, не пропуская уже готовые")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Количество процессов (0 - все ядра, по умолчанию 1)")
+    parser.add_argument("--shared-template", action="store_true",
+                        help="Декодировать шаблон один раз в общую память для всех процессов")
+    parser.add_argument("--dirty-region", action="store_true",
+                        help="Перерисовывать только область текста на одном рабочем холсте")
+    parser.add_argument("--large-template", action="store_true",
+                        help="Большой шаблон: декодировать один раз в кэш на диске и писать PNG полосами, "
+                             "не держа изображение в памяти целиком")
+    parser.add_argument("--shard", type=shard_argument, metavar="i/N",
+                        help="Рисовать только часть i из N (строки с номером от нуля, дающим остаток i-1 "
+                             "при делении на N) для генерации на нескольких машинах; нумерация файлов общая, "
+                             "папки частей сливаются командой sharding.py merge")
+    parser.add_argument("--preset", choices=sorted(OUTPUT_PRESETS),
+                        help="Пресет формата сохранения (перекрывает настройки проекта)")
+    parser.add_argument("--format", dest="output_format", choices=sorted(FORMATS),
+                        help="Формат файлов: png, jpeg или webp")
+    parser.add_argument("--compress-level", type=int, choices=range(10), metavar="0-9",
+                        help="Уровень сжатия PNG")
+    parser.add_argument("--quality", type=int, help="Качество JPEG/WebP (1-100)")
+    parser.add_argument("--font-fit", choices=FONT_FIT_MODES,
+                        help="Подбор размера шрифта в режиме области: fixed - размер из проекта, "
+                             "name - для каждого ФИО, batch - один размер по самому длинному ФИО")
+    parser.add_argument("--min-font-size", type=int,
+                        help="Наименьший размер шрифта при подборе (по умолчанию из проекта)")
+    parser.add_argument("--zip", metavar="FILE",
+                        help="Записывать сертификаты сразу в ZIP архив вместо папки")
+    parser.add_argument("--zip-compression", choices=sorted(ZIP_COMPRESSION), default="stored",
+                        help="Сжатие записей архива (по умолчанию stored - без сжатия)")
+    parser.add_argument("--pdf", metavar="FILE",
+                        help="Сохранить все сертификаты в один PDF с векторным текстом вместо файлов изображений")
+    parser.add_argument("--compare-encoders", action="store_true",
+                        help="Сравнить время и размер всех пресетов на первом сертификате и выйти")
+    parser.add_argument("--make-plan", metavar="FILE",
+                        help="Только разметить все строки и сохранить план (JSON Lines, .gz - со сжатием)")
+    parser.add_argument("--from-plan", metavar="FILE",
+                        help="Рисовать по готовому плану разметки вместо файла с ФИО")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Разметить все строки и показать, какие не помещаются в область, ничего не рисуя")
+    parser.add_argument("--report", metavar="FILE",
+                        help="Сохранить JSON отчет о запуске: время этапов (шрифт, разметка, рисование, "
+                             "кодирование, запись)")
+    parser.add_argument("--log-level", default="WARNING",
+                        choices=("DEBUG", "INFO", "WARNING", "ERROR"), help="Уровень журнала в stderr")
+    parser.add_argument("--log-file", help="Писать журнал в файл вместо stderr")
+    parser.add_argument("--quiet", action="store_true", help="Не выводить прогресс")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.log_level != "WARNING" or args.log_file:
+        configure_logging(args.log_level, args.log_file)
+
+    plan = None
+    if args.from_plan:
+        # Настройки разметки берутся из плана
+        plan = LayoutPlan(args.from_plan)
+        settings = plan.settings
+        if not plan.font_matches():
+            # Разметка посчитана другим файлом шрифта: строки могут не совпасть с областью
+            print(f"Предупреждение: шрифт на этой машине отличается от шрифта плана "
+                  f"({plan.header.get('font_path') or 'встроенный'}); переносы и размеры взяты из плана",
+                  file=sys.stderr)
+    elif args.project:
+        settings = RenderSettings.load(args.project)
+    else:
+        print("Ошибка: укажите файл проекта или --from-plan", file=sys.stderr)
+        return 2
+    if plan is not None and (args.font_fit or args.min_font_size):
+        print("Ошибка: размер шрифта подбирается при создании плана, а не при отрисовке", file=sys.stderr)
+        return 2
+    if args.font_fit:
+        settings.font_fit = args.font_fit
+    if args.min_font_size:
+        settings.min_font_size = args.min_font_size
+    if args.preset:
+        for key, value in OUTPUT_PRESETS[args.preset].items():
+            setattr(settings, key, value)
+    for key in ("output_format", "compress_level", "quality"):
+        if getattr(args, key) is not None:
+            setattr(settings, key, getattr(args, key))
+    if args.shard and (args.pdf or args.make_plan or args.dry_run or args.compare_encoders):
+        print("Ошибка: --shard работает только при сохранении файлов изображений", file=sys.stderr)
+        return 2
+    template_path = args.template or settings.template_path
+    roster_path = args.roster or settings.excel_path
+    planning = args.make_plan or args.dry_run
+    if (not template_path and not planning) or (not roster_path and plan is None):
+        print("Ошибка: не указан шаблон сертификата или файл с ФИО", file=sys.stderr)
+        return 2
+
+    if plan is not None:
+        names = plan
+    else:
+        try:
+            # ФИО и колонки дополнительных полей читаются потоком по мере генерации
+            names = Roster(roster_path, extra_columns=field_columns(settings))
+        except RosterError as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            return 1
+        if settings.font_fit == "batch" and settings.text_mode != "point":
+            # Один размер для всего списка: проход по ФИО до генерации
+            settings = fit_settings(names, settings)
+            if not args.quiet:
+                print(f"Размер шрифта для всего списка: {settings.font_size}", file=sys.stderr)
+
+    if planning:
+        # Размер шаблона нужен только для проверки режима point, пиксели не декодируются
+        image_size = Image.open(template_path).size if template_path else None
+        if args.dry_run:
+            summary = dry_run(names, settings, image_size)
+        else:
+            summary = write_plan(args.make_plan, names, settings, image_size)
+            print(f"План сохранен: {args.make_plan}")
+        print(summary.describe())
+        return 0
+
+    if args.compare_encoders:
+        sample = next(iter(names), "Иванов Иван Иванович")
+        template = TemplateCache(template_path) if args.large_template else open_template(template_path)
+        try:
+            print(format_comparison(compare_sample_formats(template, settings, str(sample))))
+        finally:
+            if args.large_template:
+                template.close()
+        return 0
+
+    if args.large_template:
+        if settings.output_format != "png" and not args.pdf:
+            print("Ошибка: с --large-template сертификаты сохраняются только в PNG", file=sys.stderr)
+            return 2
+        template = TemplateCache(template_path)
+    else:
+        width, height = Image.open(template_path).size
+        if width * height >= LARGE_TEMPLATE_PIXELS and not args.quiet:
+            print(f"Шаблон {width}x{height}: для экономии памяти попробуйте --large-template", file=sys.stderr)
+        template = None
+
+    try:
+        return generate(args, names, settings, template_path, template)
+    finally:
+        if template is not None:
+            # Отображение кэша большого шаблона и его файл закрываются и при ошибке
+            template.close()
+
+
+def generate(args, names, settings, template_path, template=None):
+    """Генерирует PDF или файлы сертификатов; template - TemplateCache или None. Возвращает код выхода"""
+    total = names.estimate_total()
+
+    def on_progress(done, total):
+        if not args.quiet and (done == total or done % 100 == 0):
+            print(f"Обработано: {done}/{total or '?'}", file=sys.stderr)
+
+    if args.pdf:
+        try:
+            count = generate_pdf(template or open_template(template_path), names, settings, args.pdf,
+                                 progress=on_progress, total=total)
+        except PdfFontError as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            return 1
+        if not count:
+            print("Ошибка: не найдены данные в файле с ФИО", file=sys.stderr)
+            return 1
+        print(f"Сгенерировано {count} сертификатов в файле: {args.pdf}")
+        return 0
+
+    if args.zip:
+        sink = ZipSink(args.zip, args.zip_compression, settings.compress_level)
+    elif args.output:
+        os.makedirs(args.output, exist_ok=True)
+        sink = FolderSink(args.output)
+    else:
+        sink = FolderSink(create_output_folder())
+
+    # В папке ведется манифест: повторный запуск пропускает готовые сертификаты
+    manifest = None if args.zip else RenderManifest(sink.location, reset=args.force)
+    shard = ShardManifest(args.shard) if args.shard else None
+    timer = StageTimer()
+    try:
+        with sink:
+            if args.workers == 1:
+                count = generate_batch(template or open_template(template_path), names, settings, sink,
+                                       progress=on_progress, dirty_region=args.dirty_region,
+                                       total=total, manifest=manifest, timer=timer, shard=shard)
+            else:
+                count = generate_batch_parallel(template_path, names, settings, sink,
+                                                workers=args.workers, progress=on_progress,
+                                                shared_template=args.shared_template,
+                                                dirty_region=args.dirty_region, total=total,
+                                                manifest=manifest, timer=timer,
+                                                large_template=args.large_template, shard=shard)
+    finally:
+        if manifest is not None:
+            manifest.close()
+    if not (shard.rows if shard else count):
+        print("Ошибка: не найдены данные в файле с ФИО", file=sys.stderr)
+        return 1
+    where = "архиве" if args.zip else "папке"
+    print(f"Сгенерировано {count} сертификатов в {where}: {sink.location}")
+    if shard is not None:
+        print(f"Часть {shard.shard}: строк в списке {shard.rows}, манифест части {shard.shard.manifest_name()}")
+    if manifest is not None and manifest.skipped:
+        print(f"Нарисовано заново: {manifest.rendered}, уже готовых: {manifest.skipped}")
+    if not args.quiet:
+        print(f"Этапы: {timer.summary_text()}", file=sys.stderr)
+    if args.report:
+        timer.write_report(args.report, certificates=count, output=sink.location,
+                           workers=args.workers, output_format=settings.output_format,
+                           skipped=manifest.skipped if manifest else 0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,35 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageDraw, ImageFont, ImageTk
-import pandas as pd
 import os
-from pathlib import Path
 import threading
-import matplotlib.font_manager as fm
-from datetime import datetime
+import queue
 import json
+import math
+
+from certificate_renderer import (RenderSettings, RosterError, CertificateRenderer,
+                                  calculate_text_position, draw_border, load_font,
+                                  Roster, generate_batch, generate_batch_parallel,
+                                  create_output_folder, RenderManifest, FONT_FIT_MODES, fit_settings,
+                                  field_columns, compare_sample_formats)
+from font_resolver import default_resolver
+from output_formats import FORMATS, OUTPUT_PRESETS, format_comparison
+from output_sinks import ZIP_COMPRESSION, FolderSink, ZipSink
+from pdf_output import PdfFontError, generate_pdf
+from layout_plan import dry_run
+from large_template import LARGE_TEMPLATE_PIXELS, TemplateCache
+from preview_pyramid import ImagePyramid
+from run_control import RunCancelled, RunControl
+from run_stats import StageTimer, get_logger
+
+log = get_logger("gui")
+
+# Отчет о последнем запуске в папке с сертификатами
+RUN_REPORT_NAME = ".certgen_report.json"
+
+# Шаг масштаба предпросмотра (колесо мыши, кнопки +/-) и наибольший масштаб
+PREVIEW_ZOOM_STEP = 1.25
+PREVIEW_MAX_SCALE = 4.0
 
 class CertificateGenerator:
     def __init__(self, root):
@@ -24,6 +46,19 @@ class CertificateGenerator:
         self.original_image = None
         self.display_image = None
         self.image_scale = 1.0
+        # Шаблон, заранее уменьшенный до масштаба предпросмотра
+        self.preview_base = None
+        # Декодированный шаблон на диске в режиме большого шаблона
+        self.template_cache = None
+        # Пирамида уменьшенных копий шаблона для предпросмотра с масштабом
+        self.pyramid = None
+        # Масштаб "вписать в окно" и приближение относительно него (image_scale = fit_scale * zoom)
+        self.fit_scale = 1.0
+        self.zoom = 1.0
+        # Положение левого верхнего угла шаблона на canvas и видимой части в пикселях вида
+        self.view_origin = (0, 0)
+        self.preview_offset = (0, 0)
+        self.pan_start = None
         
         # Координаты для размещения ФИО (старый способ - одна точка)
         self.text_x = tk.IntVar(value=400)
@@ -60,12 +95,42 @@ class CertificateGenerator:
         self.font_color = tk.StringVar(value="#000000")
         self.selected_font = tk.StringVar(value="Arial")
         self.line_spacing = tk.IntVar(value=5)  # Межстрочный интервал
+        self.font_fit = tk.StringVar(value="fixed")  # Подбор размера под область
+        self.min_font_size = tk.IntVar(value=10)
+        
+        # Формат сохранения сертификатов
+        self.output_preset = tk.StringVar(value="default")
+        self.output_format = tk.StringVar(value="png")
+        self.compress_level = tk.IntVar(value=6)
+        self.output_quality = tk.IntVar(value=90)
+        
+        # Количество процессов для генерации (1 - в текущем процессе, 0 - все ядра)
+        self.worker_count = tk.IntVar(value=1)
+        # Общий для процессов шаблон в разделяемой памяти
+        self.shared_template = tk.BooleanVar(value=False)
+        # Перерисовка только области текста вместо полной копии шаблона
+        self.dirty_region = tk.BooleanVar(value=False)
+        # Большой шаблон: кэш декодированных пикселей на диске и запись PNG полосами
+        self.large_template = tk.BooleanVar(value=False)
+        # Запись сертификатов сразу в ZIP архив вместо папки
+        self.zip_output = tk.BooleanVar(value=False)
+        self.zip_compression = tk.StringVar(value="stored")
+        # Дополнять выбранную папку: рисуются только новые и измененные строки
+        self.resume_run = tk.BooleanVar(value=False)
+        
+        # Фоновая генерация: флаги паузы/отмены и очередь событий из потока
+        self.run_control = None
+        self.run_events = None
+        self.run_callbacks = None
         
         # Тестовый текст для предварительного просмотра
         self.preview_text = tk.StringVar(value="Иванов Иван Иванович")
         
-        # Список доступных шрифтов
+        # Список доступных шрифтов и пути к загруженным пользователем файлам шрифтов
         self.available_fonts = []
+        self.custom_fonts = []
+        # Дополнительные поля (дата, курс, номер...) задаются в файле проекта
+        self.text_fields = []
         self.load_system_fonts()
         
         # Переменные для отслеживания изменений
@@ -79,26 +144,53 @@ class CertificateGenerator:
         self.drag_type = None  # 'move', 'resize_tl', 'resize_tr', 'resize_bl', 'resize_br'
         self.original_area = None  # Сохраняет исходные координаты при начале перетаскивания
         
+        # Элементы canvas: изображение предпросмотра и рамки области (рисуются средствами Tk)
+        self.preview_item = None
+        self.guide_items = {}
+        self.drag_render_interval = 100  # миллисекунды между перерисовками текста при перетаскивании
+        
         self.setup_ui()
         
     def load_system_fonts(self):
-        """Загружает список доступных системных шрифтов"""
+        """Загружает список шрифтов из каталога на диске, проверка и сканирование - в фоне"""
+        resolver = default_resolver()
+        # Каталог с прошлого запуска принимаем сразу, без проверки папок
+        resolver.load_catalog(check_fresh=False)
+        self.available_fonts = self.with_popular_fonts(resolver.family_names())
+        
+        self._font_scan_result = None
+        threading.Thread(target=self.scan_fonts_in_background, daemon=True).start()
+        self.root.after(200, self.poll_font_scan)
+        
+    def with_popular_fonts(self, font_list):
+        """Добавляет популярные шрифты, если их нет в списке"""
+        fonts = sorted(set(font_list))
+        for font in ['Arial', 'Times New Roman', 'Calibri', 'Verdana', 'Tahoma', 'Georgia']:
+            if font not in fonts:
+                fonts.insert(0, font)
+        return fonts
+        
+    def scan_fonts_in_background(self):
+        """Фоновый поток: обновляет каталог шрифтов, если папки шрифтов изменились"""
         try:
-            # Получаем список шрифтов через matplotlib
-            font_list = [f.name for f in fm.fontManager.ttflist]
-            # Убираем дубликаты и сортируем
-            self.available_fonts = sorted(list(set(font_list)))
-            
-            # Добавляем популярные шрифты, если их нет в списке
-            popular_fonts = ['Arial', 'Times New Roman', 'Calibri', 'Verdana', 'Tahoma', 'Georgia']
-            for font in popular_fonts:
-                if font not in self.available_fonts:
-                    self.available_fonts.insert(0, font)
-                    
+            resolver = default_resolver()
+            resolver.refresh()
+            self._font_scan_result = resolver.family_names()
         except Exception as e:
-            print(f"Ошибка при загрузке шрифтов: {e}")
-            # Fallback к базовым шрифтам
-            self.available_fonts = ['Arial', 'Times New Roman', 'Calibri', 'Verdana', 'Tahoma']
+            log.warning("font scan failed: %s", e, exc_info=True)
+            self._font_scan_result = []
+            
+    def poll_font_scan(self):
+        """Переносит результат фонового сканирования шрифтов в combobox"""
+        if self._font_scan_result is None:
+            self.root.after(200, self.poll_font_scan)
+            return
+        custom_names = [os.path.splitext(os.path.basename(path))[0] for path in self.custom_fonts]
+        fonts = self.with_popular_fonts(self._font_scan_result + custom_names)
+        if fonts != self.available_fonts:
+            self.available_fonts = fonts
+            if hasattr(self, 'font_combo'):
+                self.font_combo['values'] = self.available_fonts
         
     def setup_ui(self):
         # Главный фрейм с разделением на левую и правую части
@@ -197,6 +289,8 @@ class CertificateGenerator:
         self.output_label.pack(side=tk.LEFT)
         ttk.Button(output_frame, text="Выбрать вручную", 
                   command=self.select_output_folder).pack(side=tk.RIGHT)
+        ttk.Checkbutton(files_frame, text="Дополнять выбранную папку (пропускать готовые)",
+                       variable=self.resume_run).pack(anchor=tk.W, pady=2)
         
         # Секция настроек текста
         settings_frame = ttk.LabelFrame(scrollable_frame, text="Настройки текста", padding="10")
@@ -361,6 +455,7 @@ class CertificateGenerator:
         font_combo = ttk.Combobox(font_name_frame, textvariable=self.selected_font, 
                                  values=self.available_fonts, width=20, state="readonly")
         font_combo.pack(side=tk.LEFT, padx=(5, 10))
+        self.font_combo = font_combo
         
         ttk.Button(font_name_frame, text="Загрузить файл", 
                   command=self.load_custom_font).pack(side=tk.RIGHT)
@@ -375,6 +470,19 @@ class CertificateGenerator:
         font_scale.pack(side=tk.LEFT, padx=(5, 10), fill=tk.X, expand=True)
         ttk.Label(font_frame, textvariable=self.font_size, width=4).pack(side=tk.RIGHT, padx=(0, 25))
         
+        # Подбор размера шрифта под область: для каждого ФИО или один на весь список
+        fit_frame = ttk.Frame(settings_frame)
+        fit_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(fit_frame, text="Подбор размера:").pack(side=tk.LEFT)
+        ttk.Combobox(fit_frame, textvariable=self.font_fit, values=FONT_FIT_MODES,
+                     width=8, state="readonly").pack(side=tk.LEFT, padx=(5, 10))
+        ttk.Label(fit_frame, text="Мин.:").pack(side=tk.LEFT)
+        min_font_scale = ttk.Scale(fit_frame, from_=6, to=200, orient=tk.HORIZONTAL,
+                                   length=100, variable=self.min_font_size, command=self.schedule_update)
+        min_font_scale.pack(side=tk.LEFT, padx=(5, 10), fill=tk.X, expand=True)
+        ttk.Label(fit_frame, textvariable=self.min_font_size, width=4).pack(side=tk.RIGHT, padx=(0, 25))
+        
         # Цвет шрифта
         color_frame = ttk.Frame(settings_frame)
         color_frame.pack(fill=tk.X, pady=5)
@@ -406,6 +514,8 @@ class CertificateGenerator:
         self.font_size.trace('w', self.schedule_update)
         self.font_color.trace('w', self.schedule_update)
         self.line_spacing.trace('w', self.schedule_update)
+        self.font_fit.trace('w', self.schedule_update)
+        self.min_font_size.trace('w', self.schedule_update)
         self.text_padding_left.trace('w', self.schedule_update)
         self.text_padding_right.trace('w', self.schedule_update)
         self.text_padding_top.trace('w', self.schedule_update)
@@ -458,26 +568,99 @@ class CertificateGenerator:
         ttk.Button(buttons_frame, text="Загрузить настройки", 
                   command=self.load_settings).pack(side=tk.LEFT)
         
+        # Секция формата сохранения
+        format_frame = ttk.LabelFrame(scrollable_frame, text="Формат сохранения", padding="10")
+        format_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        preset_row = ttk.Frame(format_frame)
+        preset_row.pack(fill=tk.X, pady=2)
+        ttk.Label(preset_row, text="Пресет:").pack(side=tk.LEFT)
+        preset_combo = ttk.Combobox(preset_row, textvariable=self.output_preset,
+                                   values=list(OUTPUT_PRESETS), state="readonly", width=10)
+        preset_combo.pack(side=tk.LEFT, padx=(5, 15))
+        preset_combo.bind("<<ComboboxSelected>>", self.on_output_preset_change)
+        ttk.Label(preset_row, text="Формат:").pack(side=tk.LEFT)
+        ttk.Combobox(preset_row, textvariable=self.output_format, values=list(FORMATS),
+                    state="readonly", width=6).pack(side=tk.LEFT, padx=(5, 0))
+        
+        options_row = ttk.Frame(format_frame)
+        options_row.pack(fill=tk.X, pady=2)
+        ttk.Label(options_row, text="Сжатие PNG (0-9):").pack(side=tk.LEFT)
+        ttk.Spinbox(options_row, from_=0, to=9, width=4,
+                   textvariable=self.compress_level).pack(side=tk.LEFT, padx=(5, 15))
+        ttk.Label(options_row, text="Качество JPEG/WebP:").pack(side=tk.LEFT)
+        ttk.Spinbox(options_row, from_=1, to=100, width=5,
+                   textvariable=self.output_quality).pack(side=tk.LEFT, padx=(5, 0))
+        
+        ttk.Button(format_frame, text="Сравнить форматы",
+                  command=self.compare_output_formats).pack(anchor=tk.W, pady=(5, 0))
+        
         # Секция генерации
         generate_frame = ttk.Frame(scrollable_frame)
         generate_frame.pack(fill=tk.X, pady=10)
         
+        workers_frame = ttk.Frame(generate_frame)
+        workers_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(workers_frame, text="Процессов (0 - все ядра):").pack(side=tk.LEFT)
+        ttk.Spinbox(workers_frame, from_=0, to=64, width=5,
+                   textvariable=self.worker_count).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Checkbutton(workers_frame, text="Шаблон в общей памяти",
+                       variable=self.shared_template).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Checkbutton(generate_frame, text="Перерисовывать только область текста",
+                       variable=self.dirty_region).pack(anchor=tk.W, pady=(0, 5))
+        ttk.Checkbutton(generate_frame, text="Большой шаблон (кэш на диске, только PNG)",
+                       variable=self.large_template,
+                       command=self.on_large_template_toggle).pack(anchor=tk.W, pady=(0, 5))
+        zip_frame = ttk.Frame(generate_frame)
+        zip_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Checkbutton(zip_frame, text="Сохранять в ZIP архив",
+                       variable=self.zip_output).pack(side=tk.LEFT)
+        ttk.Label(zip_frame, text="Сжатие:").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Combobox(zip_frame, textvariable=self.zip_compression, values=sorted(ZIP_COMPRESSION),
+                    state="readonly", width=9).pack(side=tk.LEFT, padx=(5, 0))
+        
         self.generate_button = ttk.Button(generate_frame, text="Генерировать сертификаты", 
                                          command=self.generate_certificates)
         self.generate_button.pack(fill=tk.X)
+        self.pdf_button = ttk.Button(generate_frame, text="Генерировать в один PDF",
+                                    command=self.generate_pdf)
+        self.pdf_button.pack(fill=tk.X, pady=(5, 0))
+        self.check_button = ttk.Button(generate_frame, text="Проверить, помещаются ли ФИО",
+                                      command=self.check_layout)
+        self.check_button.pack(fill=tk.X, pady=(5, 0))
+        
+        # Управление фоновой генерацией
+        run_frame = ttk.Frame(generate_frame)
+        run_frame.pack(fill=tk.X, pady=(5, 0))
+        self.pause_button = ttk.Button(run_frame, text="Пауза", command=self.toggle_pause,
+                                      state=tk.DISABLED)
+        self.pause_button.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = ttk.Button(run_frame, text="Отмена", command=self.cancel_run,
+                                       state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
         
         # Прогресс бар
         self.progress = ttk.Progressbar(scrollable_frame, mode='determinate')
         self.progress.pack(fill=tk.X, pady=5)
         
         # Статус
-        self.status_label = ttk.Label(scrollable_frame, text="Готов к работе")
+        self.status_label = ttk.Label(scrollable_frame, text="Готов к работе", wraplength=300)
         self.status_label.pack(pady=5)
         
         # Создаем правую панель с предварительным просмотром
         preview_frame = ttk.LabelFrame(right_frame, text="Предварительный просмотр", padding="10")
         preview_frame.pack(fill=tk.BOTH, expand=True)
         
+        # Масштаб предпросмотра
+        zoom_frame = ttk.Frame(preview_frame)
+        zoom_frame.pack(fill=tk.X, padx=5)
+        ttk.Button(zoom_frame, text="−", width=3, command=self.zoom_out).pack(side=tk.LEFT)
+        ttk.Button(zoom_frame, text="+", width=3, command=self.zoom_in).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(zoom_frame, text="Вписать", command=self.zoom_fit).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(zoom_frame, text="1:1", width=4, command=self.zoom_actual).pack(side=tk.LEFT, padx=(5, 0))
+        self.zoom_label = ttk.Label(zoom_frame, text="")
+        self.zoom_label.pack(side=tk.LEFT, padx=(10, 0))
+        
         # Canvas для отображения изображения с границей
         self.canvas = tk.Canvas(preview_frame, bg="white", cursor="crosshair", 
                                relief=tk.SUNKEN, bd=2)
@@ -488,10 +671,18 @@ class CertificateGenerator:
         self.canvas.bind("<B1-Motion>", self.on_canvas_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_canvas_release)
         self.canvas.bind("<Motion>", self.on_canvas_motion)
+        # Колесо мыши - масштаб (Button-4/5 в Linux), правая или средняя кнопка - перемещение вида
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, self.on_preview_wheel)
+        for button in (2, 3):
+            self.canvas.bind(f"<ButtonPress-{button}>", self.on_pan_start)
+            self.canvas.bind(f"<B{button}-Motion>", self.on_pan_drag)
+            self.canvas.bind(f"<ButtonRelease-{button}>", self.on_pan_end)
         
         # Инструкция
         instruction_label = ttk.Label(preview_frame, 
-                                    text="Выберите инструмент: move (перемещение) или resize (изменение размера)",
+                                    text="Выберите инструмент: move (перемещение) или resize (изменение размера). "
+                                         "Колесо мыши - масштаб, правая кнопка - перемещение",
                                     font=("Arial", 10, "italic"))
         instruction_label.pack(pady=5)
         
@@ -518,14 +709,39 @@ class CertificateGenerator:
     def load_template_image(self):
         """Загружает изображение шаблона и отображает его в canvas"""
         try:
-            self.original_image = Image.open(self.template_path)
+            self.pyramid = None
+            if self.template_cache is not None:
+                # Отображение прошлого большого шаблона больше не нужно
+                self.template_cache.close()
+                self.template_cache = None
+            if self.large_template.get():
+                # Шаблон декодируется один раз в кэш на диске и отображается в память
+                self.status_label.config(text="Подготовка большого шаблона...")
+                self.root.update_idletasks()
+                self.template_cache = TemplateCache(self.template_path)
+                self.original_image = self.template_cache.image
+                self.status_label.config(text="Готов к работе")
+            else:
+                self.template_cache = None
+                self.original_image = Image.open(self.template_path)
+                width, height = self.original_image.size
+                if width * height >= LARGE_TEMPLATE_PIXELS:
+                    self.status_label.config(text=f"Шаблон {width}x{height}: для экономии памяти "
+                                                  "включите \"Большой шаблон\"")
+            # Уровни пирамиды считаются один раз; масштабирование берет из них только видимые плитки
+            self.pyramid = ImagePyramid(self.original_image)
             self.display_image_in_canvas()
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {str(e)}")
+    
+    def on_large_template_toggle(self):
+        """Переоткрывает загруженный шаблон в выбранном режиме"""
+        if self.template_path and os.path.exists(self.template_path):
+            self.load_template_image()
             
     def display_image_in_canvas(self):
-        """Отображает изображение в canvas с масштабированием"""
-        if not self.original_image:
+        """Отображает изображение в canvas, вписанным в окно"""
+        if not self.original_image or self.pyramid is None:
             return
         
         # Принудительно обновляем размеры canvas
@@ -544,23 +760,130 @@ class CertificateGenerator:
         img_width, img_height = self.original_image.size
         scale_x = canvas_width / img_width
         scale_y = canvas_height / img_height
-        self.image_scale = min(scale_x, scale_y, 1.0)  # Не увеличиваем изображение
+        self.fit_scale = min(scale_x, scale_y, 1.0)  # Не увеличиваем изображение
+        self.zoom = 1.0
+        self.image_scale = self.fit_scale
+        self.view_origin = self.clamp_view_origin(0, 0)
         
-        # Масштабируем изображение
-        new_width = int(img_width * self.image_scale)
-        new_height = int(img_height * self.image_scale)
-        resized_image = self.original_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        # Очищаем canvas, изображение создается заново в show_view
+        self.canvas.delete("all")
+        self.guide_items = {}
+        self.preview_item = None
+        self.show_view()
         
-        # Конвертируем в PhotoImage для tkinter
-        self.display_image = ImageTk.PhotoImage(resized_image)
+    def show_view(self):
+        """Собирает видимую часть шаблона в текущем масштабе из плиток пирамиды"""
+        if self.pyramid is None:
+            return
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        view_width, view_height = self.pyramid.scaled_size(self.image_scale)
+        origin_x, origin_y = self.view_origin
         
-        # Очищаем canvas и отображаем изображение
-        self.canvas.delete("all")
-        self.canvas.create_image(canvas_width//2, canvas_height//2, image=self.display_image, anchor=tk.CENTER)
+        # Видимая часть в пикселях вида (весь шаблон в текущем масштабе)
+        box = (max(0, -origin_x), max(0, -origin_y),
+               min(view_width, canvas_width - origin_x), min(view_height, canvas_height - origin_y))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return
+        
+        # Кэшируем видимую часть шаблона: предпросмотр рисуется прямо в разрешении экрана
+        self.preview_offset = box[:2]
+        self.preview_base = self.pyramid.view(self.image_scale, box)
+        self.display_image = ImageTk.PhotoImage(self.preview_base)
+        position = (origin_x + box[0], origin_y + box[1])
+        if self.preview_item is None:
+            self.preview_item = self.canvas.create_image(*position, image=self.display_image, anchor=tk.NW)
+        else:
+            self.canvas.coords(self.preview_item, *position)
+            self.canvas.itemconfigure(self.preview_item, image=self.display_image)
+        self.zoom_label.config(text=f"{self.image_scale:.0%}")
         
         # Обновляем предварительный просмотр
         self.update_preview()
         
+    def clamp_view_origin(self, origin_x, origin_y):
+        """Центрирует шаблон, если он меньше canvas, иначе не дает увести его край внутрь"""
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        view_width, view_height = self.pyramid.scaled_size(self.image_scale)
+        
+        def clamp(origin, view_size, canvas_size):
+            if view_size <= canvas_size:
+                return (canvas_size - view_size) // 2
+            return min(0, max(canvas_size - view_size, round(origin)))
+        
+        return clamp(origin_x, view_width, canvas_width), clamp(origin_y, view_height, canvas_height)
+        
+    def set_zoom(self, zoom, canvas_x=None, canvas_y=None):
+        """Меняет масштаб; точка шаблона под (canvas_x, canvas_y) остается на месте"""
+        if self.pyramid is None:
+            return
+        if canvas_x is None:
+            canvas_x, canvas_y = self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2
+        zoom = min(max(zoom, 1.0), max(1.0, PREVIEW_MAX_SCALE / self.fit_scale))
+        if zoom == self.zoom:
+            return
+        image_x = (canvas_x - self.view_origin[0]) / self.image_scale
+        image_y = (canvas_y - self.view_origin[1]) / self.image_scale
+        self.zoom = zoom
+        self.image_scale = self.fit_scale * zoom
+        self.view_origin = self.clamp_view_origin(canvas_x - image_x * self.image_scale,
+                                                  canvas_y - image_y * self.image_scale)
+        self.show_view()
+        
+    def zoom_in(self):
+        self.set_zoom(self.zoom * PREVIEW_ZOOM_STEP)
+        
+    def zoom_out(self):
+        self.set_zoom(self.zoom / PREVIEW_ZOOM_STEP)
+        
+    def zoom_fit(self):
+        self.set_zoom(1.0)
+        
+    def zoom_actual(self):
+        """Масштаб 1:1 - пиксель шаблона на пиксель экрана"""
+        self.set_zoom(1.0 / self.fit_scale)
+        
+    def on_preview_wheel(self, event):
+        """Колесо мыши над предпросмотром: масштаб относительно курсора"""
+        zoom_in = event.num == 4 or event.delta > 0
+        self.set_zoom(self.zoom * (PREVIEW_ZOOM_STEP if zoom_in else 1 / PREVIEW_ZOOM_STEP), event.x, event.y)
+        # Колесо не должно прокручивать панель настроек (она слушает bind_all)
+        return "break"
+        
+    def on_pan_start(self, event):
+        if self.pyramid is None:
+            return
+        self.pan_start = (event.x, event.y) + self.view_origin
+        self.canvas.config(cursor="fleur")
+        
+    def on_pan_drag(self, event):
+        """Перемещение вида: изображение и рамки сдвигаются сразу, новые плитки - с троттлингом"""
+        if self.pan_start is None:
+            return
+        start_x, start_y, origin_x, origin_y = self.pan_start
+        origin = self.clamp_view_origin(origin_x + event.x - start_x, origin_y + event.y - start_y)
+        if origin == self.view_origin:
+            return
+        self.canvas.move(self.preview_item, origin[0] - self.view_origin[0], origin[1] - self.view_origin[1])
+        self.view_origin = origin
+        self.update_guides()
+        if not getattr(self, '_view_job', None):
+            self._view_job = self.root.after(self.drag_render_interval, self.run_scheduled_view)
+            
+    def on_pan_end(self, event):
+        if self.pan_start is None:
+            return
+        self.pan_start = None
+        self.canvas.config(cursor="crosshair")
+        if getattr(self, '_view_job', None):
+            self.root.after_cancel(self._view_job)
+        self.run_scheduled_view()
+        
+    def run_scheduled_view(self):
+        self._view_job = None
+        self.show_view()
+        
     def on_canvas_click(self, event):
         """Обработчик клика по canvas для установки координат"""
         if not self.original_image:
@@ -603,18 +926,9 @@ class CertificateGenerator:
         if not self.original_image:
             return
             
-        # Получаем размеры canvas и изображения
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
-        img_width, img_height = self.original_image.size
-        
-        # Вычисляем позицию мыши относительно изображения
-        mouse_x = event.x - (canvas_width - img_width * self.image_scale) // 2
-        mouse_y = event.y - (canvas_height - img_height * self.image_scale) // 2
-        
         # Конвертируем в координаты оригинального изображения
-        original_x = int(mouse_x / self.image_scale)
-        original_y = int(mouse_y / self.image_scale)
+        img_width, img_height = self.original_image.size
+        original_x, original_y = self.canvas_to_image_coords(event.x, event.y)
         
         # Обновляем статус с координатами
         if 0 <= original_x < img_width and 0 <= original_y < img_height:
@@ -664,116 +978,150 @@ class CertificateGenerator:
             self.text_area_x2.set(x2 + dx)
             self.text_area_y2.set(y2 + dy)
         
-        # Мгновенное обновление предварительного просмотра без задержки
-        self.update_preview()
+        # Рамки двигаются сразу средствами canvas, текст перерисовывается не чаще drag_render_interval
+        self.update_guides()
     
     def on_canvas_release(self, event):
         """Обработчик отпускания мыши"""
+        was_dragging = self.dragging
         self.dragging = False
         self.drag_type = None
         self.original_area = None
+        if was_dragging:
+            # Окончательная перерисовка текста в новой области
+            self.cancel_scheduled_update()
+            self.update_preview()
+            
+    def cancel_scheduled_update(self):
+        if getattr(self, '_update_job', None):
+            self.root.after_cancel(self._update_job)
+            self._update_job = None
             
     def schedule_update(self, *args):
         """Планирует обновление предварительного просмотра с задержкой"""
-        current_time = self.root.after_idle(lambda: None)
-        if hasattr(self, '_update_job'):
-            self.root.after_cancel(self._update_job)
+        if self.dragging:
+            # При перетаскивании не откладываем уже запланированную перерисовку (троттлинг)
+            if not getattr(self, '_update_job', None):
+                self._update_job = self.root.after(self.drag_render_interval, self.run_scheduled_update)
+            return
+        self.cancel_scheduled_update()
         # Уменьшаем задержку для более отзывчивого интерфейса
-        self._update_job = self.root.after(50, self.update_preview)
+        self._update_job = self.root.after(50, self.run_scheduled_update)
+        
+    def run_scheduled_update(self):
+        self._update_job = None
+        self.update_preview()
+        
+    def image_to_canvas_coords(self, x, y):
+        """Конвертирует координаты изображения в координаты canvas с учетом масштаба и сдвига вида"""
+        origin_x, origin_y = self.view_origin
+        return x * self.image_scale + origin_x, y * self.image_scale + origin_y
+        
+    def set_guide(self, key, coords, **options):
+        """Создает или перемещает прямоугольник-элемент canvas с тегом guide"""
+        item = self.guide_items.get(key)
+        if item is None:
+            self.guide_items[key] = self.canvas.create_rectangle(*coords, tags=("guide",), **options)
+        else:
+            self.canvas.coords(item, *coords)
+            self.canvas.itemconfigure(item, state=tk.NORMAL, **options)
+            
+    def hide_guide(self, key):
+        item = self.guide_items.get(key)
+        if item is not None:
+            self.canvas.itemconfigure(item, state=tk.HIDDEN)
+        
+    def update_guides(self):
+        """Обновляет рамку области, рамку отступов и маркеры как элементы canvas"""
+        if not self.original_image or self.preview_item is None:
+            return
+        if self.text_mode.get() != "area":
+            for key in list(self.guide_items):
+                self.hide_guide(key)
+            return
+            
+        x1, y1 = self.image_to_canvas_coords(self.text_area_x1.get(), self.text_area_y1.get())
+        x2, y2 = self.image_to_canvas_coords(self.text_area_x2.get(), self.text_area_y2.get())
+        
+        # Цвет рамки зависит от инструмента
+        if self.tool_mode.get() == "move":
+            outline_color = "#00AA00"  # Зеленый для перемещения
+        else:
+            outline_color = "#FF0000"  # Красный для изменения размера
+        
+        # Внешняя рамка области
+        self.set_guide("area", (x1, y1, x2, y2), outline=outline_color, width=2)
+        
+        # Внутренняя рамка отступов (синяя)
+        scale = self.image_scale
+        text_x1 = x1 + self.text_padding_left.get() * scale
+        text_y1 = y1 + self.text_padding_top.get() * scale
+        text_x2 = x2 - self.text_padding_right.get() * scale
+        text_y2 = y2 - self.text_padding_bottom.get() * scale
+        if text_x1 < text_x2 and text_y1 < text_y2:  # Проверяем что отступы не превышают размер области
+            self.set_guide("padding", (text_x1, text_y1, text_x2, text_y2), outline="#0066CC", width=1)
+        else:
+            self.hide_guide("padding")
+        
+        # Маркеры только для инструмента "resize"
+        handle_size = 4
+        corners = {"tl": (x1, y1), "tr": (x2, y1), "bl": (x1, y2), "br": (x2, y2)}
+        for key, (cx, cy) in corners.items():
+            if self.tool_mode.get() == "resize":
+                self.set_guide("handle_" + key,
+                               (cx-handle_size, cy-handle_size, cx+handle_size, cy+handle_size),
+                               fill="#FF0000", outline="#FFFFFF", width=1)
+            else:
+                self.hide_guide("handle_" + key)
         
     def update_preview(self):
         """Обновляет предварительный просмотр текста на изображении"""
-        if not self.original_image or not self.display_image:
+        if not self.original_image or not self.display_image or self.preview_base is None:
             return
             
         try:
-            # Создаем копию изображения для предварительного просмотра
-            preview_img = self.original_image.copy()
-            draw = ImageDraw.Draw(preview_img)
+            # Настройки и шрифт в масштабе предпросмотра, координаты - от угла видимой части
+            scale = self.image_scale
+            settings = self.render_settings().scaled(scale, self.preview_offset)
+            font = self.get_font(settings.font_size)
             
-            # Получаем шрифт
-            font = self.get_font(self.font_size.get())
+            # Копия уменьшенного шаблона: текст рисуется в разрешении экрана,
+            # постоянные поля уже нарисованы в основе отрисовщика
+            renderer = CertificateRenderer(self.preview_base, settings, font)
+            preview_img = renderer.working_copy()
+            draw = ImageDraw.Draw(preview_img)
             
-            # Добавляем границу вокруг сертификата
-            img_width, img_height = preview_img.size
-            border_width = 3
-            draw.rectangle([0, 0, img_width-1, img_height-1], outline="#CCCCCC", width=border_width)
+            # Добавляем границу вокруг сертификата (видна, только если край шаблона в окне)
+            draw_border(draw, self.pyramid.scaled_size(scale), self.preview_offset)
             
             # Добавляем текст
             text = self.preview_text.get()
             if text:
                 if self.text_mode.get() == "point":
                     # Старый способ - одна точка
-                    x, y = self.calculate_text_position(text, font, self.text_alignment.get())
-                    print(f"Добавляем текст: '{text}' в позицию ({x}, {y}) с выравниванием {self.text_alignment.get()}")
-                    draw.text((x, y), text, fill=self.font_color.get(), font=font)
+                    log.debug("preview point text=%r position=%s", text, calculate_text_position(settings))
                 else:
                     # Новый способ - область с переносом строк
-                    x, y, max_width = self.calculate_text_position(text, font, self.text_alignment.get())
-                    print(f"Добавляем многострочный текст: '{text}' в позицию ({x}, {y}) с выравниванием {self.text_alignment.get()}, ширина области: {max_width}")
-                    self.draw_multiline_text(draw, text, font, x, y, self.text_alignment.get(), 
-                                           max_width, self.line_spacing.get())
-                
-                # Если режим "область", рисуем рамку области и маркеры
-                if self.text_mode.get() == "area":
-                    x1, y1 = self.text_area_x1.get(), self.text_area_y1.get()
-                    x2, y2 = self.text_area_x2.get(), self.text_area_y2.get()
-                    
-                    # Цвет рамки зависит от инструмента
-                    if self.tool_mode.get() == "move":
-                        outline_color = "#00AA00"  # Зеленый для перемещения
-                    else:
-                        outline_color = "#FF0000"  # Красный для изменения размера
-                    
-                    # Рисуем внешнюю рамку области
-                    draw.rectangle([x1, y1, x2, y2], outline=outline_color, width=2)
-                    
-                    # Рисуем внутреннюю рамку отступов (синяя)
-                    text_x1 = x1 + self.text_padding_left.get()
-                    text_y1 = y1 + self.text_padding_top.get()
-                    text_x2 = x2 - self.text_padding_right.get()
-                    text_y2 = y2 - self.text_padding_bottom.get()
-                    
-                    if text_x1 < text_x2 and text_y1 < text_y2:  # Проверяем что отступы не превышают размер области
-                        draw.rectangle([text_x1, text_y1, text_x2, text_y2], outline="#0066CC", width=1)
-                    
-                    # Рисуем маркеры только для инструмента "resize"
-                    if self.tool_mode.get() == "resize":
-                        handle_size = 4
-                        handle_color = "#FF0000"
-                        # Верхний левый угол
-                        draw.rectangle([x1-handle_size, y1-handle_size, x1+handle_size, y1+handle_size], 
-                                     fill=handle_color, outline="#FFFFFF", width=1)
-                        # Верхний правый угол
-                        draw.rectangle([x2-handle_size, y1-handle_size, x2+handle_size, y1+handle_size], 
-                                     fill=handle_color, outline="#FFFFFF", width=1)
-                        # Нижний левый угол
-                        draw.rectangle([x1-handle_size, y2-handle_size, x1+handle_size, y2+handle_size], 
-                                     fill=handle_color, outline="#FFFFFF", width=1)
-                        # Нижний правый угол
-                        draw.rectangle([x2-handle_size, y2-handle_size, x2+handle_size, y2+handle_size], 
-                                     fill=handle_color, outline="#FFFFFF", width=1)
+                    log.debug("preview area text=%r position=%s alignment=%s", text,
+                              calculate_text_position(settings), self.text_alignment.get())
+                renderer.draw_text(draw, text)
             
-            # Масштабируем для отображения
-            img_width, img_height = preview_img.size
-            new_width = int(img_width * self.image_scale)
-            new_height = int(img_height * self.image_scale)
-            resized_preview = preview_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            # Поля из колонок списка показываются названиями колонок
+            renderer.draw_fields(draw, {column: column for column in field_columns(settings)})
             
             # Конвертируем в PhotoImage
-            preview_photo = ImageTk.PhotoImage(resized_preview)
+            preview_photo = ImageTk.PhotoImage(preview_img)
             
-            # Обновляем canvas
-            self.canvas.delete("all")
-            canvas_width = self.canvas.winfo_width()
-            canvas_height = self.canvas.winfo_height()
-            self.canvas.create_image(canvas_width//2, canvas_height//2, image=preview_photo, anchor=tk.CENTER)
+            # Обновляем изображение на canvas, рамки области остаются отдельными элементами
+            self.canvas.itemconfigure(self.preview_item, image=preview_photo)
+            self.canvas.tag_raise("guide")
             
             # Сохраняем ссылку на изображение, чтобы оно не было удалено сборщиком мусора
             self.display_image = preview_photo
+            self.update_guides()
             
         except Exception as e:
-            print(f"Ошибка при обновлении предварительного просмотра: {e}")
+            log.warning("preview update failed: %s", e, exc_info=True)
             
     def select_excel(self):
         file_path = filedialog.askopenfilename(
@@ -798,9 +1146,11 @@ class CertificateGenerator:
         )
         if file_path:
             try:
-                # Пробуем загрузить шрифт
-                font = ImageFont.truetype(file_path, 20)
-                font_name = os.path.splitext(os.path.basename(file_path))[0]
+                # Пробуем загрузить шрифт и добавляем его в индекс шрифтов
+                ImageFont.truetype(file_path, 20)
+                font_name = default_resolver().register_font(file_path)
+                if file_path not in self.custom_fonts:
+                    self.custom_fonts.append(file_path)
                 
                 # Добавляем в список доступных шрифтов
                 if font_name not in self.available_fonts:
@@ -832,70 +1182,23 @@ class CertificateGenerator:
             
     def get_font(self, size):
         """Получает шрифт с указанным размером"""
-        font_name = self.selected_font.get()
-        
-        # Список возможных путей к шрифтам
-        font_paths = [
-            # Популярные шрифты Windows
-            f"C:/Windows/Fonts/{font_name}.ttf",
-            f"C:/Windows/Fonts/{font_name}.otf",
-            f"C:/Windows/Fonts/{font_name}.ttc",
-            # Популярные шрифты с разными регистрами
-            f"C:/Windows/Fonts/{font_name.lower()}.ttf",
-            f"C:/Windows/Fonts/{font_name.upper()}.ttf",
-            f"C:/Windows/Fonts/{font_name.title()}.ttf",
-            # Альтернативные названия
-            f"C:/Windows/Fonts/arial.ttf",
-            f"C:/Windows/Fonts/Arial.ttf",
-            f"C:/Windows/Fonts/calibri.ttf",
-            f"C:/Windows/Fonts/Calibri.ttf",
-            f"C:/Windows/Fonts/times.ttf",
-            f"C:/Windows/Fonts/Times.ttf",
-        ]
-        
-        # Пробуем загрузить шрифт по разным путям
-        for font_path in font_paths:
-            try:
-                if os.path.exists(font_path):
-                    print(f"Загружаем шрифт: {font_path}")
-                    return ImageFont.truetype(font_path, size)
-            except Exception as e:
-                print(f"Ошибка загрузки шрифта {font_path}: {e}")
-                continue
-        
-        # Если не нашли файл шрифта, пробуем загрузить по имени
-        try:
-            print(f"Пробуем загрузить шрифт по имени: {font_name}")
-            return ImageFont.truetype(font_name, size)
-        except Exception as e:
-            print(f"Ошибка загрузки шрифта по имени {font_name}: {e}")
-            pass
-        
-        # Fallback к системному шрифту по умолчанию
-        try:
-            print("Используем fallback шрифт: arial")
-            return ImageFont.truetype("arial", size)
-        except Exception as e:
-            print(f"Ошибка загрузки fallback шрифта: {e}")
-            print("Используем шрифт по умолчанию")
-            return ImageFont.load_default()
+        return load_font(self.selected_font.get(), size)
     
-    def save_settings(self):
-        """Сохраняет все настройки в JSON файл"""
-        try:
-            settings = {
-                "template_path": self.template_path,
-                "excel_path": self.excel_path,
-                "output_folder": self.output_folder,
-                "text_mode": self.text_mode.get(),
-                "tool_mode": self.tool_mode.get(),
-                "text_alignment": self.text_alignment.get(),
-                "text_x": self.text_x.get(),
-                "text_y": self.text_y.get(),
-                "text_area_x1": self.text_area_x1.get(),
-                "text_area_y1": self.text_area_y1.get(),
-                "text_area_x2": self.text_area_x2.get(),
-                "text_area_y2": self.text_area_y2.get(),
+    def collect_settings(self):
+        """Собирает текущие настройки проекта в словарь (формат JSON проекта)"""
+        return {
+            "template_path": self.template_path,
+            "excel_path": self.excel_path,
+            "output_folder": self.output_folder,
+            "text_mode": self.text_mode.get(),
+            "tool_mode": self.tool_mode.get(),
+            "text_alignment": self.text_alignment.get(),
+            "text_x": self.text_x.get(),
+            "text_y": self.text_y.get(),
+            "text_area_x1": self.text_area_x1.get(),
+            "text_area_y1": self.text_area_y1.get(),
+            "text_area_x2": self.text_area_x2.get(),
+            "text_area_y2": self.text_area_y2.get(),
             "text_padding_left": self.text_padding_left.get(),
             "text_padding_right": self.text_padding_right.get(),
             "text_padding_top": self.text_padding_top.get(),
@@ -904,12 +1207,35 @@ class CertificateGenerator:
             "window_height": self.window_height.get(),
             "left_panel_width": self.left_panel_width.get(),
             "font_size": self.font_size.get(),
-                "font_color": self.font_color.get(),
-                "selected_font": self.selected_font.get(),
-                "line_spacing": self.line_spacing.get(),
-                "preview_text": self.preview_text.get(),
-                "available_fonts": self.available_fonts
-            }
+            "font_color": self.font_color.get(),
+            "selected_font": self.selected_font.get(),
+            "line_spacing": self.line_spacing.get(),
+            "font_fit": self.font_fit.get(),
+            "min_font_size": self.min_font_size.get(),
+            "preview_text": self.preview_text.get(),
+            "custom_fonts": self.custom_fonts,
+            "text_fields": self.text_fields,
+            "output_format": self.output_format.get(),
+            "compress_level": self.compress_level.get(),
+            "quality": self.output_quality.get(),
+            "workers": self.worker_count.get(),
+            "shared_template": self.shared_template.get(),
+            "dirty_region": self.dirty_region.get(),
+            "large_template": self.large_template.get(),
+            "zip_output": self.zip_output.get(),
+            "zip_compression": self.zip_compression.get(),
+            "resume_run": self.resume_run.get(),
+            "available_fonts": self.available_fonts
+        }
+    
+    def render_settings(self):
+        """Возвращает снимок настроек отрисовки, не зависящий от Tk"""
+        return RenderSettings.from_dict(self.collect_settings())
+    
+    def save_settings(self):
+        """Сохраняет все настройки в JSON файл"""
+        try:
+            settings = self.collect_settings()
             
             file_path = filedialog.asksaveasfilename(
                 title="Сохранить настройки проекта",
@@ -963,11 +1289,27 @@ class CertificateGenerator:
             self.font_color.set(settings.get("font_color", "#000000"))
             self.selected_font.set(settings.get("selected_font", "Arial"))
             self.line_spacing.set(settings.get("line_spacing", 5))
+            self.font_fit.set(settings.get("font_fit", "fixed"))
+            self.min_font_size.set(settings.get("min_font_size", 10))
             self.preview_text.set(settings.get("preview_text", "Иванов Иван Иванович"))
+            self.output_format.set(settings.get("output_format", "png"))
+            self.compress_level.set(settings.get("compress_level", 6))
+            self.output_quality.set(settings.get("quality", 90))
+            self.worker_count.set(settings.get("workers", 1))
+            self.shared_template.set(settings.get("shared_template", False))
+            self.dirty_region.set(settings.get("dirty_region", False))
+            self.large_template.set(settings.get("large_template", False))
+            self.zip_output.set(settings.get("zip_output", False))
+            self.zip_compression.set(settings.get("zip_compression", "stored"))
+            self.resume_run.set(settings.get("resume_run", False))
             
             # Обновляем список шрифтов
             if "available_fonts" in settings:
                 self.available_fonts = settings["available_fonts"]
+            self.custom_fonts = [path for path in settings.get("custom_fonts", []) if os.path.isfile(path)]
+            self.text_fields = settings.get("text_fields", [])
+            for path in self.custom_fonts:
+                default_resolver().register_font(path)
             
             # Обновляем интерфейс
             self.update_interface_labels()
@@ -1049,96 +1391,6 @@ class CertificateGenerator:
         """Принудительно обновляет правую панель"""
         self.root.update_idletasks()
             
-    def calculate_text_position(self, text, font, alignment):
-        """Вычисляет позицию текста в зависимости от выравнивания"""
-        if self.text_mode.get() == "point":
-            # Старый способ - одна точка
-            return self.text_x.get(), self.text_y.get()
-        
-        # Новый способ - область с отступами
-        x1, y1 = self.text_area_x1.get(), self.text_area_y1.get()
-        x2, y2 = self.text_area_x2.get(), self.text_area_y2.get()
-        
-        # Применяем отступы
-        text_x1 = x1 + self.text_padding_left.get()
-        text_y1 = y1 + self.text_padding_top.get()
-        text_x2 = x2 - self.text_padding_right.get()
-        text_y2 = y2 - self.text_padding_bottom.get()
-        
-        # Вычисляем максимальную ширину области с учетом отступов
-        max_width = text_x2 - text_x1
-        
-        # Вычисляем позицию по Y (по центру области с отступами)
-        y = text_y1 + (text_y2 - text_y1) // 2
-        
-        # Для многострочного текста всегда возвращаем левый край области как x
-        # Выравнивание будет обрабатываться в draw_multiline_text
-        x = text_x1
-            
-        return x, y, max_width
-    
-    def wrap_text_to_lines(self, text, font, max_width):
-        """Разбивает текст на строки, чтобы поместиться в заданную ширину"""
-        words = text.split()
-        lines = []
-        current_line = ""
-        
-        for word in words:
-            # Проверяем, поместится ли слово в текущую строку
-            test_line = current_line + (" " if current_line else "") + word
-            bbox = font.getbbox(test_line)
-            line_width = bbox[2] - bbox[0]
-            
-            if line_width <= max_width:
-                current_line = test_line
-            else:
-                # Если текущая строка не пустая, добавляем её
-                if current_line:
-                    lines.append(current_line)
-                    current_line = word
-                else:
-                    # Если даже одно слово не помещается, добавляем его как есть
-                    lines.append(word)
-                    current_line = ""
-        
-        # Добавляем последнюю строку
-        if current_line:
-            lines.append(current_line)
-            
-        return lines
-    
-    def draw_multiline_text(self, draw, text, font, x, y, alignment, max_width, line_spacing):
-        """Рисует многострочный текст с выравниванием"""
-        lines = self.wrap_text_to_lines(text, font, max_width)
-        print(f"Разбивка текста на строки: {lines}")
-        
-        # Получаем высоту строки
-        bbox = font.getbbox("Ay")  # Используем символы с верхними и нижними выносами
-        line_height = bbox[3] - bbox[1] + line_spacing
-        
-        # Вычисляем общую высоту текста
-        total_height = len(lines) * line_height - line_spacing
-        
-        # Начинаем рисовать с верхней позиции
-        start_y = y - total_height // 2
-        
-        for i, line in enumerate(lines):
-            line_y = start_y + i * line_height
-            
-            # Вычисляем позицию X для каждой строки относительно левого края области
-            bbox = font.getbbox(line)
-            line_width = bbox[2] - bbox[0]
-            
-            if alignment == "left":
-                line_x = x  # x - это левый край области
-            elif alignment == "right":
-                line_x = x + max_width - line_width  # x + ширина - ширина строки
-            else:  # center
-                line_x = x + (max_width - line_width) // 2  # x + половина свободного места
-            
-            print(f"Строка {i+1}: '{line}', позиция ({line_x}, {line_y}), ширина строки: {line_width}, ширина области: {max_width}")
-            draw.text((line_x, line_y), line, fill=self.font_color.get(), font=font)
-    
     def get_drag_type(self, x, y):
         """Определяет тип перетаскивания по позиции мыши"""
         if self.text_mode.get() != "area":
@@ -1178,29 +1430,44 @@ class CertificateGenerator:
         if not self.original_image:
             return 0, 0
             
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
-        img_width, img_height = self.original_image.size
-        
-        # Вычисляем позицию относительно изображения
-        click_x = canvas_x - (canvas_width - img_width * self.image_scale) // 2
-        click_y = canvas_y - (canvas_height - img_height * self.image_scale) // 2
+        # Позиция относительно левого верхнего угла шаблона на canvas
+        click_x = canvas_x - self.view_origin[0]
+        click_y = canvas_y - self.view_origin[1]
         
-        # Конвертируем в координаты оригинального изображения
-        original_x = int(click_x / self.image_scale)
-        original_y = int(click_y / self.image_scale)
+        # Конвертируем в координаты оригинального изображения (floor: левее и выше края - отрицательные)
+        original_x = math.floor(click_x / self.image_scale)
+        original_y = math.floor(click_y / self.image_scale)
         
         return original_x, original_y
             
+    def on_output_preset_change(self, event=None):
+        """Заполняет формат и параметры сжатия из выбранного пресета"""
+        preset = OUTPUT_PRESETS[self.output_preset.get()]
+        self.output_format.set(preset["output_format"])
+        self.compress_level.set(preset["compress_level"])
+        self.output_quality.set(preset["quality"])
+    
+    def compare_output_formats(self):
+        """Показывает время кодирования и размер файла для всех пресетов на текущем шаблоне"""
+        if not self.original_image:
+            messagebox.showerror("Ошибка", "Сначала загрузите шаблон сертификата")
+            return
+        try:
+            self.status_label.config(text="Сравнение форматов...")
+            self.root.update_idletasks()
+            # Большой шаблон: образец собирается плитками из TemplateCache, без копии в памяти
+            template = self.template_cache or self.original_image
+            sample = self.preview_text.get() or "Иванов Иван Иванович"
+            report = format_comparison(compare_sample_formats(template, self.render_settings(), sample))
+            self.status_label.config(text="Готов к работе")
+            messagebox.showinfo("Сравнение форматов", report)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось сравнить форматы: {str(e)}")
+    
     def create_output_folder(self):
         """Создает папку с именем дата-время-сертификат"""
-        now = datetime.now()
-        folder_name = now.strftime("%Y-%m-%d_%H-%M-%S_сертификаты")
-        folder_path = os.path.join(os.getcwd(), folder_name)
-        
         try:
-            os.makedirs(folder_path, exist_ok=True)
-            return folder_path
+            return create_output_folder()
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось создать папку: {str(e)}")
             return None
@@ -1214,85 +1481,306 @@ class CertificateGenerator:
             messagebox.showerror("Ошибка", "Сначала загрузите шаблон сертификата")
             return
             
-        # Создаем папку для сохранения
-        output_folder = self.create_output_folder()
-        if not output_folder:
-            return
+        if self.zip_output.get():
+            # Сертификаты пишутся прямо в архив, без промежуточных файлов
+            zip_path = filedialog.asksaveasfilename(
+                title="Сохранить сертификаты в ZIP архив",
+                defaultextension=".zip",
+                filetypes=[("ZIP files", "*.zip"), ("All files", "*.*")]
+            )
+            if not zip_path:
+                return
+            output_folder = None
+        elif self.resume_run.get() and self.output_folder and os.path.isdir(self.output_folder):
+            # Повторный запуск в ту же папку: готовые сертификаты пропускаются по манифесту
+            output_folder = self.output_folder
+        else:
+            # Создаем папку для сохранения
+            output_folder = self.create_output_folder()
+            if not output_folder:
+                return
             
+        # Все значения интерфейса читаются здесь: фоновый поток не обращается к Tk
+        base_settings = self.render_settings()
+        
+        # Файл (Excel или CSV) читается потоком: колонка "ФИО" и колонки дополнительных полей
         try:
-            # Читаем файл (Excel или CSV)
-            if self.excel_path.endswith('.csv'):
-                df = pd.read_csv(self.excel_path, encoding='utf-8-sig')
-            else:
-                df = pd.read_excel(self.excel_path)
+            names = Roster(self.excel_path, extra_columns=field_columns(base_settings))
+        except RosterError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
             
-            # Ищем только колонку "ФИО"
-            name_column = None
+        large_template = self.template_cache is not None
+        if large_template and base_settings.output_format != "png":
+            messagebox.showerror("Ошибка", "Большой шаблон сохраняется только в PNG")
+            return
             
-            for col in df.columns:
-                if col.strip() == 'ФИО':
-                    name_column = col
-                    break
-                    
-            if name_column is None:
-                messagebox.showerror("Ошибка", "Не найдена колонка 'ФИО' в файле. Убедитесь, что в файле есть колонка с точным названием 'ФИО'.")
-                return
-                
-            names = df[name_column].dropna().tolist()
+        workers = self.worker_count.get()
+        template = self.template_cache or self.original_image
+        template_path = self.template_path
+        dirty_region = self.dirty_region.get()
+        shared_template = self.shared_template.get()
+        zip_compression = self.zip_compression.get()
+        
+        def run(progress):
+            # Выполняется в фоновом потоке
+            total = names.estimate_total()
+            progress(0, total)
+            # Режим batch: один размер шрифта для всего списка
+            settings = fit_settings(names, base_settings)
+            manifest = None
+            timer = StageTimer()
+            if output_folder:
+                sink = FolderSink(output_folder)
+                manifest = RenderManifest(output_folder)
+            else:
+                sink = ZipSink(zip_path, zip_compression, settings.compress_level)
+            try:
+                with sink:
+                    if workers == 1:
+                        count = generate_batch(template, names, settings, sink, progress=progress,
+                                               dirty_region=dirty_region, total=total,
+                                               manifest=manifest, timer=timer)
+                    else:
+                        # Процессы сами декодируют шаблон, поэтому передаем путь к файлу
+                        count = generate_batch_parallel(template_path, names, settings, sink,
+                                                        workers=workers, progress=progress,
+                                                        shared_template=shared_template,
+                                                        dirty_region=dirty_region, total=total,
+                                                        manifest=manifest, timer=timer,
+                                                        large_template=large_template)
+            finally:
+                if manifest is not None:
+                    manifest.close()
             
-            if not names:
+            if count:
+                # Отчет о запуске: время этапов рядом с результатом
+                report_path = os.path.join(output_folder, RUN_REPORT_NAME) if output_folder else zip_path + ".report.json"
+                try:
+                    timer.write_report(report_path, certificates=count, output=output_folder or zip_path,
+                                       workers=workers, output_format=settings.output_format,
+                                       skipped=manifest.skipped if manifest else 0)
+                except OSError as e:
+                    log.warning("run report not written: %s", e)
+            return count, manifest, timer
+        
+        def on_done(result):
+            count, manifest, timer = result
+            if not count:
                 messagebox.showerror("Ошибка", "Не найдены данные в Excel файле")
+                self.status_label.config(text="Ошибка")
                 return
                 
-            # Настраиваем прогресс бар
-            self.progress['maximum'] = len(names)
-            self.progress['value'] = 0
+            self.progress['maximum'] = count
+            self.progress['value'] = count
+            status = f"Готово! {timer.summary_text()}"
             
-            # Получаем шрифт
-            font = self.get_font(self.font_size.get())
-                
-            # Генерируем сертификаты
-            for i, name in enumerate(names):
-                # Создаем копию оригинального изображения
-                cert_img = self.original_image.copy()
-                draw = ImageDraw.Draw(cert_img)
-                
-                # Добавляем границу вокруг сертификата
-                img_width, img_height = cert_img.size
-                border_width = 3
-                draw.rectangle([0, 0, img_width-1, img_height-1], outline="#CCCCCC", width=border_width)
-                
-                # Добавляем ФИО
-                if self.text_mode.get() == "point":
-                    # Старый способ - одна точка
-                    x, y = self.calculate_text_position(str(name), font, self.text_alignment.get())
-                    draw.text((x, y), str(name), fill=self.font_color.get(), font=font)
-                else:
-                    # Новый способ - область с переносом строк
-                    x, y, max_width = self.calculate_text_position(str(name), font, self.text_alignment.get())
-                    self.draw_multiline_text(draw, str(name), font, x, y, self.text_alignment.get(), 
-                                           max_width, self.line_spacing.get())
-                
-                # Сохраняем сертификат
-                safe_name = "".join(c for c in str(name) if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                output_path = os.path.join(output_folder, f"certificate_{i+1}_{safe_name}.png")
-                cert_img.save(output_path)
-                
-                # Обновляем прогресс
-                self.progress['value'] = i + 1
-                self.status_label.config(text=f"Обработано: {i+1}/{len(names)}")
-                self.root.update()
-                
-            messagebox.showinfo("Успех", f"Сгенерировано {len(names)} сертификатов в папке:\n{output_folder}")
-            self.status_label.config(text="Готово!")
+            if not output_folder:
+                self.status_label.config(text=status)
+                messagebox.showinfo("Успех", f"Сгенерировано {count} сертификатов в архиве:\n{zip_path}")
+                return
+            message = f"Сгенерировано {count} сертификатов в папке:\n{output_folder}"
+            if manifest.skipped:
+                message += f"\n\nНарисовано заново: {manifest.rendered}, уже готовых: {manifest.skipped}"
+            self.status_label.config(text=status)
             
             # Обновляем отображение папки в интерфейсе
             self.output_folder = output_folder
             self.output_label.config(text=os.path.basename(output_folder), foreground="black")
+            messagebox.showinfo("Успех", message)
+        
+        def on_cancel():
+            if not output_folder:
+                messagebox.showinfo("Остановлено", f"Генерация остановлена. Архив с готовыми сертификатами:\n{zip_path}")
+                return
+            # Папка запоминается: флажок "Дополнять выбранную папку" продолжит с места остановки
+            self.output_folder = output_folder
+            self.output_label.config(text=os.path.basename(output_folder), foreground="black")
+            messagebox.showinfo("Остановлено", "Генерация остановлена. Чтобы продолжить с места остановки, "
+                                "включите \"Дополнять выбранную папку\" и запустите генерацию снова.")
+        
+        self.start_background_run(run, on_done, on_cancel, "Ошибка при генерации сертификатов")
+
+    def generate_pdf(self):
+        """Сохраняет все сертификаты в один PDF с векторным текстом"""
+        if not all([self.template_path, self.excel_path]):
+            messagebox.showerror("Ошибка", "Выберите шаблон сертификата и файл с ФИО")
+            return
             
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при генерации сертификатов: {str(e)}")
+        if not self.original_image:
+            messagebox.showerror("Ошибка", "Сначала загрузите шаблон сертификата")
+            return
+            
+        file_path = filedialog.asksaveasfilename(
+            title="Сохранить сертификаты в PDF",
+            defaultextension=".pdf",
+            filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
+        )
+        if not file_path:
+            return
+            
+        settings = self.render_settings()
+        try:
+            names = Roster(self.excel_path, extra_columns=field_columns(settings))
+        except RosterError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+            
+        template = self.template_cache or self.original_image
+        
+        def run(progress):
+            total = names.estimate_total()
+            progress(0, total)
+            return generate_pdf(template, names, fit_settings(names, settings), file_path,
+                                progress=progress, total=total)
+        
+        def on_done(count):
+            if not count:
+                messagebox.showerror("Ошибка", "Не найдены данные в Excel файле")
+                self.status_label.config(text="Ошибка")
+                return
+            self.status_label.config(text="Готово!")
+            messagebox.showinfo("Успех", f"Сгенерировано {count} сертификатов в файле:\n{file_path}")
+        
+        def on_cancel():
+            messagebox.showinfo("Остановлено", "Генерация PDF остановлена, файл не сохранен")
+        
+        self.start_background_run(run, on_done, on_cancel, "Ошибка при генерации PDF")
+    
+    def check_layout(self):
+        """Пробный прогон: размечает все ФИО и показывает те, что не помещаются в область"""
+        if not self.excel_path:
+            messagebox.showerror("Ошибка", "Выберите файл с ФИО")
+            return
+        try:
+            names = Roster(self.excel_path)
+        except RosterError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+            
+        settings = self.render_settings()
+        image_size = self.original_image.size if self.original_image else None
+        
+        def run(progress):
+            fitted = fit_settings(names, settings)
+            return dry_run(names, fitted, image_size, progress=progress), fitted
+        
+        def on_done(result):
+            summary, fitted = result
+            self.status_label.config(text=f"Проверено строк: {summary.rows}")
+            message = summary.describe() if summary.overflow else f"Все {summary.rows} ФИО помещаются в область"
+            if fitted is not settings:
+                message += f"\nРазмер шрифта для всего списка: {fitted.font_size}"
+            if summary.overflow:
+                messagebox.showwarning("Проверка разметки", message)
+            else:
+                messagebox.showinfo("Проверка разметки", message)
+        
+        self.start_background_run(run, on_done, lambda: None, "Ошибка при проверке разметки")
+    
+    def start_background_run(self, run, on_done, on_cancel, error_title):
+        """Запускает run(progress) в фоновом потоке.
+
+        Поток передает прогресс и результат через очередь, которую
+        интерфейс читает через after(); Tk вызывается только из главного потока.
+        """
+        control = RunControl()
+        events = queue.Queue()
+        
+        def progress(done, total):
+            events.put(("progress", done, total))
+            # Здесь поток ждет снятия паузы или узнает об отмене
+            control.checkpoint()
+        
+        def worker():
+            try:
+                events.put(("done", run(progress)))
+            except RunCancelled:
+                events.put(("cancelled", None))
+            except PdfFontError as e:
+                events.put(("error", str(e)))
+            except Exception as e:
+                log.warning("background run failed: %s", e, exc_info=True)
+                events.put(("error", f"{error_title}: {str(e)}"))
+        
+        self.run_control = control
+        self.run_events = events
+        self.run_callbacks = (on_done, on_cancel)
+        self.progress['value'] = 0
+        self.status_label.config(text="Подготовка...")
+        self.set_run_controls(running=True)
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, self.poll_background_run)
+    
+    def poll_background_run(self):
+        """Переносит прогресс фонового запуска в прогресс бар и строку состояния"""
+        last_progress = None
+        finished = None
+        try:
+            while True:
+                event = self.run_events.get_nowait()
+                if event[0] == "progress":
+                    last_progress = event
+                else:
+                    finished = event
+        except queue.Empty:
+            pass
+        
+        if last_progress:
+            _, done, total = last_progress
+            self.progress['maximum'] = max(total or 1, done)
+            self.progress['value'] = done
+            if not self.run_control.paused:
+                self.status_label.config(text=f"Обработано: {done}/{total or '?'}")
+        
+        if finished is None:
+            self.root.after(100, self.poll_background_run)
+            return
+        
+        self.set_run_controls(running=False)
+        on_done, on_cancel = self.run_callbacks
+        self.run_control = None
+        kind, value = finished
+        if kind == "done":
+            on_done(value)
+        elif kind == "cancelled":
+            self.status_label.config(text="Остановлено")
+            on_cancel()
+        else:
             self.status_label.config(text="Ошибка")
+            messagebox.showerror("Ошибка", value)
+    
+    def set_run_controls(self, running):
+        """Переключает кнопки запуска и управления фоновой генерацией"""
+        start_state = tk.DISABLED if running else tk.NORMAL
+        control_state = tk.NORMAL if running else tk.DISABLED
+        self.generate_button.config(state=start_state)
+        self.pdf_button.config(state=start_state)
+        self.check_button.config(state=start_state)
+        self.pause_button.config(state=control_state, text="Пауза")
+        self.cancel_button.config(state=control_state)
+    
+    def toggle_pause(self):
+        """Приостанавливает или продолжает фоновую генерацию"""
+        control = self.run_control
+        if control is None:
+            return
+        if control.paused:
+            control.resume()
+            self.pause_button.config(text="Пауза")
+            self.status_label.config(text="Продолжение...")
+        else:
+            control.pause()
+            self.pause_button.config(text="Продолжить")
+            self.status_label.config(text="Пауза")
+    
+    def cancel_run(self):
+        """Останавливает фоновую генерацию после текущего сертификата"""
+        if self.run_control is not None:
+            self.run_control.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.pause_button.config(state=tk.DISABLED)
+            self.status_label.config(text="Остановка...")
 
 def main():
     root = tk.Tk()
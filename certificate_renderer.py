@@ -0,0 +1,1090 @@
+"""Ядро отрисовки сертификатов без зависимости от tkinter.
+
+Используется как графическим интерфейсом (certificate_generator.py),
+так и пакетной генерацией из командной строки (certificate_cli.py).
+"""
+import io
+import json
+import os
+import threading
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from datetime import datetime
+from multiprocessing import shared_memory
+
+from PIL import Image, ImageDraw
+
+from font_resolver import default_resolver, font_file
+from glyph_atlas import glyph_atlas
+from large_template import TemplateCache, TiledCanvas, encode_png, write_png
+from output_formats import OUTPUT_PRESETS, OutputFormat, compare_presets
+from output_sinks import FolderSink, open_sink
+from render_manifest import RenderManifest, batch_fingerprint, render_key
+from run_stats import NULL_TIMER, StageTimer, get_logger
+from roster_reader import Roster, RosterError
+
+
+# Значения по умолчанию совпадают с начальными значениями переменных интерфейса
+DEFAULT_SETTINGS = {
+    "template_path": None,
+    "excel_path": None,
+    "text_mode": "area",
+    "text_alignment": "center",
+    "text_x": 400,
+    "text_y": 300,
+    "text_area_x1": 300,
+    "text_area_y1": 250,
+    "text_area_x2": 500,
+    "text_area_y2": 350,
+    "text_padding_left": 10,
+    "text_padding_right": 10,
+    "text_padding_top": 10,
+    "text_padding_bottom": 10,
+    "font_size": 50,
+    "font_color": "#000000",
+    "selected_font": "Arial",
+    "line_spacing": 5,
+    "font_fit": "fixed",
+    "min_font_size": 10,
+    # Дополнительные поля (дата, курс, номер...): словари с колонкой списка
+    # ("column") или постоянным текстом ("value") и своими настройками
+    # размещения и шрифта поверх основных; см. field_settings
+    "text_fields": [],
+    "custom_fonts": [],
+    "output_format": "png",
+    "compress_level": 6,
+    "quality": 90,
+}
+
+# Настройки в пикселях изображения, которые масштабируются для предпросмотра
+SCALABLE_SETTINGS = (
+    "text_x", "text_y",
+    "text_area_x1", "text_area_y1", "text_area_x2", "text_area_y2",
+    "text_padding_left", "text_padding_right", "text_padding_top", "text_padding_bottom",
+    "font_size", "line_spacing", "min_font_size",
+)
+
+# Координаты по осям: из них вычитается смещение видимой части предпросмотра
+POSITION_X_SETTINGS = ("text_x", "text_area_x1", "text_area_x2")
+POSITION_Y_SETTINGS = ("text_y", "text_area_y1", "text_area_y2")
+
+# Подбор размера шрифта: fixed - всегда font_size, name - свой размер для
+# каждого ФИО, batch - один размер для всего списка по самому длинному ФИО
+FONT_FIT_MODES = ("fixed", "name", "batch")
+
+log = get_logger("renderer")
+
+BORDER_COLOR = "#CCCCCC"
+BORDER_WIDTH = 3
+
+
+class RenderSettings:
+    """Настройки размещения текста, прочитанные один раз из проекта"""
+
+    def __init__(self, **values):
+        for key, default in DEFAULT_SETTINGS.items():
+            setattr(self, key, values.get(key, default))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Создает настройки из словаря в формате save_settings"""
+        return cls(**{key: data[key] for key in DEFAULT_SETTINGS if key in data})
+
+    @classmethod
+    def load(cls, path):
+        """Загружает настройки из JSON файла проекта"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in DEFAULT_SETTINGS}
+
+    def scaled(self, factor, offset=(0, 0)):
+        """Возвращает копию настроек в координатах изображения, масштабированного в factor раз.
+
+        offset - левый верхний угол видимой части в масштабированных координатах
+        (при приближенном предпросмотре); он вычитается из координат.
+        """
+        def scale(key, value):
+            value = round(value * factor)
+            if key in POSITION_X_SETTINGS:
+                return value - offset[0]
+            if key in POSITION_Y_SETTINGS:
+                return value - offset[1]
+            return value
+
+        values = self.to_dict()
+        for key in SCALABLE_SETTINGS:
+            values[key] = scale(key, values[key])
+        values["font_size"] = max(1, values["font_size"])
+        values["min_font_size"] = max(1, values["min_font_size"])
+        values["text_fields"] = [
+            {key: scale(key, value) if key in SCALABLE_SETTINGS else value for key, value in field.items()}
+            for field in values["text_fields"]
+        ]
+        return RenderSettings(**values)
+
+    def text_box(self):
+        """Возвращает область для текста с учетом отступов (x1, y1, x2, y2)"""
+        return (
+            self.text_area_x1 + self.text_padding_left,
+            self.text_area_y1 + self.text_padding_top,
+            self.text_area_x2 - self.text_padding_right,
+            self.text_area_y2 - self.text_padding_bottom,
+        )
+
+
+def field_settings(settings, field):
+    """Настройки отрисовки дополнительного поля: значения поля поверх основных"""
+    values = settings.to_dict()
+    values.update((key, value) for key, value in field.items() if key in DEFAULT_SETTINGS)
+    values["text_fields"] = []
+    return RenderSettings(**values)
+
+
+def field_columns(settings):
+    """Колонки списка, к которым привязаны дополнительные поля"""
+    return [field["column"] for field in settings.text_fields if field.get("column")]
+
+
+def load_font(font_name, size, custom_fonts=()):
+    """Получает шрифт с указанным размером через общий индекс и кэш шрифтов"""
+    resolver = default_resolver()
+    for path in custom_fonts:
+        if os.path.isfile(path):
+            resolver.register_font(path)
+    return resolver.get_font(font_name, size)
+
+
+def calculate_text_position(settings):
+    """Вычисляет позицию текста в зависимости от режима размещения"""
+    if settings.text_mode == "point":
+        # Старый способ - одна точка
+        return settings.text_x, settings.text_y
+
+    # Новый способ - область с отступами
+    text_x1, text_y1, text_x2, text_y2 = settings.text_box()
+
+    # Вычисляем максимальную ширину области с учетом отступов
+    max_width = text_x2 - text_x1
+
+    # Вычисляем позицию по Y (по центру области с отступами)
+    y = text_y1 + (text_y2 - text_y1) // 2
+
+    # Для многострочного текста всегда возвращаем левый край области как x
+    # Выравнивание будет обрабатываться в draw_multiline_text
+    x = text_x1
+
+    return x, y, max_width
+
+
+class TextMetrics:
+    """Кэш измерений текста для одного шрифта, общий для всего списка ФИО.
+
+    Каждое слово измеряется один раз по ширине продвижения (getlength),
+    ширина строки складывается из ширин слов и пробелов.
+    """
+
+    # Ограничение числа слов в кэше одного шрифта
+    MAX_WORDS = 100000
+
+    def __init__(self, font):
+        self.font = font
+        self.space_width = font.getlength(" ")
+        bbox = font.getbbox("Ay")  # Используем символы с верхними и нижними выносами
+        self.text_height = bbox[3] - bbox[1]
+        ascent, descent = font.getmetrics()
+        self.full_height = ascent + descent
+        # Запас на выносы глифов за пределы ширины продвижения
+        self.overhang = getattr(font, "size", 10) // 4 + 2
+        self._widths = {}
+
+    def word_width(self, word):
+        width = self._widths.get(word)
+        if width is None:
+            if len(self._widths) >= self.MAX_WORDS:
+                self._widths.clear()
+            width = self._widths[word] = self.font.getlength(word)
+        return width
+
+    def wrap(self, text, max_width):
+        """Разбивает текст на строки; возвращает список пар (строка, ширина)"""
+        result = []
+        current = []
+        current_width = 0
+
+        for word in text.split():
+            # Проверяем, поместится ли слово в текущую строку
+            word_width = self.word_width(word)
+            test_width = current_width + self.space_width + word_width if current else word_width
+
+            if test_width <= max_width:
+                current.append(word)
+                current_width = test_width
+            elif current:
+                # Текущая строка не пустая - переносим слово на новую строку
+                result.append((" ".join(current), round(current_width)))
+                current = [word]
+                current_width = word_width
+            else:
+                # Если даже одно слово не помещается, добавляем его как есть
+                result.append((word, round(word_width)))
+                current = []
+                current_width = 0
+
+        # Добавляем последнюю строку
+        if current:
+            result.append((" ".join(current), round(current_width)))
+        return result
+
+    def ink_box(self, x, y, width):
+        """Прямоугольник, гарантированно покрывающий строку ширины width в точке (x, y)"""
+        return (x - self.overhang, y - self.overhang,
+                x + width + self.overhang, y + self.full_height + self.overhang)
+
+
+_metrics_cache = weakref.WeakKeyDictionary()
+_metrics_lock = threading.Lock()
+
+
+def text_metrics(font):
+    """Возвращает общий для процесса кэш измерений для шрифта"""
+    with _metrics_lock:
+        metrics = _metrics_cache.get(font)
+        if metrics is None:
+            metrics = _metrics_cache[font] = TextMetrics(font)
+        return metrics
+
+
+class FontFitter:
+    """Подбирает наибольший размер шрифта (от min_font_size до font_size),
+    при котором ФИО с переносами помещается в область с отступами.
+
+    Размер ищется двоичным поиском; шрифты и кэши измерений слов хранятся
+    по размерам, поэтому каждый размер загружается один раз на весь список.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        x1, y1, x2, y2 = settings.text_box()
+        self.max_width = x2 - x1
+        self.max_height = y2 - y1
+        self.max_size = max(1, settings.font_size)
+        self.min_size = max(1, min(settings.min_font_size, self.max_size))
+        self._fonts = {}
+
+    def font(self, size):
+        font = self._fonts.get(size)
+        if font is None:
+            settings = self.settings
+            font = self._fonts[size] = load_font(settings.selected_font, size, settings.custom_fonts)
+        return font
+
+    def fits(self, text, size):
+        """Помещается ли текст размера size в область по ширине и высоте"""
+        metrics = text_metrics(self.font(size))
+        lines = metrics.wrap(text, self.max_width)
+        if any(width > self.max_width for _line, width in lines):
+            return False
+        spacing = self.settings.line_spacing
+        return len(lines) * (metrics.text_height + spacing) - spacing <= self.max_height
+
+    def fit_size(self, text, upper=None):
+        """Наибольший подходящий размер не больше upper (по умолчанию font_size).
+
+        Если текст не помещается даже при min_font_size, возвращается min_font_size.
+        """
+        high = self.max_size if upper is None else upper
+        if self.fits(text, high):
+            return high
+        low = self.min_size
+        if high <= low or not self.fits(text, low):
+            return low
+        # low помещается, high - нет
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self.fits(text, middle):
+                low = middle
+            else:
+                high = middle
+        return low
+
+    def fit(self, text):
+        """Шрифт подобранного размера для текста"""
+        return self.font(self.fit_size(text))
+
+    def batch_size(self, names):
+        """Один размер для всего списка: подходит самому длинному ФИО.
+
+        Каждое ФИО проверяется при текущем размере; поиск запускается только
+        для ФИО, которые не помещаются, и только ниже текущего размера.
+        """
+        size = self.max_size
+        for name in names:
+            if size <= self.min_size:
+                break
+            size = self.fit_size(str(name), size)
+        return size
+
+
+def fits_font(settings):
+    """Включен ли подбор размера шрифта (только в режиме области)"""
+    return settings.font_fit in ("name", "batch") and settings.text_mode != "point"
+
+
+def fit_settings(names, settings):
+    """Для font_fit="batch" возвращает копию настроек с одним размером для всего списка.
+
+    names читается полностью, поэтому это должен быть список или Roster, а не поток.
+    В остальных режимах настройки возвращаются без изменений.
+    """
+    if settings.font_fit != "batch" or settings.text_mode == "point":
+        return settings
+    values = settings.to_dict()
+    values["font_size"] = FontFitter(settings).batch_size(names)
+    values["font_fit"] = "fixed"
+    log.info("batch font size: %d (max %d)", values["font_size"], settings.font_size)
+    return RenderSettings(**values)
+
+
+def wrap_text_to_lines(text, font, max_width):
+    """Разбивает текст на строки, чтобы поместиться в заданную ширину"""
+    return [line for line, _width in text_metrics(font).wrap(text, max_width)]
+
+
+def union_box(box, other):
+    """Объединяет два прямоугольника (x1, y1, x2, y2), любой может быть None"""
+    if box is None:
+        return other
+    if other is None:
+        return box
+    return (min(box[0], other[0]), min(box[1], other[1]),
+            max(box[2], other[2]), max(box[3], other[3]))
+
+
+def draw_line(draw, xy, text, font, fill, width=None):
+    """Рисует одну строку и возвращает прямоугольник, который она может занимать.
+
+    В целочисленных координатах строка собирается из кэша глифов (glyph_atlas),
+    результат совпадает с draw.text попиксельно.
+    """
+    atlas = glyph_atlas(font)
+    if (atlas.enabled and isinstance(xy[0], int) and isinstance(xy[1], int) and "\n" not in text
+            and getattr(draw, "fontmode", "L") == "L"):
+        atlas.draw(draw, xy, text, fill)
+    else:
+        draw.text(xy, text, fill=fill, font=font)
+    metrics = text_metrics(font)
+    if width is None:
+        width = round(metrics.word_width(text))
+    return metrics.ink_box(xy[0], xy[1], width)
+
+
+def layout_lines(text, font, x, y, alignment, max_width, line_spacing):
+    """Разбивает текст на строки и вычисляет их положение.
+
+    Возвращает список (строка, x, y, ширина) для многострочного режима.
+    """
+    metrics = text_metrics(font)
+    lines = metrics.wrap(text, max_width)
+
+    # Получаем высоту строки
+    line_height = metrics.text_height + line_spacing
+
+    # Вычисляем общую высоту текста
+    total_height = len(lines) * line_height - line_spacing
+
+    # Начинаем рисовать с верхней позиции
+    start_y = y - total_height // 2
+
+    placed = []
+    for i, (line, line_width) in enumerate(lines):
+        line_y = start_y + i * line_height
+
+        # Вычисляем позицию X для каждой строки относительно левого края области
+        if alignment == "left":
+            line_x = x  # x - это левый край области
+        elif alignment == "right":
+            line_x = x + max_width - line_width  # x + ширина - ширина строки
+        else:  # center
+            line_x = x + (max_width - line_width) // 2  # x + половина свободного места
+
+        placed.append((line, line_x, line_y, line_width))
+    return placed
+
+
+def draw_lines(draw, placed, font, fill):
+    """Рисует строки, размеченные layout_lines, и возвращает занятый прямоугольник"""
+    drawn_box = None
+    for line, line_x, line_y, line_width in placed:
+        drawn_box = union_box(drawn_box, draw_line(draw, (line_x, line_y), line, font, fill, line_width))
+    return drawn_box
+
+
+def draw_multiline_text(draw, text, font, x, y, alignment, max_width, line_spacing, fill):
+    """Рисует многострочный текст с выравниванием.
+
+    Возвращает прямоугольник, занятый нарисованным текстом, или None.
+    """
+    return draw_lines(draw, layout_lines(text, font, x, y, alignment, max_width, line_spacing),
+                      font, fill)
+
+
+def draw_border(draw, size, offset=(0, 0)):
+    """Добавляет границу вокруг сертификата.
+
+    offset - положение холста draw на сертификате размера size (для плиток).
+    """
+    img_width, img_height = size
+    x, y = offset
+    draw.rectangle([-x, -y, img_width-1-x, img_height-1-y], outline=BORDER_COLOR, width=BORDER_WIDTH)
+
+
+def border_bands(size):
+    """Прямоугольники, которые занимает граница: верх, низ, левый и правый край"""
+    width, height = size
+    return [(0, 0, width, BORDER_WIDTH), (0, height - BORDER_WIDTH, width, height),
+            (0, BORDER_WIDTH, BORDER_WIDTH, height - BORDER_WIDTH),
+            (width - BORDER_WIDTH, BORDER_WIDTH, width, height - BORDER_WIDTH)]
+
+
+def bordered_canvas(cache):
+    """Шаблон на диске (TemplateCache) с границей, наложенной плитками по краям"""
+    canvas = TiledCanvas(cache)
+    add_border_tiles(canvas)
+    return canvas
+
+
+def add_border_tiles(canvas):
+    """Накладывает на холст TiledCanvas плитки с границей"""
+    for band in border_bands(canvas.size):
+        # Плитки по краям точно по границе, без запаса на сглаживание
+        region = canvas.region(band)
+        draw_border(ImageDraw.Draw(region), canvas.size, band[:2])
+        canvas.tiles.append((band, region))
+
+
+def placed_box(placed, font):
+    """Прямоугольник, гарантированно покрывающий строки разметки layout_lines"""
+    metrics = text_metrics(font)
+    box = None
+    for line, line_x, line_y, line_width in placed:
+        if line_width is None:
+            line_width = round(metrics.word_width(line))
+        box = union_box(box, metrics.ink_box(line_x, line_y, line_width))
+    return box
+
+
+def safe_filename(name):
+    """Оставляет в имени только безопасные для файловой системы символы"""
+    return "".join(c for c in str(name) if c.isalnum() or c in (' ', '-', '_')).rstrip()
+
+
+def certificate_filename(index, name, extension="png"):
+    """Имя файла сертификата для строки с номером index (с нуля)"""
+    return f"certificate_{index+1}_{safe_filename(name)}.{extension}"
+
+
+class CertificateRenderer:
+    """Рисует ФИО на копии шаблона по заданным настройкам.
+
+    timer (StageTimer) получает время этапов font, layout и draw. При
+    подборе размера шрифта (font_fit) размер выбирается для каждого ФИО;
+    режим batch должен быть заранее сведен к одному размеру через fit_settings,
+    иначе он работает как name.
+
+    Дополнительные поля с постоянным текстом рисуются один раз в основу
+    (self.template), поэтому на каждый сертификат рисуются только ФИО и
+    поля, привязанные к колонкам списка.
+    """
+
+    def __init__(self, template, settings, font=None, mode=None, timer=None):
+        self.template = template
+        self.settings = settings
+        self.timer = timer or NULL_TIMER
+        if font is None:
+            with self.timer.stage("font"):
+                font = load_font(settings.selected_font, settings.font_size, settings.custom_fonts)
+        self.font = font
+        self.fitter = FontFitter(settings) if fits_font(settings) else None
+        # Режим готового изображения (шаблон в общей памяти хранится как RGBX)
+        self.mode = mode or template.mode
+        # Поля из колонок списка: (колонка, отрисовщик поля)
+        self.fields = []
+        constant = []
+        for field in settings.text_fields:
+            renderer = CertificateRenderer(template, field_settings(settings, field), mode=mode, timer=self.timer)
+            if field.get("column"):
+                self.fields.append((field["column"], renderer))
+            elif field.get("value"):
+                constant.append((str(field["value"]), renderer))
+        if constant:
+            self.template = self.bake(constant)
+
+    def bake(self, constant):
+        """Основа с заранее нарисованными постоянными полями"""
+        with self.timer.stage("draw", count=0):
+            base = self.working_copy()
+            draw = ImageDraw.Draw(base)
+            for text, renderer in constant:
+                renderer.draw_text(draw, text)
+        return base
+
+    def working_copy(self):
+        """Возвращает изменяемую копию шаблона для одного сертификата"""
+        if self.template.mode == self.mode:
+            return self.template.copy()
+        return self.template.convert(self.mode)
+
+    def layout(self, text, font=None):
+        """Размечает текст согласно режиму размещения: список (строка, x, y, ширина)"""
+        settings = self.settings
+        if settings.text_mode == "point":
+            x, y = calculate_text_position(settings)
+            return [(text, x, y, None)]
+        x, y, max_width = calculate_text_position(settings)
+        return layout_lines(text, font or self.font, x, y, settings.text_alignment,
+                            max_width, settings.line_spacing)
+
+    def font_for(self, text, font_size=None):
+        """Шрифт для текста: размера font_size, подобранный под область или основной"""
+        if font_size is not None and font_size != self.settings.font_size:
+            if self.fitter is not None:
+                return self.fitter.font(font_size)
+            return load_font(self.settings.selected_font, font_size, self.settings.custom_fonts)
+        if self.fitter is None or font_size is not None:
+            return self.font
+        return self.fitter.fit(text)
+
+    def draw_text(self, draw, text, font=None, placed=None, font_size=None):
+        """Рисует текст согласно режиму размещения, возвращает занятый прямоугольник.
+
+        placed - готовая разметка (например, из плана); тогда текст не размечается
+        заново. font_size - размер шрифта из плана при подборе размера.
+        """
+        if placed is None:
+            with self.timer.stage("layout"):
+                font = font or self.font_for(text)
+                placed = self.layout(text, font)
+        else:
+            font = font or self.font_for(text, font_size)
+        with self.timer.stage("draw"):
+            return draw_lines(draw, placed, font, self.settings.font_color)
+
+    def draw_fields(self, draw, values):
+        """Рисует поля из колонок списка, возвращает занятый прямоугольник"""
+        drawn_box = None
+        for column, renderer in self.fields:
+            text = values.get(column) if values else None
+            if text:
+                drawn_box = union_box(drawn_box, renderer.draw_text(draw, text))
+        return drawn_box
+
+    def render(self, name, placed=None, font_size=None, values=None):
+        """Возвращает готовое изображение сертификата для одного ФИО.
+
+        values - значения колонок для дополнительных полей ({колонка: текст}).
+        """
+        with self.timer.stage("draw", count=0):
+            cert_img = self.working_copy()
+            draw = ImageDraw.Draw(cert_img)
+            draw_border(draw, cert_img.size)
+        self.draw_text(draw, str(name), placed=placed, font_size=font_size)
+        self.draw_fields(draw, values)
+        return cert_img
+
+
+class DirtyRegionRenderer(CertificateRenderer):
+    """Рисует все сертификаты на одном рабочем холсте.
+
+    Граница (и постоянные поля) запекается в основу один раз; перед каждым ФИО из основы
+    восстанавливается только прямоугольник, занятый предыдущим текстом.
+    render() каждый раз возвращает один и тот же объект изображения,
+    поэтому его нужно сохранить до следующего вызова.
+    """
+
+    def __init__(self, template, settings, font=None, mode=None, timer=None):
+        super().__init__(template, settings, font=font, mode=mode, timer=timer)
+        self.base = self.working_copy()
+        draw_border(ImageDraw.Draw(self.base), self.base.size)
+        self.canvas = self.base.copy()
+        self._draw = ImageDraw.Draw(self.canvas)
+        self._dirty = None
+
+    def _clip(self, box):
+        """Расширяет прямоугольник на пиксель сглаживания и обрезает по холсту"""
+        if box is None:
+            return None
+        width, height = self.canvas.size
+        box = (max(0, int(box[0]) - 1), max(0, int(box[1]) - 1),
+               min(width, int(box[2]) + 2), min(height, int(box[3]) + 2))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return None
+        return box
+
+    def render(self, name, placed=None, font_size=None, values=None):
+        """Возвращает рабочий холст с нарисованным ФИО"""
+        if self._dirty:
+            with self.timer.stage("draw", count=0):
+                self.canvas.paste(self.base.crop(self._dirty), self._dirty[:2])
+        drawn_box = self.draw_text(self._draw, str(name), placed=placed, font_size=font_size)
+        self._dirty = self._clip(union_box(drawn_box, self.draw_fields(self._draw, values)))
+        return self.canvas
+
+
+class TiledRenderer(CertificateRenderer):
+    """Собирает сертификаты из шаблона на диске (TemplateCache) без полной копии.
+
+    Текст, поля и граница рисуются на плитках - вырезках шаблона под ними;
+    write() пишет PNG полосами (шаблон плюс плитки). Постоянные поля и
+    граница рисуются на плитках один раз для всего списка. Поддерживается
+    только вывод в PNG.
+    """
+
+    def __init__(self, cache, settings, font=None, timer=None):
+        if settings.output_format != "png":
+            raise ValueError("Большой шаблон сохраняется только в PNG")
+        # Постоянные поля запекаются в плитки холста при создании (bake)
+        self.canvas = TiledCanvas(cache)
+        super().__init__(cache.image, settings, font=font, mode=cache.mode, timer=timer)
+        add_border_tiles(self.canvas)
+        self.compress_level = settings.compress_level
+
+    def bake(self, constant):
+        with self.timer.stage("draw", count=0):
+            for text, renderer in constant:
+                draw_tile(renderer, self.canvas, text)
+        return self.template
+
+    def compose(self, name, placed=None, font_size=None, values=None):
+        """Холст сертификата: общие плитки и плитки с ФИО и полями строки"""
+        canvas = self.canvas.copy()
+        draw_tile(self, canvas, str(name), placed, font_size)
+        for column, renderer in self.fields:
+            text = values.get(column) if values else None
+            if text:
+                draw_tile(renderer, canvas, text)
+        return canvas
+
+    def write(self, target, name, placed=None, font_size=None, values=None):
+        """Рисует сертификат и пишет его в файловый объект target в формате PNG"""
+        canvas = self.compose(name, placed, font_size, values)
+        with self.timer.stage("encode"):
+            write_png(target, canvas.size, canvas.mode, canvas.strips(), self.compress_level)
+
+    def encode(self, name, placed=None, font_size=None, values=None):
+        """Возвращает PNG сертификата в виде bytes"""
+        buffer = io.BytesIO()
+        self.write(buffer, name, placed, font_size, values)
+        return buffer.getvalue()
+
+
+def draw_tile(renderer, canvas, text, placed=None, font_size=None):
+    """Рисует текст отрисовщиком renderer на новой плитке холста TiledCanvas"""
+    with renderer.timer.stage("layout"):
+        font = renderer.font_for(text, font_size)
+        if placed is None:
+            placed = renderer.layout(text, font)
+    tile = canvas.tile(placed_box(placed, font))
+    if tile is None:
+        return
+    (x, y, _right, _bottom), image = tile
+    shifted = [(line, line_x - x, line_y - y, line_width) for line, line_x, line_y, line_width in placed]
+    renderer.draw_text(ImageDraw.Draw(image), text, font=font, placed=shifted)
+
+
+def make_renderer(template, settings, mode=None, dirty_region=False, timer=None):
+    """Создает отрисовщик: с полной копией шаблона, с перерисовкой области текста
+    или по плиткам, если template - шаблон на диске (TemplateCache)"""
+    if isinstance(template, TemplateCache):
+        return TiledRenderer(template, settings, timer=timer)
+    renderer_class = DirtyRegionRenderer if dirty_region else CertificateRenderer
+    return renderer_class(template, settings, mode=mode, timer=timer)
+
+
+def compare_sample_formats(template, settings, name):
+    """Время кодирования и размер сертификата name для каждого пресета (compare_presets).
+
+    Для шаблона на диске (TemplateCache) образец собирается плитками и пишется
+    в PNG полосами, как при генерации, поэтому сравниваются только PNG пресеты.
+    """
+    if isinstance(template, TemplateCache):
+        png_settings = RenderSettings(**dict(settings.to_dict(), output_format="png"))
+        canvas = TiledRenderer(template, png_settings).compose(name)
+        presets = [preset for preset, values in OUTPUT_PRESETS.items() if values["output_format"] == "png"]
+        return compare_presets(canvas, presets, encode=lambda output, image: encode_png(image, output.compress_level))
+    return compare_presets(CertificateRenderer(template, settings).render(name))
+
+
+def create_output_folder(base_dir=None):
+    """Создает папку с именем дата-время-сертификаты"""
+    folder_name = datetime.now().strftime("%Y-%m-%d_%H-%M-%S_сертификаты")
+    folder_path = os.path.join(base_dir or os.getcwd(), folder_name)
+    os.makedirs(folder_path, exist_ok=True)
+    return folder_path
+
+
+def open_template(path):
+    """Открывает и декодирует шаблон сертификата"""
+    template = Image.open(path)
+    template.load()
+    return template
+
+
+def roster_total(names, total=None):
+    """Количество ФИО: явно заданное, длина списка или None для потока"""
+    if total is not None:
+        return total
+    try:
+        return len(names)
+    except TypeError:
+        return None
+
+
+def roster_records(names):
+    """Пары (ФИО, значения полей) для Roster с дополнительными колонками или списка ФИО"""
+    records = getattr(names, "records", None)
+    if records is not None:
+        return records()
+    return ((name, None) for name in names)
+
+
+def manifest_fingerprint(template, settings):
+    """Общая часть ключей манифеста для шаблона, настроек и выбранного шрифта"""
+    font = load_font(settings.selected_font, settings.font_size, settings.custom_fonts)
+    if isinstance(template, TemplateCache):
+        # Хеш пикселей посчитан при создании кэша: буфер не читается заново
+        template = template.digest
+    return batch_fingerprint(template, settings.to_dict(), font_file(font))
+
+
+def _numbered_rows(names):
+    """(номер, ФИО, разметка, размер шрифта, значения полей) для списка ФИО,
+    Roster с дополнительными колонками или плана разметки (LayoutPlan)"""
+    planned_rows = getattr(names, "planned_rows", None)
+    if planned_rows is not None:
+        return planned_rows()
+    return ((i, str(name), None, None, values) for i, (name, values) in enumerate(roster_records(names)))
+
+
+def _rows_to_render(names, extension, manifest=None, fingerprint=None, shard=None):
+    """Перебирает (имя файла, ФИО, ключ, разметка, размер шрифта, значения полей) строк,
+    которые нужно нарисовать.
+
+    names - ФИО или план разметки; для плана разметка и размер шрифта берутся готовыми.
+    Строки, уже актуальные по манифесту, пропускаются (и учитываются в manifest.skipped).
+    shard - ShardManifest: строки других частей пропускаются, номера остаются общими.
+    """
+    for i, name, placed, font_size, values in _numbered_rows(names):
+        filename = certificate_filename(i, name, extension)
+        if shard is not None and not shard.take(i, filename):
+            if manifest is not None:
+                manifest.keep(filename)
+            continue
+        key = None
+        if manifest is not None:
+            key = render_key(fingerprint, name, values)
+            if manifest.is_current(filename, key):
+                continue
+        yield filename, name, key, placed, font_size, values
+
+
+def shard_total(shard, total):
+    """Количество строк части из total строк всего списка"""
+    if shard is None or total is None:
+        return total
+    return shard.shard.share(total)
+
+
+def generate_batch(template, names, settings, output, progress=None, dirty_region=False,
+                   total=None, manifest=None, timer=None, shard=None):
+    """Генерирует сертификаты для всех ФИО и возвращает их количество.
+
+    output - папка или приемник (FolderSink, ZipSink); приемник закрывает
+    вызывающий код. template - изображение или шаблон на диске
+    (TemplateCache) для режима большого шаблона. names может быть списком, потоком (например, Roster)
+    или планом разметки (LayoutPlan). progress вызывается как
+    progress(done, total) после каждого сертификата; total - известное или
+    примерное количество строк, либо None.
+
+    manifest - RenderManifest папки вывода: актуальные файлы пропускаются,
+    после полного прохода устаревшие файлы удаляются. timer - StageTimer
+    для времени этапов. Режим font_fit="batch" вызывающий код сводит к
+    одному размеру через fit_settings до вызова.
+
+    shard - ShardManifest части (--shard i/N): рисуются только строки этой
+    части, в конце манифест части пишется в приемник.
+
+    Исключение из progress (например, RunCancelled) останавливает генерацию;
+    уже сохраненные файлы остаются записанными в манифесте.
+    """
+    timer = timer or NULL_TIMER
+    renderer = make_renderer(template, settings, dirty_region=dirty_region, timer=timer)
+    output_format = OutputFormat.from_settings(settings)
+    sink = open_sink(output)
+    total = shard_total(shard, roster_total(names, total))
+    fingerprint = None
+    if manifest is not None or shard is not None:
+        fingerprint = manifest_fingerprint(template, settings)
+    if shard is not None:
+        shard.start(names, fingerprint)
+    log.debug("batch start: output=%s format=%s total=%s", getattr(sink, "location", sink),
+              output_format.describe(), total)
+    rendered = 0
+    for filename, name, key, placed, font_size, values in _rows_to_render(names, output_format.extension,
+                                                                          manifest, fingerprint, shard):
+        if isinstance(renderer, TiledRenderer):
+            # Большой шаблон: PNG пишется полосами прямо в приемник (запись входит в encode)
+            with sink.open(filename) as target:
+                renderer.write(target, name, placed, font_size, values)
+        else:
+            cert_img = renderer.render(name, placed, font_size, values)
+            with timer.stage("encode"):
+                data = output_format.encode(cert_img)
+            with timer.stage("save"):
+                sink.write_encoded(filename, data)
+        rendered += 1
+        if manifest is not None:
+            manifest.record(filename, key)
+        if progress:
+            progress(rendered + (manifest.skipped if manifest else 0), total)
+    done = rendered
+    if manifest is not None:
+        manifest.finish()
+        done += manifest.skipped
+        if progress:
+            progress(done, total)
+    if shard is not None:
+        shard.write(sink)
+    log.info("batch done: rendered=%d skipped=%d", rendered, done - rendered)
+    return done
+
+
+class SharedTemplate:
+    """Декодированный шаблон в общей памяти для процессов пула.
+
+    Пиксели лежат в раскладке Pillow (RGB хранится как RGBX), поэтому
+    процессы подключаются к буферу без копирования через Image.frombuffer.
+    """
+
+    def __init__(self, image):
+        if image.mode in ("RGBA", "L"):
+            self.buffer_mode = self.mode = image.mode
+        elif image.mode in ("LA", "PA") or "transparency" in image.info:
+            image = image.convert("RGBA")
+            self.buffer_mode = self.mode = "RGBA"
+        else:
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            self.buffer_mode, self.mode = "RGBX", "RGB"
+        self.size = image.size
+
+        data = image.tobytes("raw", self.buffer_mode)
+        self._shm = shared_memory.SharedMemory(create=True, size=len(data))
+        self._shm.buf[:len(data)] = data
+        self.name = self._shm.name
+
+    def descriptor(self):
+        """Данные для подключения к буферу из другого процесса"""
+        return (self.name, self.buffer_mode, self.mode, self.size)
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach_shared_template(descriptor):
+    """Подключается к шаблону в общей памяти, возвращает (изображение, режим, буфер)"""
+    name, buffer_mode, mode, size = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    image = Image.frombuffer(buffer_mode, size, shm.buf, "raw", buffer_mode, 0, 1)
+    return image, mode, shm
+
+
+# Состояние процесса-исполнителя: шаблон декодируется один раз на процесс
+_worker_renderer = None
+_worker_output_folder = None
+_worker_output_format = None
+_worker_shm = None
+_worker_timer = None
+
+
+def _init_worker(template_source, settings_data, output_folder, dirty_region=False, large_template=False):
+    """Инициализирует процесс пула: открывает шаблон и загружает шрифт.
+
+    template_source - путь к файлу, descriptor() шаблона в общей памяти или,
+    при large_template=True, location кэша шаблона на диске (TemplateCache).
+    output_folder=None - процесс возвращает закодированные файлы вместо записи на диск.
+    """
+    global _worker_renderer, _worker_output_folder, _worker_output_format, _worker_shm, _worker_timer
+    _worker_timer = StageTimer()
+    settings = RenderSettings.from_dict(settings_data)
+    _worker_output_format = OutputFormat.from_settings(settings)
+    if large_template:
+        _worker_renderer = TiledRenderer(TemplateCache.attach(template_source), settings, timer=_worker_timer)
+    elif isinstance(template_source, tuple):
+        # Буфер должен жить столько же, сколько процесс
+        template, mode, _worker_shm = attach_shared_template(template_source)
+        _worker_renderer = make_renderer(template, settings, mode=mode, dirty_region=dirty_region,
+                                         timer=_worker_timer)
+    else:
+        _worker_renderer = make_renderer(open_template(template_source), settings,
+                                         dirty_region=dirty_region, timer=_worker_timer)
+    _worker_output_folder = output_folder
+
+
+def _render_chunk(rows):
+    """Рисует часть списка, rows - (имя файла, ФИО, разметка, размер шрифта, значения полей).
+
+    Сохраняет файлы в папку процесса, либо, если папки нет, собирает список
+    пар (имя файла, закодированные данные). Возвращает (этот список или
+    количество файлов, время этапов с прошлой части).
+    """
+    timer = _worker_timer
+    sink = FolderSink(_worker_output_folder) if _worker_output_folder is not None else None
+    encoded = []
+    for filename, name, placed, font_size, values in rows:
+        if isinstance(_worker_renderer, TiledRenderer):
+            if sink is not None:
+                with sink.open(filename) as target:
+                    _worker_renderer.write(target, name, placed, font_size, values)
+                continue
+            data = _worker_renderer.encode(name, placed, font_size, values)
+        else:
+            cert_img = _worker_renderer.render(name, placed, font_size, values)
+            with timer.stage("encode"):
+                data = _worker_output_format.encode(cert_img)
+        if sink is None:
+            encoded.append((filename, data))
+        else:
+            with timer.stage("save"):
+                sink.write_encoded(filename, data)
+    stats = timer.snapshot()
+    timer.reset()
+    return (encoded if sink is None else len(rows)), stats
+
+
+def resolve_workers(workers):
+    """Количество процессов: 0 или None означает все ядра"""
+    if not workers or workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def generate_batch_parallel(template_path, names, settings, output, workers=0,
+                            progress=None, chunk_size=None, shared_template=False,
+                            dirty_region=False, total=None, manifest=None, timer=None,
+                            large_template=False, shard=None):
+    """Генерирует сертификаты в пуле процессов и возвращает их количество.
+
+    Список ФИО делится на части; каждый процесс декодирует шаблон один раз
+    при запуске. Имена файлов совпадают с generate_batch. progress вызывается
+    в вызывающем потоке по мере завершения частей. names может быть потоком:
+    части читаются по мере освобождения процессов, поэтому в памяти находится
+    лишь несколько частей одновременно.
+
+    output - папка или приемник. В папку процессы пишут файлы сами, в другие
+    приемники (ZipSink) пишет вызывающий процесс.
+
+    При shared_template=True шаблон декодируется один раз в текущем процессе
+    в общую память, и процессы подключаются к нему без копирования.
+
+    При large_template=True шаблон декодируется в кэш на диске
+    (TemplateCache), процессы отображают его в память и пишут PNG полосами
+    (TiledRenderer); shared_template и dirty_region тогда не нужны.
+
+    manifest и shard - как в generate_batch; актуальные строки и строки
+    других частей отсеиваются до отправки в процессы. timer получает время этапов, суммированное по процессам.
+    """
+    if large_template:
+        with TemplateCache(template_path) as cache:
+            fingerprint = None
+            if manifest is not None or shard is not None:
+                fingerprint = manifest_fingerprint(cache, settings)
+            return _run_pool(cache.location, names, settings, output, workers, progress,
+                             chunk_size, False, total, manifest, fingerprint, timer, large_template=True,
+                             shard=shard)
+    fingerprint = None
+    if manifest is not None or shard is not None:
+        fingerprint = manifest_fingerprint(open_template(template_path), settings)
+    if shared_template:
+        with SharedTemplate(open_template(template_path)) as shared:
+            return _run_pool(shared.descriptor(), names, settings, output, workers, progress,
+                             chunk_size, dirty_region, total, manifest, fingerprint, timer, shard=shard)
+    return _run_pool(template_path, names, settings, output, workers, progress,
+                     chunk_size, dirty_region, total, manifest, fingerprint, timer, shard=shard)
+
+
+def _run_pool(template_source, names, settings, output, workers, progress, chunk_size,
+              dirty_region, total, manifest=None, fingerprint=None, timer=None, large_template=False,
+              shard=None):
+    sink = open_sink(output)
+    output_folder = sink.folder if isinstance(sink, FolderSink) else None
+    timer = timer or NULL_TIMER
+    workers = resolve_workers(workers)
+    total = shard_total(shard, roster_total(names, total))
+    if shard is not None:
+        shard.start(names, fingerprint)
+    if chunk_size is None:
+        # Несколько частей на процесс, чтобы выровнять нагрузку
+        chunk_size = max(1, min(64, -(-total // (workers * 4)))) if total else 64
+
+    extension = OutputFormat.from_settings(settings).extension
+    rows = _rows_to_render(names, extension, manifest, fingerprint, shard)
+    rendered = 0
+    pending = {}
+    log.debug("pool start: workers=%d chunk_size=%d output=%s", workers, chunk_size,
+              getattr(sink, "location", sink))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(template_source, settings.to_dict(), output_folder,
+                                       dirty_region, large_template)) as pool:
+        try:
+            while True:
+                # Держим в очереди не больше двух частей на процесс
+                while len(pending) < workers * 2:
+                    chunk = list(islice(rows, chunk_size))
+                    if not chunk:
+                        break
+                    future = pool.submit(_render_chunk, [(filename, name, placed, font_size, values)
+                                                         for filename, name, _key, placed, font_size, values
+                                                         in chunk])
+                    pending[future] = chunk
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chunk = pending.pop(future)
+                    result, stats = future.result()
+                    timer.merge(stats)
+                    if output_folder is None:
+                        for filename, data in result:
+                            with timer.stage("save"):
+                                sink.write_encoded(filename, data)
+                    rendered += len(chunk)
+                    if manifest is not None:
+                        for filename, _name, key, *_layout in chunk:
+                            manifest.record(filename, key)
+                    if progress:
+                        progress(rendered + (manifest.skipped if manifest else 0), total)
+        except BaseException:
+            # Остановка из progress (отмена) или ошибка: не запускаем оставшиеся части
+            for future in pending:
+                future.cancel()
+            raise
+    done = rendered
+    if manifest is not None:
+        manifest.finish()
+        done += manifest.skipped
+        if progress:
+            progress(done, total)
+    if shard is not None:
+        shard.write(sink)
+    log.info("pool done: rendered=%d skipped=%d", rendered, done - rendered)
+    return done
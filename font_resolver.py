@@ -0,0 +1,308 @@
+"""Поиск файлов шрифтов по имени и кэш загруженных шрифтов.
+
+Индекс имя -> файл строится один раз по системным папкам шрифтов
+(Windows, macOS, Linux) и пополняется загруженными пользователем файлами.
+Результат сканирования сохраняется в каталог на диске и используется,
+пока не изменилось время модификации папок шрифтов.
+Загруженные шрифты хранятся в ограниченном LRU кэше по ключу (путь, размер).
+"""
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from PIL import ImageFont
+
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+
+CATALOG_VERSION = 1
+
+# Шрифты, которые пробуются, если выбранный шрифт не найден
+FALLBACK_FONTS = ("Arial", "Calibri", "Times New Roman", "DejaVu Sans", "Liberation Sans")
+
+# Стили, которые считаются основными при сопоставлении семейства с файлом
+REGULAR_STYLES = ("regular", "normal", "book", "roman", "medium")
+
+
+def system_font_dirs():
+    """Возвращает существующие системные и пользовательские папки шрифтов"""
+    home = os.path.expanduser("~")
+    if sys.platform.startswith("win"):
+        candidates = [
+            os.path.join(os.environ.get("WINDIR", "C:/Windows"), "Fonts"),
+            os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "Windows", "Fonts"),
+        ]
+    elif sys.platform == "darwin":
+        candidates = [
+            "/System/Library/Fonts",
+            "/Library/Fonts",
+            os.path.join(home, "Library", "Fonts"),
+        ]
+    else:
+        candidates = [
+            "/usr/share/fonts",
+            "/usr/local/share/fonts",
+            os.path.join(home, ".fonts"),
+            os.path.join(home, ".local", "share", "fonts"),
+        ]
+    return [path for path in candidates if path and os.path.isdir(path)]
+
+
+def default_catalog_path():
+    """Путь к файлу каталога шрифтов в пользовательской папке кэша"""
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "certgen", "font_catalog.json")
+
+
+def font_dirs_signature(font_dirs):
+    """Снимок папок шрифтов: для каждой папки (последнее mtime подпапок, число подпапок).
+
+    Добавление или удаление файла меняет mtime содержащей его папки,
+    поэтому снимок обновляется без чтения самих шрифтов.
+    """
+    signature = {}
+    for font_dir in font_dirs:
+        latest = 0.0
+        count = 0
+        for dirpath, _dirnames, _filenames in os.walk(font_dir):
+            try:
+                latest = max(latest, os.stat(dirpath).st_mtime)
+            except OSError:
+                continue
+            count += 1
+        signature[font_dir] = [latest, count]
+    return signature
+
+
+def normalize_font_name(name):
+    """Приводит имя шрифта к ключу индекса: 'Times New Roman' -> 'timesnewroman'"""
+    return "".join(c for c in name.lower() if c.isalnum())
+
+
+def iter_font_files(font_dirs):
+    """Перебирает файлы шрифтов во всех папках (рекурсивно)"""
+    for font_dir in font_dirs:
+        for dirpath, _dirnames, filenames in os.walk(font_dir):
+            for filename in filenames:
+                if filename.lower().endswith(FONT_EXTENSIONS):
+                    yield os.path.join(dirpath, filename)
+
+
+def read_font_names(path):
+    """Читает из файла (семейство, стиль) или None, если файл не открывается"""
+    try:
+        return ImageFont.truetype(path, 10).getname()
+    except Exception:
+        return None
+
+
+class FontResolver:
+    """Индекс имя шрифта -> файл и LRU кэш загруженных шрифтов"""
+
+    def __init__(self, font_dirs=None, cache_size=32, catalog_path=None):
+        self.font_dirs = system_font_dirs() if font_dirs is None else list(font_dirs)
+        self.cache_size = cache_size
+        # Каталог на диске; False отключает его
+        self.catalog_path = default_catalog_path() if catalog_path is None else catalog_path
+        self._lock = threading.RLock()
+        self._stems = None       # имя файла без расширения -> путь
+        self._families = None    # семейство / полное имя -> путь (строится при промахе)
+        self._family_names = None
+        self._catalog_loaded = False
+        self._custom = {}        # загруженные пользователем шрифты
+        self._resolved = {}      # кэш результатов resolve()
+        self._fonts = OrderedDict()
+
+    def _set_catalog(self, entries):
+        """Заполняет индексы из списка записей (путь, семейство, стиль)"""
+        stems = {}
+        families = {}
+        for path, family, style in entries:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            stems.setdefault(normalize_font_name(stem), path)
+            if family:
+                self._add_family(families, path, family, style)
+        with self._lock:
+            self._stems = stems
+            self._families = families
+            self._family_names = sorted({family for _path, family, _style in entries if family})
+            self._resolved.clear()
+
+    def _read_catalog(self, check_fresh):
+        """Читает каталог с диска; None, если его нет, он от других папок или устарел"""
+        if not self.catalog_path:
+            return None
+        try:
+            with open(self.catalog_path, 'r', encoding='utf-8') as f:
+                catalog = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if catalog.get("version") != CATALOG_VERSION or catalog.get("dirs_list") != self.font_dirs:
+            return None
+        if check_fresh and catalog.get("signature") != font_dirs_signature(self.font_dirs):
+            return None
+        return catalog
+
+    def load_catalog(self, check_fresh=True):
+        """Загружает каталог с диска. Возвращает True, если он есть и актуален.
+
+        При check_fresh=False каталог принимается без проверки папок
+        (быстрый старт; проверку затем выполняет refresh в фоне).
+        """
+        catalog = self._read_catalog(check_fresh)
+        if catalog is None:
+            return False
+        self._set_catalog([tuple(entry) for entry in catalog.get("fonts", [])])
+        self._catalog_loaded = True
+        return True
+
+    def scan(self):
+        """Полностью сканирует папки шрифтов и сохраняет каталог на диск"""
+        signature = font_dirs_signature(self.font_dirs)
+        entries = []
+        for path in iter_font_files(self.font_dirs):
+            names = read_font_names(path) or (None, None)
+            entries.append((path, names[0], names[1]))
+        self._set_catalog(entries)
+        self._catalog_loaded = True
+        if self.catalog_path:
+            try:
+                os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+                tmp_path = self.catalog_path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"version": CATALOG_VERSION, "dirs_list": self.font_dirs,
+                               "signature": signature, "fonts": entries}, f, ensure_ascii=False)
+                os.replace(tmp_path, self.catalog_path)
+            except OSError:
+                pass
+
+    def refresh(self):
+        """Пересканирует папки, только если каталог на диске устарел. Возвращает True при пересканировании"""
+        catalog = self._read_catalog(check_fresh=True)
+        if catalog is not None:
+            if not self._catalog_loaded:
+                self._set_catalog([tuple(entry) for entry in catalog.get("fonts", [])])
+                self._catalog_loaded = True
+            return False
+        self.scan()
+        return True
+
+    def family_names(self):
+        """Названия семейств из каталога (пустой список, если каталог еще не загружен)"""
+        with self._lock:
+            return list(self._family_names or [])
+
+    def _ensure_index(self):
+        if self._stems is None and not self.load_catalog():
+            # Быстрый индекс по именам файлов, без чтения самих шрифтов
+            stems = {}
+            for path in iter_font_files(self.font_dirs):
+                stem = os.path.splitext(os.path.basename(path))[0]
+                stems.setdefault(normalize_font_name(stem), path)
+            self._stems = stems
+
+    def _ensure_families(self):
+        """Читает имена семейств из всех файлов (один раз, только при промахе по имени файла)"""
+        self._ensure_index()
+        if self._families is None:
+            self.scan()
+
+    @staticmethod
+    def _add_family(families, path, family, style):
+        families.setdefault(normalize_font_name(f"{family} {style}"), path)
+        # Семейство без стиля сопоставляется с обычным начертанием
+        key = normalize_font_name(family)
+        if key not in families or (style or "").lower() in REGULAR_STYLES:
+            families[key] = path
+
+    def register_font(self, path):
+        """Добавляет пользовательский файл шрифта и возвращает его имя для списка"""
+        name = os.path.splitext(os.path.basename(path))[0]
+        with self._lock:
+            if self._custom.get(normalize_font_name(name)) == path:
+                return name
+            self._custom[normalize_font_name(name)] = path
+            names = read_font_names(path)
+            if names:
+                self._add_family(self._custom, path, *names)
+            self._resolved.clear()
+        return name
+
+    def resolve(self, font_name):
+        """Возвращает путь к файлу шрифта по имени (или пути к файлу) либо None"""
+        if not font_name:
+            return None
+        with self._lock:
+            if font_name in self._resolved:
+                return self._resolved[font_name]
+            if os.path.isfile(font_name):
+                path = font_name
+            else:
+                key = normalize_font_name(font_name)
+                path = self._custom.get(key)
+                if path is None:
+                    self._ensure_index()
+                    path = self._stems.get(key)
+                if path is None:
+                    self._ensure_families()
+                    path = self._families.get(key)
+            self._resolved[font_name] = path
+            return path
+
+    def get_font(self, font_name, size):
+        """Возвращает шрифт указанного размера, при отсутствии - запасной"""
+        path = self.resolve(font_name)
+        if path is None:
+            for fallback in FALLBACK_FONTS:
+                path = self.resolve(fallback)
+                if path:
+                    break
+            if path is None:
+                return ImageFont.load_default()
+            # Запоминаем запасной шрифт, чтобы не перебирать список при каждом вызове
+            with self._lock:
+                self._resolved[font_name] = path
+        return self.load(path, size)
+
+    def load(self, path, size):
+        """Загружает шрифт из файла через LRU кэш"""
+        key = (path, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                return font
+        font = ImageFont.truetype(path, size)
+        with self._lock:
+            self._fonts[key] = font
+            while len(self._fonts) > self.cache_size:
+                self._fonts.popitem(last=False)
+        return font
+
+    def clear_cache(self):
+        with self._lock:
+            self._fonts.clear()
+
+
+def font_file(font):
+    """Путь к файлу шрифта или None для встроенного шрифта Pillow (у него path - BytesIO)"""
+    path = getattr(font, "path", None)
+    return path if isinstance(path, (str, os.PathLike)) else None
+
+
+_default_resolver = None
+_default_lock = threading.Lock()
+
+
+def default_resolver():
+    """Общий для процесса экземпляр FontResolver"""
+    global _default_resolver
+    with _default_lock:
+        if _default_resolver is None:
+            _default_resolver = FontResolver()
+        return _default_resolver
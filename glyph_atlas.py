@@ -0,0 +1,142 @@
+"""Кэш растровых глифов для повторяющихся символов.
+
+В списке ФИО всего несколько десятков разных символов, а draw.text
+растеризует через FreeType всю строку при каждом вызове. GlyphAtlas одного
+шрифта (файл и размер) хранит маски покрытия и ширины продвижения глифов по
+ключу (символ, дробная часть позиции в 1/64 пикселя) и собирает строку из
+готовых масок. Позиции глифов складываются из ширин продвижения и кернинга
+пар так же, как в FreeType, а перекрывающиеся глифы смешиваются так же, как
+при отрисовке строки в Pillow, поэтому результат совпадает с draw.text
+попиксельно (допуск 0; benchmark.py проверяет это на всех строках
+синтетического списка для нескольких размеров шрифта). При создании атласа
+пробные строки рисуются обоими способами; если они расходятся (другая версия
+Pillow, сложная раскладка через raqm), атлас для этого шрифта отключается и
+используется draw.text.
+"""
+import threading
+import weakref
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+
+# Дробные позиции глифов в FreeType - 1/64 пикселя
+SUBPIXEL = 64
+
+# Ограничение числа масок в атласе одного шрифта
+MAX_GLYPHS = 20000
+
+# Строки для проверки совпадения с draw.text: кириллица, кернинг, выносные
+# элементы и пары, у которых глифы заходят друг на друга (Ал, Дм, ий)
+PROBE_TEXTS = (
+    "Иванов-Щукина Ёлка AVATAR Ту Уф fiy jq 0123",
+    "Александр Алексеевна Дмитриевич Андрей Эдуард Лебедев",
+)
+
+
+class GlyphAtlas:
+    """Маски глифов одного шрифта и сборка строки из них"""
+
+    def __init__(self, font):
+        self.font = font
+        self._glyphs = {}
+        self._advances = {}
+        self._kerning = {}
+        self.enabled = False
+        if getattr(font, "layout_engine", None) == ImageFont.Layout.BASIC:
+            try:
+                self.enabled = self._probe()
+            except (TypeError, ValueError, OSError):
+                # Старый Pillow без параметра start у getmask2
+                self.enabled = False
+
+    def __len__(self):
+        return len(self._glyphs)
+
+    def advance(self, char):
+        """Ширина продвижения символа в 1/64 пикселя"""
+        advance = self._advances.get(char)
+        if advance is None:
+            advance = self._advances[char] = round(self.font.getlength(char) * SUBPIXEL)
+        return advance
+
+    def kerning(self, left, right):
+        """Поправка кернинга пары символов в 1/64 пикселя"""
+        pair = left + right
+        kerning = self._kerning.get(pair)
+        if kerning is None:
+            kerning = round(self.font.getlength(pair) * SUBPIXEL) - self.advance(left) - self.advance(right)
+            self._kerning[pair] = kerning
+        return kerning
+
+    def glyph(self, char, fraction):
+        """(маска или None для пустого глифа, смещение) символа с дробной позицией fraction/64"""
+        key = (char, fraction)
+        glyph = self._glyphs.get(key)
+        if glyph is None:
+            if len(self._glyphs) >= MAX_GLYPHS:
+                self._glyphs.clear()
+            mask, offset = self.font.getmask2(char, "L", start=(fraction / SUBPIXEL, 0))
+            image = Image.frombytes("L", mask.size, bytes(mask)) if mask.size[0] and mask.size[1] else None
+            glyph = self._glyphs[key] = (image, offset)
+        return glyph
+
+    def mask(self, text):
+        """Маска строки и ее левый верхний угол относительно точки вывода, или (None, None)"""
+        pieces = []
+        pen = 0
+        previous = None
+        for char in text:
+            if previous is not None:
+                pen += self.kerning(previous, char)
+            pixel, fraction = divmod(pen, SUBPIXEL)
+            image, offset = self.glyph(char, fraction)
+            if image is not None:
+                pieces.append((image, pixel + offset[0], offset[1]))
+            pen += self.advance(char)
+            previous = char
+        if not pieces:
+            return None, None
+
+        left = min(x for _image, x, _y in pieces)
+        top = min(y for _image, _x, y in pieces)
+        right = max(x + image.width for image, x, _y in pieces)
+        bottom = max(y + image.height for image, _x, y in pieces)
+        line = Image.new("L", (right - left, bottom - top), 0)
+        for image, x, y in pieces:
+            # Перекрытия соседних глифов смешиваются как в Pillow при отрисовке
+            # строки: новое покрытие поверх старого (src + dst * (255 - src) / 255)
+            line.paste(255, (x - left, y - top), mask=image)
+        return line, (left, top)
+
+    def draw(self, draw, xy, text, fill):
+        """Рисует строку из масок атласа в целочисленной точке xy, как draw.text"""
+        line, origin = self.mask(text)
+        if line is not None:
+            draw.bitmap((xy[0] + origin[0], xy[1] + origin[1]), line, fill=fill)
+
+    def _probe(self):
+        """Проверяет, что сборка из масок совпадает с draw.text для пробных строк"""
+        return all(self.matches(text) for text in PROBE_TEXTS)
+
+    def matches(self, text):
+        """True, если строка text из масок атласа попиксельно совпадает с draw.text"""
+        size = getattr(self.font, "size", 10)
+        canvas_size = (int(self.font.getlength(text)) + size * 2, size * 3)
+        expected = Image.new("L", canvas_size, 0)
+        ImageDraw.Draw(expected).text((size, size), text, fill=255, font=self.font)
+        actual = Image.new("L", canvas_size, 0)
+        self.draw(ImageDraw.Draw(actual), (size, size), text, 255)
+        return ImageChops.difference(expected, actual).getbbox() is None
+
+
+_atlas_cache = weakref.WeakKeyDictionary()
+_atlas_lock = threading.Lock()
+
+
+def glyph_atlas(font):
+    """Возвращает общий для процесса атлас глифов для шрифта"""
+    with _atlas_lock:
+        atlas = _atlas_cache.get(font)
+        if atlas is None:
+            atlas = _atlas_cache[font] = GlyphAtlas(font)
+        return atlas
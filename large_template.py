@@ -0,0 +1,288 @@
+"""Режим большого шаблона: декодированные пиксели на диске и вывод полосами.
+
+Шаблоны плакатного размера (A2 при 600 dpi и больше) занимают в памяти
+сотни мегабайт, а копия на каждый сертификат удваивает это. TemplateCache
+один раз декодирует шаблон в файл кэша (~/.cache/certgen/templates, папку
+задает CERTGEN_CACHE_DIR) и при следующих запусках отображает его в память
+(mmap): страницы читает операционная система, они общие для всех
+процессов и не занимают память программы.
+
+TiledCanvas - шаблон с наложенными плитками: небольшими изменяемыми
+вырезками, на которых рисуются текст и граница. Готовый сертификат
+собирается полосами (шаблон плюс плитки) и пишется в PNG по мере сжатия
+(write_png), поэтому целое изображение в памяти не создается ни разу.
+"""
+import hashlib
+import io
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+
+from PIL import Image, ImageChops
+
+from font_resolver import default_catalog_path
+from render_manifest import file_digest
+
+
+# Высота полосы при сборке и записи изображения, строк
+STRIP_HEIGHT = 256
+
+# Начиная с этого числа пикселей интерфейс и CLI предлагают режим большого шаблона
+LARGE_TEMPLATE_PIXELS = 50_000_000
+
+CACHE_VERSION = 1
+
+# Тип цвета PNG для режимов, которые хранит кэш
+PNG_COLOR_TYPES = {"L": 0, "RGB": 2, "RGBA": 6}
+
+# Фильтр PNG Up: разность со строкой выше, считается целыми полосами через ImageChops
+PNG_FILTER_UP = b"\x02"
+
+
+def default_cache_dir():
+    """Папка кэша декодированных шаблонов: CERTGEN_CACHE_DIR или рядом с каталогом шрифтов"""
+    base = os.environ.get("CERTGEN_CACHE_DIR") or os.path.dirname(default_catalog_path())
+    return os.path.join(base, "templates")
+
+
+def storage_modes(image):
+    """(режим буфера, режим изображения) для хранения шаблона, как в SharedTemplate"""
+    if image.mode in ("RGBA", "L"):
+        return image.mode, image.mode
+    if image.mode in ("LA", "PA") or "transparency" in image.info:
+        return "RGBA", "RGBA"
+    return "RGBX", "RGB"
+
+
+def strip_boxes(size, height=STRIP_HEIGHT):
+    """Прямоугольники горизонтальных полос изображения сверху вниз"""
+    width, image_height = size
+    for top in range(0, image_height, height):
+        yield (0, top, width, min(image_height, top + height))
+
+
+def clip_box(box, size):
+    """Целочисленный прямоугольник с пикселем запаса на сглаживание, обрезанный по size"""
+    width, height = size
+    box = (max(0, math.floor(box[0]) - 1), max(0, math.floor(box[1]) - 1),
+           min(width, math.ceil(box[2]) + 2), min(height, math.ceil(box[3]) + 2))
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return None
+    return box
+
+
+class TemplateCache:
+    """Декодированный шаблон в файле кэша, отображенный в память.
+
+    Ключ кэша - SHA-256 файла шаблона, поэтому измененный файл
+    декодируется заново. image - изображение Pillow поверх отображения
+    (только чтение, без копии в памяти); RGB хранится как RGBX.
+    """
+
+    def __init__(self, path, cache_dir=None):
+        cache_dir = cache_dir or default_cache_dir()
+        self.location = os.path.join(cache_dir, file_digest(path))
+        if not self._valid():
+            os.makedirs(cache_dir, exist_ok=True)
+            self._build(path)
+        self._open()
+
+    @classmethod
+    def attach(cls, location):
+        """Подключается к готовому кэшу (например, в процессе пула)"""
+        cache = cls.__new__(cls)
+        cache.location = location
+        cache._open()
+        return cache
+
+    def _valid(self):
+        try:
+            with open(self.location + ".json", encoding="utf-8") as f:
+                meta = json.load(f)
+            width, height = meta["size"]
+            return (meta.get("version") == CACHE_VERSION
+                    and os.path.getsize(self.location + ".raw") == width * height * len(meta["buffer_mode"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+
+    def _build(self, path):
+        """Декодирует шаблон и пишет пиксели в файл кэша полосами"""
+        # Плакатные шаблоны больше порога защиты Pillow от "бомб" распаковки
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            with Image.open(path) as image:
+                image.load()
+                buffer_mode, mode = storage_modes(image)
+                digest = hashlib.sha256(f"{mode}:{image.size}".encode("utf-8"))
+                with self._temp_file(".raw") as f:
+                    raw_temp = f.name
+                    try:
+                        for box in strip_boxes(image.size):
+                            strip = image.crop(box)
+                            if strip.mode != mode:
+                                strip = strip.convert(mode)
+                            digest.update(strip.tobytes())
+                            f.write(strip.tobytes("raw", buffer_mode))
+                    except BaseException:
+                        # Недописанный файл не оставляем в папке кэша
+                        f.close()
+                        os.remove(raw_temp)
+                        raise
+                meta = {
+                    "version": CACHE_VERSION,
+                    "source": os.path.abspath(path),
+                    "size": list(image.size),
+                    "mode": mode,
+                    "buffer_mode": buffer_mode,
+                    "dpi": list(image.info["dpi"]) if "dpi" in image.info else None,
+                    "pixels": digest.hexdigest(),
+                }
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+        os.replace(raw_temp, self.location + ".raw")
+        with self._temp_file(".json") as f:
+            f.write(json.dumps(meta).encode("utf-8"))
+        os.replace(f.name, self.location + ".json")
+
+    def _temp_file(self, suffix):
+        """Временный файл с уникальным именем рядом с кэшем.
+
+        Параллельные запуски на одном шаблоне пишут каждый в свой файл, а
+        готовый файл подменяется атомарно (os.replace).
+        """
+        f = tempfile.NamedTemporaryFile(dir=os.path.dirname(self.location),
+                                        prefix=os.path.basename(self.location) + ".",
+                                        suffix=suffix + ".tmp", delete=False)
+        # NamedTemporaryFile создает файл 0600, кэш должен читаться как обычные файлы
+        os.chmod(f.name, 0o644)
+        return f
+
+    def _open(self):
+        with open(self.location + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.size = tuple(meta["size"])
+        self.mode = meta["mode"]
+        self.buffer_mode = meta["buffer_mode"]
+        self.info = {"dpi": tuple(meta["dpi"])} if meta.get("dpi") else {}
+        # Хеш пикселей совпадает с image_digest декодированного шаблона того же режима
+        self.digest = meta["pixels"]
+        with open(self.location + ".raw", "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.image = Image.frombuffer(self.buffer_mode, self.size, self._mmap, "raw", self.buffer_mode, 0, 1)
+
+    def region(self, box):
+        """Копия части шаблона в режиме self.mode"""
+        region = self.image.crop(box)
+        return region if region.mode == self.mode else region.convert(self.mode)
+
+    def close(self):
+        self.image = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # На буфер еще ссылается изображение (например, в живом отрисовщике):
+            # отображение закроется вместе с ним
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TiledCanvas:
+    """Шаблон на диске с наложенными поверх плитками.
+
+    Плитка - изменяемая вырезка (прямоугольник, изображение). Новая плитка
+    создается из шаблона с уже наложенными плитками, поэтому порядок
+    рисования тот же, что на целой копии шаблона.
+    """
+
+    def __init__(self, cache, tiles=()):
+        self.cache = cache
+        self.size = cache.size
+        self.mode = cache.mode
+        self.tiles = list(tiles)
+
+    def copy(self):
+        """Холст с теми же плитками; плитки, добавленные в копию, в оригинал не попадают"""
+        return TiledCanvas(self.cache, self.tiles)
+
+    def region(self, box):
+        """Часть изображения box: шаблон с наложенными плитками"""
+        image = self.cache.region(box)
+        for tile_box, tile in self.tiles:
+            left, top = max(box[0], tile_box[0]), max(box[1], tile_box[1])
+            right, bottom = min(box[2], tile_box[2]), min(box[3], tile_box[3])
+            if left < right and top < bottom:
+                part = tile.crop((left - tile_box[0], top - tile_box[1], right - tile_box[0], bottom - tile_box[1]))
+                image.paste(part, (left - box[0], top - box[1]))
+        return image
+
+    def tile(self, box):
+        """Добавляет плитку для прямоугольника box (дробного, с запасом на сглаживание).
+
+        Возвращает (целочисленный прямоугольник, изображение) или None, если
+        box целиком за пределами шаблона.
+        """
+        box = clip_box(box, self.size)
+        if box is None:
+            return None
+        tile = (box, self.region(box))
+        self.tiles.append(tile)
+        return tile
+
+    def strips(self, height=STRIP_HEIGHT):
+        """Полосы готового изображения сверху вниз"""
+        for box in strip_boxes(self.size, height):
+            yield self.region(box)
+
+
+def _png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+def filtered_rows(strips, mode):
+    """Строки изображения с фильтром PNG Up (как в IDAT) по одной полосе за раз"""
+    previous = None
+    for strip in strips:
+        width, height = strip.size
+        # Сдвинутая на строку вниз полоса: первая строка берется из предыдущей полосы
+        above = Image.new(mode, strip.size, 0)
+        if previous is not None:
+            above.paste(previous, (0, 0))
+        if height > 1:
+            above.paste(strip.crop((0, 0, width, height - 1)), (0, 1))
+        data = ImageChops.subtract_modulo(strip, above).tobytes()
+        row_size = len(data) // height
+        yield b"".join(PNG_FILTER_UP + data[row:row + row_size] for row in range(0, len(data), row_size))
+        previous = strip.crop((0, height - 1, width, height))
+
+
+def write_png(target, size, mode, strips, compress_level=6):
+    """Пишет PNG из полос изображения в файловый объект target, не собирая его целиком"""
+    if mode not in PNG_COLOR_TYPES:
+        raise ValueError(f"Режим {mode} не поддерживается при записи полосами")
+    width, height = size
+    target.write(b"\x89PNG\r\n\x1a\n")
+    target.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, PNG_COLOR_TYPES[mode], 0, 0, 0)))
+    compressor = zlib.compressobj(compress_level)
+    for rows in filtered_rows(strips, mode):
+        data = compressor.compress(rows)
+        if data:
+            target.write(_png_chunk(b"IDAT", data))
+    target.write(_png_chunk(b"IDAT", compressor.flush()))
+    target.write(_png_chunk(b"IEND", b""))
+
+
+def encode_png(canvas, compress_level=6):
+    """PNG холста TiledCanvas в виде bytes, записанный полосами"""
+    buffer = io.BytesIO()
+    write_png(buffer, canvas.size, canvas.mode, canvas.strips(), compress_level)
+    return buffer.getvalue()
@@ -0,0 +1,217 @@
+"""План разметки: первая фаза двухфазной генерации.
+
+Фаза планирования размечает все строки списка заранее (перенос строк,
+позиции и сдвиги выравнивания) с общим кэшем измерений шрифта и пишет
+результат в компактный файл JSON Lines (сжатый gzip, если имя
+оканчивается на .gz). Фаза отрисовки принимает LayoutPlan вместо списка
+ФИО в generate_batch / generate_batch_parallel - локально, в процессах или
+на другой машине. Тот же план дает проверку выхода текста за область и
+пробный прогон без рисования.
+
+Формат файла: первая строка - заголовок (версия, настройки, отпечаток
+шрифта), далее по строке на ФИО: [номер, ФИО, [[строка, x, y, ширина], ...]]
+и, при необходимости, четвертый элемент - словарь с подобранным размером
+шрифта ("font_size"), причинами выхода за область ("overflow") и
+значениями дополнительных полей из колонок списка ("fields"; их разметка
+выполняется при отрисовке).
+
+Режим подбора batch сводится к одному размеру (fit_settings) до
+планирования, поэтому в заголовке плана записан уже итоговый размер.
+"""
+import gzip
+import json
+
+from certificate_renderer import (FontFitter, RenderSettings, calculate_text_position, fits_font,
+                                  layout_lines, load_font, roster_records, text_metrics)
+from font_resolver import font_file
+from render_manifest import file_digest
+from run_stats import get_logger
+
+
+PLAN_VERSION = 2
+
+# Сколько примеров выхода за область сохранять в сводке
+OVERFLOW_EXAMPLES = 20
+
+log = get_logger("plan")
+
+
+def open_plan_file(path, mode):
+    """Открывает файл плана как текст, gzip для имен на .gz"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class LayoutPlanner:
+    """Размечает ФИО по настройкам и проверяет, помещается ли текст"""
+
+    def __init__(self, settings, image_size=None):
+        self.settings = settings
+        self.image_size = image_size
+        self.font = load_font(settings.selected_font, settings.font_size, settings.custom_fonts)
+        self.fitter = FontFitter(settings) if fits_font(settings) else None
+
+    def layout(self, text, font=None):
+        """Список (строка, x, y, ширина) - та же разметка, что при рисовании"""
+        settings = self.settings
+        font = font or self.font
+        if settings.text_mode == "point":
+            x, y = calculate_text_position(settings)
+            return [(text, x, y, round(text_metrics(font).word_width(text)))]
+        x, y, max_width = calculate_text_position(settings)
+        return layout_lines(text, font, x, y, settings.text_alignment, max_width,
+                            settings.line_spacing)
+
+    def overflow(self, placed, font=None):
+        """Причины выхода текста за область: 'width', 'height' (пустой список - помещается)"""
+        if not placed:
+            return []
+        settings = self.settings
+        if settings.text_mode == "point":
+            if self.image_size is None:
+                return []
+            left, top, right, bottom = 0, 0, self.image_size[0], self.image_size[1]
+        else:
+            left, top, right, bottom = settings.text_box()
+        reasons = []
+        if any(x < left or x + width > right for _line, x, _y, width in placed):
+            reasons.append("width")
+        block_top = placed[0][2]
+        block_bottom = placed[-1][2] + text_metrics(font or self.font).text_height
+        if block_top < top or block_bottom > bottom:
+            reasons.append("height")
+        return reasons
+
+    def plan(self, text):
+        """(разметка, причины выхода за область, подобранный размер шрифта или None)"""
+        font = self.font
+        font_size = None
+        if self.fitter is not None:
+            font_size = self.fitter.fit_size(text)
+            font = self.fitter.font(font_size)
+        placed = self.layout(text, font)
+        return placed, self.overflow(placed, font), font_size
+
+
+class PlanSummary:
+    """Итог планирования: количество строк и строки, не помещающиеся в область"""
+
+    def __init__(self):
+        self.rows = 0
+        self.overflow = 0
+        self.examples = []
+        # Наименьший подобранный размер шрифта (при подборе размера)
+        self.smallest_font = None
+
+    def add(self, index, name, reasons, font_size=None):
+        self.rows += 1
+        if font_size is not None and (self.smallest_font is None or font_size < self.smallest_font):
+            self.smallest_font = font_size
+        if reasons:
+            self.overflow += 1
+            if len(self.examples) < OVERFLOW_EXAMPLES:
+                self.examples.append((index, name, reasons))
+
+    def describe(self):
+        lines = [f"Строк: {self.rows}, не помещаются в область: {self.overflow}"]
+        if self.smallest_font is not None:
+            lines.append(f"Наименьший подобранный размер шрифта: {self.smallest_font}")
+        for index, name, reasons in self.examples:
+            titles = ", ".join({"width": "по ширине", "height": "по высоте"}[r] for r in reasons)
+            lines.append(f"  {index + 1}: {name} ({titles})")
+        if self.overflow > len(self.examples):
+            lines.append(f"  ... и еще {self.overflow - len(self.examples)}")
+        return "\n".join(lines)
+
+
+def plan_header(planner):
+    font_path = font_file(planner.font)
+    return {
+        "plan_version": PLAN_VERSION,
+        "settings": planner.settings.to_dict(),
+        "image_size": list(planner.image_size) if planner.image_size else None,
+        "font_path": font_path,
+        "font_digest": file_digest(font_path) if font_path else None,
+    }
+
+
+def write_plan(path, names, settings, image_size=None, progress=None):
+    """Размечает все ФИО и пишет план в файл. Возвращает PlanSummary"""
+    planner = LayoutPlanner(settings, image_size)
+    summary = PlanSummary()
+    with open_plan_file(path, "w") as f:
+        f.write(json.dumps(plan_header(planner), ensure_ascii=False) + "\n")
+        for index, (name, values) in enumerate(roster_records(names)):
+            name = str(name)
+            placed, reasons, font_size = planner.plan(name)
+            row = [index, name, placed]
+            extra = {}
+            if font_size is not None:
+                extra["font_size"] = font_size
+            if reasons:
+                extra["overflow"] = reasons
+            if values:
+                extra["fields"] = values
+            if extra:
+                row.append(extra)
+            f.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n")
+            summary.add(index, name, reasons, font_size)
+            if progress:
+                progress(summary.rows, None)
+    return summary
+
+
+def dry_run(names, settings, image_size=None, progress=None):
+    """Пробный прогон: разметка и проверка всех ФИО без рисования и без файла"""
+    planner = LayoutPlanner(settings, image_size)
+    summary = PlanSummary()
+    for index, name in enumerate(names):
+        name = str(name)
+        _placed, reasons, font_size = planner.plan(name)
+        summary.add(index, name, reasons, font_size)
+        if progress:
+            progress(summary.rows, None)
+    return summary
+
+
+class LayoutPlan:
+    """План из файла; передается в generate_batch вместо списка ФИО.
+
+    Строки читаются потоком при каждом проходе.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open_plan_file(path, "r") as f:
+            self.header = json.loads(f.readline())
+        if self.header.get("plan_version") != PLAN_VERSION:
+            raise ValueError(f"Неподдерживаемая версия плана: {self.header.get('plan_version')}")
+        self.settings = RenderSettings.from_dict(self.header["settings"])
+
+    def planned_rows(self):
+        """Перебирает (номер, ФИО, разметка, размер шрифта, значения полей)"""
+        with open_plan_file(self.path, "r") as f:
+            f.readline()
+            for line in f:
+                row = json.loads(line)
+                extra = row[3] if len(row) > 3 else {}
+                yield row[0], row[1], row[2], extra.get("font_size"), extra.get("fields")
+
+    def __iter__(self):
+        for _index, name, *_layout in self.planned_rows():
+            yield name
+
+    def estimate_total(self):
+        with open_plan_file(self.path, "r") as f:
+            return max(0, sum(1 for _ in f) - 1)
+
+    def font_matches(self):
+        """True, если на этой машине выбранный шрифт - тот же файл, что при планировании"""
+        font = load_font(self.settings.selected_font, self.settings.font_size, self.settings.custom_fonts)
+        path = font_file(font)
+        digest = file_digest(path) if path else None
+        matches = digest == self.header.get("font_digest")
+        if not matches:
+            log.warning("plan font differs: planned=%s local=%s", self.header.get("font_path"), path)
+        return matches
@@ -0,0 +1,113 @@
+"""Форматы сохранения сертификатов и пресеты скорость/размер.
+
+Формат задается в настройках проекта ключами output_format, compress_level
+(PNG, 0-9) и quality (JPEG/WebP, 1-100). Пресеты заполняют эти ключи
+готовыми сочетаниями.
+"""
+import io
+import time
+
+from PIL import Image
+
+
+# Расширение файла и имя формата Pillow
+FORMATS = {
+    "png": ("png", "PNG"),
+    "jpeg": ("jpg", "JPEG"),
+    "webp": ("webp", "WEBP"),
+}
+
+# Пресеты: output_format, compress_level, quality
+OUTPUT_PRESETS = {
+    "default": {"output_format": "png", "compress_level": 6, "quality": 90},
+    "fast": {"output_format": "png", "compress_level": 1, "quality": 90},
+    "archive": {"output_format": "png", "compress_level": 9, "quality": 90},
+    "email": {"output_format": "jpeg", "compress_level": 6, "quality": 85},
+    "webp": {"output_format": "webp", "compress_level": 6, "quality": 85},
+}
+
+
+class OutputFormat:
+    """Параметры кодирования одного формата"""
+
+    def __init__(self, output_format="png", compress_level=6, quality=90):
+        if output_format not in FORMATS:
+            raise ValueError(f"Неизвестный формат: {output_format}")
+        self.output_format = output_format
+        self.compress_level = int(compress_level)
+        self.quality = int(quality)
+        self.extension, self.pil_format = FORMATS[output_format]
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.output_format, settings.compress_level, settings.quality)
+
+    @classmethod
+    def from_preset(cls, name):
+        return cls(**OUTPUT_PRESETS[name])
+
+    def save_options(self):
+        if self.output_format == "png":
+            return {"compress_level": self.compress_level}
+        if self.output_format == "jpeg":
+            return {"quality": self.quality, "subsampling": 0 if self.quality >= 90 else 2}
+        return {"quality": self.quality, "method": 4}
+
+    def prepare(self, image):
+        """Приводит изображение к режиму, который поддерживает формат"""
+        if self.output_format == "jpeg" and image.mode not in ("RGB", "L"):
+            if "A" in image.mode or "transparency" in image.info:
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image, mask=image.getchannel("A"))
+                return background
+            return image.convert("RGB")
+        if self.output_format == "webp" and image.mode not in ("RGB", "RGBA"):
+            return image.convert("RGBA" if "transparency" in image.info else "RGB")
+        return image
+
+    def save(self, image, target):
+        """Кодирует изображение в файл или файловый объект"""
+        self.prepare(image).save(target, format=self.pil_format, **self.save_options())
+
+    def encode(self, image):
+        """Возвращает закодированное изображение в виде bytes"""
+        buffer = io.BytesIO()
+        self.save(image, buffer)
+        return buffer.getvalue()
+
+    def describe(self):
+        if self.output_format == "png":
+            return f"PNG compress_level={self.compress_level}"
+        return f"{self.pil_format} quality={self.quality}"
+
+
+def compare_presets(image, presets=None, repeat=3, encode=None):
+    """Кодирует изображение каждым пресетом и возвращает время и размер.
+
+    encode(output, image) -> bytes заменяет OutputFormat.encode, например для
+    холста большого шаблона, который пишется полосами.
+    Возвращает список словарей: preset, format, seconds (лучшее из repeat), size.
+    """
+    encode = encode or (lambda output, image: output.encode(image))
+    results = []
+    for name in presets or OUTPUT_PRESETS:
+        output = OutputFormat.from_preset(name)
+        best = None
+        size = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            size = len(encode(output, image))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({"preset": name, "format": output.describe(), "seconds": best, "size": size})
+    return results
+
+
+def format_comparison(results):
+    """Текстовая таблица результатов compare_presets"""
+    lines = [f"{'Пресет':<10} {'Формат':<26} {'Время, мс':>10} {'Размер, КБ':>11}"]
+    for row in results:
+        lines.append(f"{row['preset']:<10} {row['format']:<26} "
+                     f"{row['seconds'] * 1000:>10.1f} {row['size'] / 1024:>11.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,106 @@
+"""Куда сохраняются готовые сертификаты: папка с файлами или ZIP архив.
+
+ZipSink кодирует каждый сертификат прямо в запись архива, поэтому
+промежуточные файлы на диск не пишутся. Оба приемника имеют одинаковый
+интерфейс и взаимозаменяемы в generate_batch и generate_batch_parallel.
+"""
+import os
+import zipfile
+
+from render_manifest import file_digest, stream_digest
+
+
+# Режимы сжатия записей ZIP
+ZIP_COMPRESSION = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+}
+
+
+class FolderSink:
+    """Сохраняет каждый сертификат отдельным файлом в папке"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.location = folder
+
+    def write(self, filename, image, output_format):
+        output_format.save(image, os.path.join(self.folder, filename))
+
+    def write_encoded(self, filename, data):
+        with open(os.path.join(self.folder, filename), "wb") as f:
+            f.write(data)
+
+    def open(self, filename):
+        """Файловый объект для записи сертификата по частям"""
+        return open(os.path.join(self.folder, filename), "wb")
+
+    def size(self, filename):
+        """Размер сохраненного файла в байтах"""
+        return os.path.getsize(os.path.join(self.folder, filename))
+
+    def digest(self, filename):
+        """SHA-256 сохраненного файла"""
+        return file_digest(os.path.join(self.folder, filename))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ZipSink:
+    """Пишет сертификаты записями одного ZIP архива по мере генерации.
+
+    PNG, JPEG и WebP уже сжаты, поэтому по умолчанию записи хранятся без
+    сжатия (stored); deflated уменьшает архив ценой времени.
+    """
+
+    def __init__(self, path, compression="stored", compress_level=6):
+        if compression not in ZIP_COMPRESSION:
+            raise ValueError(f"Неизвестный режим сжатия ZIP: {compression}")
+        self.path = path
+        self.location = path
+        self._zip = zipfile.ZipFile(path, "w", compression=ZIP_COMPRESSION[compression],
+                                    compresslevel=compress_level if compression == "deflated" else None)
+
+    def write(self, filename, image, output_format):
+        # Изображение кодируется сразу в поток записи архива
+        with self._zip.open(filename, "w") as entry:
+            output_format.save(image, entry)
+
+    def write_encoded(self, filename, data):
+        self._zip.writestr(filename, data)
+
+    def open(self, filename):
+        """Запись архива для записи сертификата по частям (размер заранее неизвестен)"""
+        return self._zip.open(filename, "w", force_zip64=True)
+
+    def size(self, filename):
+        """Размер записанной записи архива в байтах (без сжатия)"""
+        return self._zip.getinfo(filename).file_size
+
+    def digest(self, filename):
+        """SHA-256 записанной записи архива (без сжатия)"""
+        with self._zip.open(filename) as entry:
+            return stream_digest(entry)
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sink(target):
+    """Приемник для target: путь к папке или уже созданный приемник"""
+    if isinstance(target, (str, os.PathLike)):
+        return FolderSink(target)
+    return target
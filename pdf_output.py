@@ -0,0 +1,428 @@
+"""Вывод всех сертификатов в один PDF с векторным текстом.
+
+Шаблон (вместе с границей) встраивается один раз как общий ресурс-изображение,
+а каждое ФИО выводится на своей странице настоящим текстом встроенного
+TrueType шрифта. Страницы пишутся в файл по мере генерации, в памяти
+остаются только номера объектов страниц и набор использованных глифов.
+Шаблон на диске (TemplateCache) встраивается полосами, без целой копии в памяти.
+"""
+import io
+import os
+import struct
+import zlib
+
+from PIL import Image, ImageDraw
+
+from certificate_renderer import (FontFitter, bordered_canvas, calculate_text_position, draw_border,
+                                  field_settings, fits_font, load_font, roster_records, roster_total,
+                                  text_metrics)
+from font_resolver import font_file
+from large_template import TemplateCache
+
+
+class PdfFontError(ValueError):
+    """Шрифт нельзя встроить в PDF"""
+
+
+class TrueTypeFont:
+    """Минимальный разбор TrueType файла: cmap, ширины глифов и метрики"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.path = path
+        data = self.data
+        if data[:4] == b"ttcf":
+            raise PdfFontError("Коллекции шрифтов (.ttc) не поддерживаются для PDF, выберите .ttf файл")
+        num_tables = struct.unpack(">H", data[4:6])[0]
+        self.tables = {}
+        for i in range(num_tables):
+            tag, _checksum, offset, length = struct.unpack(">4sIII", data[12 + 16 * i:28 + 16 * i])
+            self.tables[tag.decode("latin-1")] = (offset, length)
+        if "glyf" not in self.tables:
+            raise PdfFontError("Для PDF нужен шрифт с TrueType контурами (.ttf)")
+
+        head = self._table("head")
+        self.units_per_em = struct.unpack(">H", head[18:20])[0]
+        self.bbox = struct.unpack(">hhhh", head[36:44])
+        hhea = self._table("hhea")
+        self.ascender, self.descender = struct.unpack(">hh", hhea[4:8])
+        num_h_metrics = struct.unpack(">H", hhea[34:36])[0]
+        hmtx = self._table("hmtx")
+        self.advances = [struct.unpack(">H", hmtx[4 * i:4 * i + 2])[0] for i in range(num_h_metrics)]
+        self.cmap = self._read_cmap()
+
+    def _table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    def _read_cmap(self):
+        cmap = self._table("cmap")
+        num_subtables = struct.unpack(">H", cmap[2:4])[0]
+        subtables = {}
+        for i in range(num_subtables):
+            platform, encoding, offset = struct.unpack(">HHI", cmap[4 + 8 * i:12 + 8 * i])
+            subtables[(platform, encoding)] = offset
+        for key in ((3, 10), (0, 4), (3, 1), (0, 3), (0, 1), (0, 0)):
+            if key in subtables:
+                return self._parse_cmap_subtable(cmap, subtables[key])
+        raise PdfFontError("В шрифте нет Unicode таблицы символов")
+
+    @staticmethod
+    def _parse_cmap_subtable(cmap, offset):
+        fmt = struct.unpack(">H", cmap[offset:offset + 2])[0]
+        mapping = {}
+        if fmt == 4:
+            seg_count = struct.unpack(">H", cmap[offset + 6:offset + 8])[0] // 2
+            ends_at = offset + 14
+            starts_at = ends_at + 2 * seg_count + 2
+            deltas_at = starts_at + 2 * seg_count
+            ranges_at = deltas_at + 2 * seg_count
+            for i in range(seg_count):
+                end = struct.unpack(">H", cmap[ends_at + 2 * i:ends_at + 2 * i + 2])[0]
+                start = struct.unpack(">H", cmap[starts_at + 2 * i:starts_at + 2 * i + 2])[0]
+                delta = struct.unpack(">h", cmap[deltas_at + 2 * i:deltas_at + 2 * i + 2])[0]
+                range_offset = struct.unpack(">H", cmap[ranges_at + 2 * i:ranges_at + 2 * i + 2])[0]
+                for code in range(start, min(end, 0xFFFE) + 1):
+                    if range_offset == 0:
+                        glyph = (code + delta) & 0xFFFF
+                    else:
+                        at = ranges_at + 2 * i + range_offset + 2 * (code - start)
+                        glyph = struct.unpack(">H", cmap[at:at + 2])[0]
+                        if glyph:
+                            glyph = (glyph + delta) & 0xFFFF
+                    if glyph:
+                        mapping[code] = glyph
+        elif fmt == 12:
+            num_groups = struct.unpack(">I", cmap[offset + 12:offset + 16])[0]
+            for i in range(num_groups):
+                at = offset + 16 + 12 * i
+                start, end, glyph = struct.unpack(">III", cmap[at:at + 12])
+                for code in range(start, end + 1):
+                    mapping[code] = glyph + code - start
+        else:
+            raise PdfFontError(f"Неподдерживаемый формат таблицы символов: {fmt}")
+        return mapping
+
+    def glyph(self, char):
+        return self.cmap.get(ord(char), 0)
+
+    def advance(self, glyph):
+        """Ширина глифа в единицах 1/1000 em"""
+        advances = self.advances
+        width = advances[glyph] if glyph < len(advances) else advances[-1]
+        return width * 1000 / self.units_per_em
+
+    def text_width(self, text, size):
+        return sum(self.advance(self.glyph(c)) for c in text) * size / 1000
+
+    def scaled(self, value):
+        return round(value * 1000 / self.units_per_em)
+
+
+class PdfWriter:
+    """Потоковая запись PDF: объекты пишутся сразу, в памяти только таблица смещений"""
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.offsets = {}
+        self.next_id = 1
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def reserve(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def write_object(self, obj_id, body):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(f"{obj_id} 0 obj\n".encode("ascii"))
+        self.file.write(body if isinstance(body, bytes) else body.encode("latin-1"))
+        self.file.write(b"\nendobj\n")
+
+    def write_stream(self, obj_id, data, extra="", compress=True):
+        if compress:
+            data = zlib.compress(data)
+            extra += " /Filter /FlateDecode"
+        header = f"<< /Length {len(data)}{extra} >>\nstream\n".encode("latin-1")
+        self.write_object(obj_id, header + data + b"\nendstream")
+
+    def write_stream_parts(self, obj_id, parts, extra=""):
+        """Пишет сжатый поток по частям; длина записывается отдельным объектом"""
+        length_id = self.reserve()
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(f"{obj_id} 0 obj\n<< /Length {length_id} 0 R{extra} /Filter /FlateDecode >>\nstream\n"
+                        .encode("latin-1"))
+        start = self.file.tell()
+        compressor = zlib.compressobj()
+        for part in parts:
+            self.file.write(compressor.compress(part))
+        self.file.write(compressor.flush())
+        length = self.file.tell() - start
+        self.file.write(b"\nendstream\nendobj\n")
+        self.write_object(length_id, str(length))
+
+    def close(self, root_id):
+        xref_offset = self.file.tell()
+        size = self.next_id
+        self.file.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode("ascii"))
+        for obj_id in range(1, size):
+            self.file.write(f"{self.offsets.get(obj_id, 0):010d} 00000 n \n".encode("ascii"))
+        self.file.write(f"trailer\n<< /Size {size} /Root {root_id} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+                        .encode("ascii"))
+        self.file.close()
+
+
+def pdf_color(color):
+    """'#RRGGBB' -> 'r g b' для оператора rg"""
+    from PIL import ImageColor
+
+    rgb = ImageColor.getrgb(color)[:3]
+    return " ".join(f"{c / 255:.3f}" for c in rgb)
+
+
+def hex_glyphs(font, text, used):
+    glyphs = []
+    for char in text:
+        glyph = font.glyph(char)
+        used.setdefault(glyph, char)
+        glyphs.append(f"{glyph:04X}")
+    return "<" + "".join(glyphs) + ">"
+
+
+def _flatten(image):
+    """Изображение в RGB или L; прозрачность накладывается на белый фон"""
+    if image.mode in ("RGB", "L"):
+        return image
+    if "A" in image.mode or "transparency" in image.info:
+        rgba = image.convert("RGBA")
+        flat = Image.new("RGB", image.size, "white")
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        return flat
+    return image.convert("RGB")
+
+
+def _embed_template(writer, template):
+    """Встраивает шаблон с границей как одно изображение; возвращает id объекта"""
+    if isinstance(template, TemplateCache):
+        return _embed_large_template(writer, template)
+    image = _flatten(template)
+    if image is template:
+        image = image.copy()
+    draw_border(ImageDraw.Draw(image), image.size)
+
+    width, height = image.size
+    colorspace = "/DeviceGray" if image.mode == "L" else "/DeviceRGB"
+    image_id = writer.reserve()
+    writer.write_stream(image_id, image.tobytes(),
+                        f" /Type /XObject /Subtype /Image /Width {width} /Height {height}"
+                        f" /ColorSpace {colorspace} /BitsPerComponent 8")
+    return image_id
+
+
+def _embed_large_template(writer, cache):
+    """Встраивает шаблон на диске с границей, сжимая его полосами"""
+    width, height = cache.size
+    colorspace = "/DeviceGray" if cache.mode == "L" else "/DeviceRGB"
+    image_id = writer.reserve()
+    strips = (_flatten(strip).tobytes() for strip in bordered_canvas(cache).strips())
+    writer.write_stream_parts(image_id, strips,
+                              f" /Type /XObject /Subtype /Image /Width {width} /Height {height}"
+                              f" /ColorSpace {colorspace} /BitsPerComponent 8")
+    return image_id
+
+
+def _write_font(writer, font, font_id, used):
+    """Пишет Type0 шрифт с CIDFontType2, встроенным файлом и ToUnicode"""
+    descendant_id = writer.reserve()
+    descriptor_id = writer.reserve()
+    file_id = writer.reserve()
+    to_unicode_id = writer.reserve()
+    name = "".join(c for c in os.path.splitext(os.path.basename(font.path))[0] if c.isalnum()) or "Font"
+
+    widths = " ".join(f"{glyph} [{font.advance(glyph):.0f}]" for glyph in sorted(used))
+    writer.write_object(font_id, f"<< /Type /Font /Subtype /Type0 /BaseFont /{name}"
+                                 f" /Encoding /Identity-H /DescendantFonts [{descendant_id} 0 R]"
+                                 f" /ToUnicode {to_unicode_id} 0 R >>")
+    writer.write_object(descendant_id, f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{name}"
+                                       f" /CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >>"
+                                       f" /FontDescriptor {descriptor_id} 0 R /CIDToGIDMap /Identity"
+                                       f" /W [{widths}] >>")
+    bbox = " ".join(str(font.scaled(v)) for v in font.bbox)
+    writer.write_object(descriptor_id, f"<< /Type /FontDescriptor /FontName /{name} /Flags 32"
+                                       f" /FontBBox [{bbox}] /ItalicAngle 0"
+                                       f" /Ascent {font.scaled(font.ascender)} /Descent {font.scaled(font.descender)}"
+                                       f" /CapHeight {font.scaled(font.ascender)} /StemV 80"
+                                       f" /FontFile2 {file_id} 0 R >>")
+    writer.write_stream(file_id, font.data, f" /Length1 {len(font.data)}")
+
+    entries = sorted(used.items())
+    cmap = io.StringIO()
+    cmap.write("/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+               "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+               "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+               "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n")
+    for start in range(0, len(entries), 100):
+        block = entries[start:start + 100]
+        cmap.write(f"{len(block)} beginbfchar\n")
+        for glyph, char in block:
+            cmap.write(f"<{glyph:04X}> <{char.encode('utf-16-be').hex().upper()}>\n")
+        cmap.write("endbfchar\n")
+    cmap.write("endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n")
+    writer.write_stream(to_unicode_id, cmap.getvalue().encode("ascii"))
+
+
+class _PdfTextField:
+    """Одно текстовое поле (ФИО или дополнительное) для вывода векторным текстом"""
+
+    def __init__(self, settings, fonts):
+        self.settings = settings
+        self.raster_font = load_font(settings.selected_font, settings.font_size, settings.custom_fonts)
+        # У встроенного шрифта Pillow (запасной, если файл не найден) нет файла для встраивания
+        font_path = font_file(self.raster_font)
+        if not font_path or not os.path.isfile(font_path):
+            raise PdfFontError("Не найден файл выбранного шрифта для встраивания в PDF")
+        if font_path not in fonts:
+            # Каждый файл шрифта встраивается один раз, даже если он нужен нескольким полям
+            fonts[font_path] = (TrueTypeFont(font_path), f"F{len(fonts) + 1}", {})
+        self.font, self.resource, self.used = fonts[font_path]
+        self.fitter = FontFitter(settings) if fits_font(settings) else None
+        self.color = pdf_color(settings.font_color)
+
+    def line_x(self, line, x, max_width, font_size):
+        """Левый край строки в области шириной max_width с учетом выравнивания"""
+        line_width = self.font.text_width(line, font_size)
+        if self.settings.text_alignment == "left":
+            return x
+        if self.settings.text_alignment == "right":
+            return x + max_width - line_width
+        return x + (max_width - line_width) / 2
+
+    def content(self, text, k, page_height, placed=None, font_size=None):
+        """Операторы PDF для текста; разметка совпадает с растровой генерацией.
+
+        placed и font_size - готовая разметка из плана (LayoutPlan); тогда текст не размечается.
+        """
+        settings = self.settings
+        if font_size is None:
+            font_size = self.fitter.fit_size(text) if self.fitter else settings.font_size
+        sized_font = self.fitter.font(font_size) if self.fitter else self.raster_font
+        metrics = text_metrics(sized_font)
+        # Pillow рисует строку от линии выносных элементов, PDF - от базовой линии
+        ascent = sized_font.getmetrics()[0]
+        line_height = metrics.text_height + settings.line_spacing
+        # Строки и их левые верхние углы в пикселях шаблона
+        if settings.text_mode == "point":
+            x, y = calculate_text_position(settings)
+            placed = [(text, x, y)] if placed is None else [(line, line_x, line_y)
+                                                            for line, line_x, line_y, _width in placed]
+        else:
+            x, y, max_width = calculate_text_position(settings)
+            if placed is None:
+                lines = metrics.wrap(text, max_width)
+                start_y = y - (len(lines) * line_height - settings.line_spacing) // 2
+                placed = [(line, start_y + i * line_height) for i, (line, _width) in enumerate(lines)]
+            else:
+                # Переносы и высота строк из плана; сдвиг выравнивания - по векторной ширине строки
+                placed = [(line, line_y) for line, _x, line_y, _width in placed]
+            placed = [(line, self.line_x(line, x, max_width, font_size), line_y) for line, line_y in placed]
+
+        content = [f"BT /{self.resource} {font_size * k:.2f} Tf {self.color} rg\n"]
+        for line, line_x, line_y in placed:
+            baseline = page_height - (line_y + ascent) * k
+            content.append(f"1 0 0 1 {line_x * k:.2f} {baseline:.2f} Tm {hex_glyphs(self.font, line, self.used)} Tj\n")
+        content.append("ET\n")
+        return "".join(content)
+
+
+def _pdf_rows(names):
+    """(ФИО, разметка, размер шрифта, значения полей) для списка ФИО, Roster
+    с дополнительными колонками или плана разметки (LayoutPlan)"""
+    planned_rows = getattr(names, "planned_rows", None)
+    if planned_rows is not None:
+        return ((name, placed, font_size, values) for _index, name, placed, font_size, values in planned_rows())
+    return ((str(name), None, None, values) for name, values in roster_records(names))
+
+
+def generate_pdf(template, names, settings, output_path, progress=None, total=None, dpi=None):
+    """Пишет все сертификаты в один PDF и возвращает количество страниц.
+
+    Разметка (перенос строк, позиции, выравнивание) совпадает с растровой
+    генерацией, включая подбор размера шрифта и дополнительные поля; для
+    плана разметки (LayoutPlan) ФИО выводится по строкам и размеру из плана;
+    размер страницы равен размеру шаблона при dpi шаблона (или 72, если
+    dpi не задан). Постоянные поля записываются один раз общим объектом
+    (Form XObject), на который ссылаются все страницы. template - изображение
+    или шаблон на диске (TemplateCache).
+    """
+    fonts = {}
+    name_field = _PdfTextField(settings, fonts)
+    fields = []
+    constant = []
+    for field in settings.text_fields:
+        text_field = _PdfTextField(field_settings(settings, field), fonts)
+        if field.get("column"):
+            fields.append((field["column"], text_field))
+        elif field.get("value"):
+            constant.append((str(field["value"]), text_field))
+
+    if dpi is None:
+        dpi = template.info.get("dpi", (72, 72))[0] or 72
+    k = 72.0 / dpi
+    img_width, img_height = template.size
+    page_width, page_height = img_width * k, img_height * k
+
+    writer = PdfWriter(output_path)
+    try:
+        catalog_id = writer.reserve()
+        pages_id = writer.reserve()
+        font_ids = {path: writer.reserve() for path in fonts}
+        font_dict_id = writer.reserve()
+        resources_id = writer.reserve()
+        writer.write_object(font_dict_id, "<< " + " ".join(f"/{fonts[path][1]} {font_id} 0 R"
+                                                           for path, font_id in font_ids.items()) + " >>")
+        image_id = _embed_template(writer, template)
+        background = f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im1 Do Q\n"
+        xobjects = f"/Im1 {image_id} 0 R"
+        if constant:
+            form_id = writer.reserve()
+            form = "".join(text_field.content(text, k, page_height) for text, text_field in constant)
+            writer.write_stream(form_id, form.encode("ascii"),
+                                f" /Type /XObject /Subtype /Form /BBox [0 0 {page_width:.2f} {page_height:.2f}]"
+                                f" /Resources << /Font {font_dict_id} 0 R >>")
+            background += "/Fx1 Do\n"
+            xobjects += f" /Fx1 {form_id} 0 R"
+        writer.write_object(resources_id, f"<< /Font {font_dict_id} 0 R /XObject << {xobjects} >> >>")
+
+        total = roster_total(names, total)
+        page_ids = []
+        for name, placed, font_size, values in _pdf_rows(names):
+            content = [background, name_field.content(name, k, page_height, placed, font_size)]
+            for column, text_field in fields:
+                text = values.get(column) if values else None
+                if text:
+                    content.append(text_field.content(text, k, page_height))
+
+            content_id = writer.reserve()
+            writer.write_stream(content_id, "".join(content).encode("ascii"))
+            page_id = writer.reserve()
+            writer.write_object(page_id, f"<< /Type /Page /Parent {pages_id} 0 R"
+                                         f" /MediaBox [0 0 {page_width:.2f} {page_height:.2f}]"
+                                         f" /Resources {resources_id} 0 R /Contents {content_id} 0 R >>")
+            page_ids.append(page_id)
+            if progress:
+                progress(len(page_ids), total)
+
+        for path, font_id in font_ids.items():
+            font, _resource, used = fonts[path]
+            _write_font(writer, font, font_id, used)
+        kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+        writer.write_object(pages_id, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>")
+        writer.write_object(catalog_id, f"<< /Type /Catalog /Pages {pages_id} 0 R >>")
+        writer.close(catalog_id)
+    except BaseException:
+        # Отмена или ошибка: недописанный PDF не открывается, удаляем его
+        writer.file.close()
+        os.remove(output_path)
+        raise
+    return len(page_ids)
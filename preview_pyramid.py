@@ -0,0 +1,86 @@
+"""Пирамида уменьшенных копий шаблона для предпросмотра с масштабом.
+
+Уровень 0 - сам шаблон, каждый следующий вдвое меньше (Image.reduce).
+Пирамида строится один раз при загрузке шаблона. Вид в любом масштабе
+собирается из плиток TILE_SIZE x TILE_SIZE пикселей экрана: плитка
+пересчитывается из ближайшего уровня, который не меньше нужного масштаба,
+и только для видимой части (resize с box), а затем кэшируется. Поэтому
+ни вписывание, ни приближение не масштабируют весь шаблон целиком.
+"""
+from collections import OrderedDict
+
+from PIL import Image
+
+
+# Сторона плитки вида в пикселях экрана
+TILE_SIZE = 256
+
+# Уровни уменьшаются, пока большая сторона больше этого размера
+MIN_LEVEL_SIZE = 256
+
+# Ограничение числа плиток в кэше (все масштабы вместе)
+MAX_TILES = 512
+
+
+def preview_mode(image):
+    """Режим изображения предпросмотра: RGBA для шаблонов с прозрачностью, иначе RGB"""
+    return "RGBA" if "A" in image.mode or "transparency" in image.info else "RGB"
+
+
+class ImagePyramid:
+    """Уровни шаблона (1, 1/2, 1/4, ...) и кэш плиток вида"""
+
+    def __init__(self, image):
+        self.size = image.size
+        self.mode = preview_mode(image)
+        if image.mode not in ("RGB", "RGBA", "RGBX", "L"):
+            # Палитра и прочие режимы не сглаживаются при уменьшении
+            image = image.convert(self.mode)
+        self.levels = [image]
+        while max(self.levels[-1].size) > MIN_LEVEL_SIZE:
+            self.levels.append(self.levels[-1].reduce(2))
+        self._tiles = OrderedDict()
+
+    def scaled_size(self, scale):
+        """Размер всего шаблона в масштабе scale"""
+        return max(1, round(self.size[0] * scale)), max(1, round(self.size[1] * scale))
+
+    def level_for(self, scale):
+        """Номер самого маленького уровня, который не меньше масштаба scale"""
+        level = 0
+        while level + 1 < len(self.levels) and scale <= 0.5 ** (level + 1):
+            level += 1
+        return level
+
+    def tile(self, scale, column, row):
+        """Плитка вида в масштабе scale с номером (column, row)"""
+        key = (scale, column, row)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+
+        width, height = self.scaled_size(scale)
+        left, top = column * TILE_SIZE, row * TILE_SIZE
+        right, bottom = min(width, left + TILE_SIZE), min(height, top + TILE_SIZE)
+        level = self.levels[self.level_for(scale)]
+        # Пиксели экрана -> координаты уровня (размер уровня округляется вверх при reduce)
+        kx, ky = level.width / width, level.height / height
+        tile = level.resize((right - left, bottom - top), Image.Resampling.LANCZOS,
+                            box=(left * kx, top * ky, right * kx, bottom * ky))
+        if tile.mode != self.mode:
+            tile = tile.convert(self.mode)
+
+        self._tiles[key] = tile
+        while len(self._tiles) > MAX_TILES:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def view(self, scale, box):
+        """Часть вида в масштабе scale; box - прямоугольник в пикселях экрана внутри scaled_size"""
+        left, top, right, bottom = box
+        view = Image.new(self.mode, (right - left, bottom - top))
+        for row in range(top // TILE_SIZE, (bottom - 1) // TILE_SIZE + 1):
+            for column in range(left // TILE_SIZE, (right - 1) // TILE_SIZE + 1):
+                view.paste(self.tile(scale, column, row), (column * TILE_SIZE - left, row * TILE_SIZE - top))
+        return view
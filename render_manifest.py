@@ -0,0 +1,145 @@
+"""Манифест папки с сертификатами для продолжения и дополнения генерации.
+
+Для каждого файла в манифест записывается ключ: хеш от ФИО (и значений
+дополнительных полей), настроек
+разметки и формата, отпечатка файла шрифта и хеша шаблона. При повторной
+генерации в ту же папку файлы с совпадающим ключом пропускаются, поэтому
+после сбоя или исправления опечатки в списке перерисовываются только
+недостающие и измененные строки.
+
+Манифест - файл JSON Lines: запись добавляется сразу после сохранения
+сертификата, так что прерванный запуск теряет не больше одного файла.
+"""
+import hashlib
+import json
+import os
+
+
+MANIFEST_NAME = ".certgen_manifest.jsonl"
+
+MANIFEST_VERSION = 1
+
+# Настройки, которые не влияют на пиксели (шаблон и шрифт учитываются по содержимому)
+UNKEYED_SETTINGS = ("template_path", "excel_path", "custom_fonts")
+
+# Ключ шрифта, когда файла нет и используется встроенный шрифт Pillow
+BUILTIN_FONT_KEY = "builtin"
+
+
+def stream_digest(f):
+    """SHA-256 содержимого открытого на чтение файлового объекта"""
+    digest = hashlib.sha256()
+    for block in iter(lambda: f.read(1 << 20), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """SHA-256 содержимого файла"""
+    with open(path, "rb") as f:
+        return stream_digest(f)
+
+
+def image_digest(image):
+    """SHA-256 декодированных пикселей изображения вместе с режимом и размером"""
+    digest = hashlib.sha256(f"{image.mode}:{image.size}".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def batch_fingerprint(template, settings_data, font_path):
+    """Общая для всего запуска часть ключа: шаблон, настройки и шрифт.
+
+    template - изображение или уже посчитанный хеш его пикселей (TemplateCache.digest).
+    font_path - файл шрифта; None (или BytesIO встроенного шрифта) - встроенный шрифт Pillow.
+    """
+    layout = {key: value for key, value in settings_data.items() if key not in UNKEYED_SETTINGS}
+    parts = {
+        "version": MANIFEST_VERSION,
+        "template": template if isinstance(template, str) else image_digest(template),
+        "settings": layout,
+        "font": file_digest(font_path) if isinstance(font_path, (str, os.PathLike)) else BUILTIN_FONT_KEY,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def render_key(fingerprint, name, values=None):
+    """Ключ одного сертификата; values - значения дополнительных полей строки"""
+    text = f"{fingerprint}\0{name}"
+    if values:
+        text += "\0" + json.dumps(values, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RenderManifest:
+    """Манифест папки: имя файла -> ключ, с дозаписью по мере генерации"""
+
+    def __init__(self, folder, reset=False):
+        """reset=True забывает прежние записи: все сертификаты будут нарисованы заново"""
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.entries = {} if reset else self._read()
+        self.seen = set()
+        self.skipped = 0
+        self.rendered = 0
+        self._file = open(self.path, "w" if reset else "a", encoding="utf-8")
+
+    def _read(self):
+        entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # оборванная последняя строка после сбоя
+                    entries[entry["file"]] = entry["key"]
+        except OSError:
+            pass
+        return entries
+
+    def is_current(self, filename, key):
+        """True, если файл уже сгенерирован с тем же ключом (и отмечает его как актуальный)"""
+        current = (self.entries.get(filename) == key
+                   and os.path.isfile(os.path.join(self.folder, filename)))
+        if current:
+            self.seen.add(filename)
+            self.skipped += 1
+        return current
+
+    def keep(self, filename):
+        """Отмечает файл, который рисует другая часть (--shard), чтобы finish() его не удалил"""
+        self.seen.add(filename)
+
+    def record(self, filename, key):
+        """Записывает сохраненный файл в манифест"""
+        self.entries[filename] = key
+        self.seen.add(filename)
+        self.rendered += 1
+        self._file.write(json.dumps({"file": filename, "key": key}, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def finish(self):
+        """После полного прохода удаляет устаревшие файлы и переписывает манифест"""
+        for filename in set(self.entries) - self.seen:
+            try:
+                os.remove(os.path.join(self.folder, filename))
+            except OSError:
+                pass
+            del self.entries[filename]
+        self._file.close()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for filename, key in self.entries.items():
+                f.write(json.dumps({"file": filename, "key": key}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,658 @@
+"""Локальный HTTP сервис: один сертификат по запросу без запуска программы.
+
+Сервис работает постоянно. Рисуют и кодируют сертификаты процессы пула
+(--workers), а не потоки: отрисовка занимает процессор, и потоки одного
+процесса делили бы GIL. Каждый процесс держит в памяти готовые отрисовщики
+(декодированный шаблон с запеченными постоянными полями и загруженные
+шрифты) и декодированные шаблоны в ограниченных LRU кэшах, поэтому запрос
+платит только за рисование ФИО, кодирование и передачу файла из процесса.
+Разобранные проекты кэширует основной процесс. Изменение файла проекта или
+шаблона замечается по времени изменения и размеру и загружается заново.
+
+Проект - JSON файл из папки --projects (кнопка "Сохранить настройки"),
+его id - имя файла без .json. Отрисовка та же, что в generate_batch.
+
+Пример:
+    python render_service.py serve --projects projects/ --port 8765
+    curl -o cert.png "http://127.0.0.1:8765/render?project=olymp&name=Иванов+Иван"
+    python render_service.py load-test --requests 500 --concurrency 8
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from certificate_renderer import RenderSettings, make_renderer, open_template
+from output_formats import OUTPUT_PRESETS, OutputFormat
+from run_stats import configure_logging, get_logger
+
+
+log = get_logger("render_service")
+
+# Размеры кэшей по умолчанию: разобранные проекты, готовые отрисовщики, декодированные шаблоны
+SETTINGS_CACHE_SIZE = 64
+PROJECT_CACHE_SIZE = 16
+TEMPLATE_CACHE_SIZE = 8
+
+# Сколько запросов может ждать свободного процесса отрисовки на каждый процесс
+QUEUE_PER_WORKER = 4
+
+# Сколько секунд запрос ждет места в очереди, прежде чем получить 503
+QUEUE_TIMEOUT = 5
+
+# Сколько последних запросов учитывается в задержках /stats
+LATENCY_WINDOW = 10000
+
+CONTENT_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+# id проекта - имя файла без пути
+PROJECT_ID_PATTERN = re.compile(r"^[\w-][\w.-]*$")
+
+
+class ServiceError(Exception):
+    """Ошибка запроса с HTTP статусом ответа"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ProjectLoadError(Exception):
+    """Процесс отрисовки не смог открыть проект или шаблон"""
+
+
+class LRUCache:
+    """Потокобезопасный LRU кэш с загрузкой при промахе.
+
+    Один ключ загружается одним потоком: остальные ждут его результат,
+    а загрузки других ключей идут параллельно.
+    """
+
+    def __init__(self, capacity, loader):
+        self.capacity = capacity
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return True, self._items[key]
+            return False, self._loading.setdefault(key, threading.Lock())
+
+    def get(self, key):
+        found, value = self._lookup(key)
+        if found:
+            return value
+        with value:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            try:
+                value = self.loader(key)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            with self._lock:
+                self.misses += 1
+                self._items[key] = value
+                while len(self._items) > self.capacity:
+                    self._items.popitem(last=False)
+            return value
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._items), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+
+def file_stamp(path):
+    """Отметка версии файла для ключа кэша: время изменения и размер"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def percentile(values, fraction):
+    """Значение из отсортированного списка на доле fraction (0..1)"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def latency_summary(latencies):
+    """Задержки в мс: p50, p90, p99, max и среднее"""
+    values = sorted(latencies)
+    if not values:
+        return {}
+    return {
+        "p50_ms": round(percentile(values, 0.5), 2),
+        "p90_ms": round(percentile(values, 0.9), 2),
+        "p99_ms": round(percentile(values, 0.99), 2),
+        "max_ms": round(values[-1], 2),
+        "mean_ms": round(sum(values) / len(values), 2),
+    }
+
+
+def check_values(values):
+    """Проверяет значения колонок дополнительных полей: None или словарь строка -> строка"""
+    if values is None:
+        return
+    if not isinstance(values, dict):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "values должен быть объектом {колонка: текст}")
+    for column, text in values.items():
+        if not isinstance(text, str):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"Значение колонки {column!r} должно быть строкой")
+
+
+class ProjectRenderer:
+    """Готовый к работе проект: настройки, отрисовщик и формат"""
+
+    def __init__(self, settings, renderer):
+        self.settings = settings
+        self.renderer = renderer
+        self.output_format = OutputFormat.from_settings(settings)
+        self.content_type = CONTENT_TYPES[self.output_format.output_format]
+
+    def render(self, name, values=None):
+        """Закодированный сертификат для одного ФИО"""
+        return self.output_format.encode(self.renderer.render(name, values=values))
+
+
+# Состояние процесса отрисовки: свои кэши шаблонов и готовых проектов
+_worker_templates = None
+_worker_projects = None
+
+
+def _init_render_worker(project_cache_size, template_cache_size):
+    """Инициализирует процесс пула: пустые кэши шаблонов и проектов"""
+    global _worker_templates, _worker_projects
+    _worker_templates = LRUCache(template_cache_size, _load_worker_template)
+    _worker_projects = LRUCache(project_cache_size, _load_worker_project)
+
+
+def _load_worker_template(key):
+    path, _stamp = key
+    log.info("template load: %s (pid %d)", path, os.getpid())
+    return open_template(path)
+
+
+def _load_worker_project(key):
+    settings_key, template_key = key
+    log.info("project load: %s (pid %d)", settings_key[0], os.getpid())
+    settings = RenderSettings.load(settings_key[0])
+    return ProjectRenderer(settings, make_renderer(_worker_templates.get(template_key), settings))
+
+
+def _render_in_worker(key, name, values):
+    """Рисует сертификат в процессе пула.
+
+    key - (ключ проекта, ключ шаблона) из RenderService.project. Возвращает
+    (закодированный сертификат, pid, статистика кэшей процесса).
+    """
+    try:
+        project = _worker_projects.get(key)
+    except (OSError, ValueError) as e:
+        raise ProjectLoadError(str(e))
+    data = project.render(name, values)
+    return data, os.getpid(), {"project_cache": _worker_projects.stats(),
+                               "template_cache": _worker_templates.stats()}
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def merge_cache_stats(worker_stats):
+    """Сумма статистики одноименных кэшей всех процессов отрисовки"""
+    merged = {}
+    for caches in worker_stats:
+        for cache, values in caches.items():
+            total = merged.setdefault(cache, {"size": 0, "capacity": 0, "hits": 0, "misses": 0})
+            for key in total:
+                total[key] += values[key]
+    return merged
+
+
+class RenderService:
+    """Кэш проектов и пул процессов отрисовки, у каждого свои кэши шаблонов и отрисовщиков"""
+
+    def __init__(self, projects_dir, workers=0, project_cache_size=PROJECT_CACHE_SIZE,
+                 template_cache_size=TEMPLATE_CACHE_SIZE):
+        self.projects_dir = projects_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.settings = LRUCache(max(SETTINGS_CACHE_SIZE, project_cache_size), self._load_settings)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_render_worker,
+                                         initargs=(project_cache_size, template_cache_size))
+        # Процессы запускаются сразу, до потоков HTTP сервера: fork из процесса
+        # с потоками может унаследовать чужие захваченные блокировки
+        for future in [self._pool.submit(_worker_ready) for _ in range(self.workers)]:
+            future.result()
+        # Ограничение очереди: лишние запросы ждут QUEUE_TIMEOUT и получают 503, а не копят память
+        self._slots = threading.BoundedSemaphore(self.workers * (1 + QUEUE_PER_WORKER))
+        self._worker_caches = {}
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+        self.served = 0
+        self.errors = 0
+        self.rejected = 0
+
+    def project_path(self, project_id):
+        if not project_id or not PROJECT_ID_PATTERN.match(project_id):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"Неверный id проекта: {project_id!r}")
+        path = os.path.join(self.projects_dir, project_id + ".json")
+        if not os.path.isfile(path):
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"Проект не найден: {project_id}")
+        return path
+
+    def template_path(self, project_path, settings):
+        """Путь к шаблону: относительный ищется рядом с проектом, затем от текущей папки"""
+        path = settings.template_path
+        if not path:
+            raise ServiceError(HTTPStatus.UNPROCESSABLE_ENTITY, "В проекте не указан шаблон сертификата")
+        nearby = os.path.join(os.path.dirname(project_path), path)
+        return nearby if os.path.isfile(nearby) else path
+
+    def _load_settings(self, key):
+        """(настройки, абсолютный путь к шаблону) проекта"""
+        path, _stamp = key
+        settings = RenderSettings.load(path)
+        return settings, os.path.abspath(self.template_path(path, settings))
+
+    def project(self, project_id):
+        """(ключ для процессов отрисовки, настройки) проекта.
+
+        Ключ - отметки версий файлов проекта и шаблона: измененный проект или
+        шаблон процесс загрузит заново. На запрос с теплым кэшем приходится
+        только два stat: файла проекта и шаблона.
+        """
+        path = self.project_path(project_id)
+        try:
+            settings_key = (path, file_stamp(path))
+            settings, template_path = self.settings.get(settings_key)
+            template_key = (template_path, file_stamp(template_path))
+        except (OSError, ValueError) as e:
+            raise ServiceError(HTTPStatus.UNPROCESSABLE_ENTITY, f"Не удалось открыть проект {project_id}: {e}")
+        return (settings_key, template_key), settings
+
+    def render(self, project_id, name, values=None):
+        """(байты изображения, Content-Type); рисует процесс пула"""
+        if not isinstance(name, str) or not name.strip():
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Не указано ФИО (name)")
+        check_values(values)
+        if not self._slots.acquire(timeout=QUEUE_TIMEOUT):
+            with self._stats_lock:
+                self.rejected += 1
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "Сервис перегружен, повторите запрос позже")
+        started = time.perf_counter()
+        try:
+            key, settings = self.project(project_id)
+            data, pid, caches = self._pool.submit(_render_in_worker, key, name, values).result()
+        except ProjectLoadError as e:
+            with self._stats_lock:
+                self.errors += 1
+            raise ServiceError(HTTPStatus.UNPROCESSABLE_ENTITY, f"Не удалось открыть проект {project_id}: {e}")
+        except ServiceError:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        except Exception as e:
+            log.exception("render failed: project=%s", project_id)
+            with self._stats_lock:
+                self.errors += 1
+            raise ServiceError(HTTPStatus.INTERNAL_SERVER_ERROR, f"Ошибка отрисовки: {e}")
+        finally:
+            self._slots.release()
+        with self._stats_lock:
+            self.served += 1
+            self._latencies.append((time.perf_counter() - started) * 1000)
+            self._worker_caches[pid] = caches
+        return data, CONTENT_TYPES[settings.output_format]
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = list(self._latencies)
+            counters = {"served": self.served, "errors": self.errors, "rejected": self.rejected}
+            worker_caches = merge_cache_stats(self._worker_caches.values())
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "workers": self.workers,
+            **counters,
+            "latency": latency_summary(latencies),
+            "settings_cache": self.settings.stats(),
+            # Сумма по процессам отрисовки, ответившим хотя бы на один запрос
+            **worker_caches,
+        }
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """GET /render?project=&name=&<колонка>=..., POST /render (JSON), GET /health, GET /stats"""
+
+    server_version = "CertGenRender/1"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+    def send_body(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, value):
+        self.send_body(status, json.dumps(value, ensure_ascii=False).encode("utf-8"),
+                       "application/json; charset=utf-8")
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/health":
+            self.send_json(HTTPStatus.OK, {"status": "ok"})
+        elif url.path == "/stats":
+            self.send_json(HTTPStatus.OK, self.server.service.stats())
+        elif url.path == "/render":
+            query = dict(urllib.parse.parse_qsl(url.query))
+            project_id = query.pop("project", None)
+            name = query.pop("name", None)
+            # Остальные параметры - значения колонок для дополнительных полей
+            self.respond_render(project_id, name, query or None)
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Неизвестный путь: {url.path}"})
+
+    def do_POST(self):
+        if urllib.parse.urlsplit(self.path).path != "/render":
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Неизвестный путь: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+            if not isinstance(body, dict):
+                raise ValueError("ожидается JSON объект")
+        except ValueError as e:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": f"Неверное тело запроса: {e}"})
+            return
+        self.respond_render(body.get("project"), body.get("name"), body.get("values"))
+
+    def respond_render(self, project_id, name, values):
+        try:
+            data, content_type = self.server.service.render(project_id, name, values)
+        except ServiceError as e:
+            self.send_json(e.status, {"error": str(e)})
+            return
+        self.send_body(HTTPStatus.OK, data, content_type)
+
+
+class RenderServer(ThreadingHTTPServer):
+    """HTTP сервер с RenderService; каждое соединение обслуживается своим потоком"""
+
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, RenderRequestHandler)
+        self.service = service
+
+
+def start_server(service, host="127.0.0.1", port=0):
+    """Запускает сервер в фоновом потоке; port=0 - свободный порт. Возвращает сервер"""
+    server = RenderServer((host, port), service)
+    threading.Thread(target=server.serve_forever, name="render-server", daemon=True).start()
+    return server
+
+
+def fetch(url, data=None):
+    """(HTTP статус, тело ответа) запроса к сервису"""
+    request = urllib.request.Request(url, data=data)
+    if data is not None:
+        request.add_header("Content-Type", "application/json")
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def render_url(base_url, project_id, name):
+    return f"{base_url}/render?" + urllib.parse.urlencode({"project": project_id, "name": name})
+
+
+def first_request(base_url, project_id, name):
+    """Время первого запроса в мс: холодный старт проекта (чтение проекта,
+    декодирование шаблона, загрузка шрифта)"""
+    started = time.perf_counter()
+    status, body = fetch(render_url(base_url, project_id, name))
+    if status != HTTPStatus.OK:
+        raise ServiceError(status, body.decode("utf-8", "replace"))
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def run_load_test(base_url, project_id, names, requests, concurrency):
+    """Шлет requests запросов в concurrency потоков, возвращает задержки и пропускную способность"""
+
+    def one(i):
+        begin = time.perf_counter()
+        status, body = fetch(render_url(base_url, project_id, names[i % len(names)]))
+        return status, (time.perf_counter() - begin) * 1000, len(body)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    ok = [(ms, size) for status, ms, size in results if status == HTTPStatus.OK]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "failed": requests - len(ok),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "latency": latency_summary([ms for ms, _size in ok]),
+        "mean_bytes": round(sum(size for _ms, size in ok) / len(ok)) if ok else None,
+    }
+
+
+def run_cold_processes(projects_dir, project_id, names, runs):
+    """Время отрисовки одного сертификата новым процессом (как запуск программы на каждый запрос)"""
+    script = os.path.abspath(__file__)
+    timings = []
+    with tempfile.TemporaryDirectory(prefix="certgen-cold-") as work_dir:
+        for i in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, script, "render", project_id, names[i % len(names)],
+                            "--projects", projects_dir, "--output", os.path.join(work_dir, "cert")],
+                           check=True, capture_output=True)
+            timings.append((time.perf_counter() - started) * 1000)
+    return {"runs": runs, "latency": latency_summary(timings)}
+
+
+def synthetic_project(work_dir, template_name, preset="default", seed=0):
+    """Проект benchmark.py (синтетический шаблон, режим области) в work_dir; возвращает id"""
+    from benchmark import TEMPLATES, synthetic_template, template_settings
+
+    size = TEMPLATES[template_name]
+    template_path = os.path.join(work_dir, "template.png")
+    synthetic_template(size, seed=seed).save(template_path)
+    settings = template_settings(size, "area", "DejaVuSans", preset)
+    settings.template_path = template_path
+    project_id = f"bench-{template_name}-{preset}"
+    with open(os.path.join(work_dir, project_id + ".json"), "w", encoding="utf-8") as f:
+        json.dump(settings.to_dict(), f, ensure_ascii=False)
+    return project_id
+
+
+def run_service_test(base_url, project_id, names, args):
+    """Первый запрос и прогоны с теплым кэшем для каждого числа клиентов"""
+    return {
+        "cold_first_ms": first_request(base_url, project_id, names[0]),
+        "warm": [run_load_test(base_url, project_id, names, args.requests, concurrency)
+                 for concurrency in args.concurrency],
+    }
+
+
+def load_test(args):
+    from benchmark import environment_info, synthetic_names
+
+    names = synthetic_names(max(args.requests, 1), seed=args.seed)
+    with tempfile.TemporaryDirectory(prefix="certgen-service-") as work_dir:
+        projects_dir, project_id = args.projects, args.project
+        if not project_id:
+            projects_dir = work_dir
+            project_id = synthetic_project(work_dir, args.template, args.preset, seed=args.seed)
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": environment_info(),
+            "project": project_id,
+            "runs": [],
+        }
+        if args.url:
+            report["runs"].append({"service_workers": None,
+                                   **run_service_test(args.url, project_id, names, args)})
+        else:
+            # Новый сервис на каждое число процессов: первый запрос каждый раз с холодным кэшем
+            for workers in args.workers:
+                service = RenderService(projects_dir, workers=workers)
+                server = start_server(service)
+                try:
+                    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+                    run = {"service_workers": service.workers, **run_service_test(base_url, project_id, names, args)}
+                    run["service"] = service.stats()
+                finally:
+                    server.shutdown()
+                    server.server_close()
+                    service.close()
+                report["runs"].append(run)
+        if args.cold_runs:
+            report["cold_process"] = run_cold_processes(projects_dir, project_id, names, args.cold_runs)
+    return report
+
+
+def format_load_test(report):
+    lines = [f"Проект {report['project']}"]
+    for run in report["runs"]:
+        workers = run["service_workers"]
+        lines.append(f"  процессов отрисовки: {workers if workers is not None else 'сервис по --url'}")
+        lines.append(f"    первый запрос (холодный кэш): {run['cold_first_ms']} мс")
+        for warm in run["warm"]:
+            lines.append(f"    теплый кэш, {warm['concurrency']} одновременно: {warm['ok']}/{warm['requests']} "
+                         f"запросов, {warm['throughput_rps']} запросов/с, "
+                         + ", ".join(f"{key[:-3]} {value} мс" for key, value in warm["latency"].items()))
+    if "cold_process" in report:
+        cold = report["cold_process"]["latency"]
+        lines.append(f"  новый процесс на запрос: p50 {cold['p50_ms']} мс, max {cold['max_ms']} мс")
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Локальный HTTP сервис отрисовки сертификатов")
+    parser.add_argument("--log-level", default="WARNING",
+                        choices=("DEBUG", "INFO", "WARNING", "ERROR"), help="Уровень журнала в stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Запустить сервис")
+    serve.add_argument("--projects", default=".", help="Папка с JSON файлами проектов (id - имя без .json)")
+    serve.add_argument("--host", default="127.0.0.1", help="Адрес (по умолчанию только локальный)")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--workers", type=int, default=0, help="Процессов отрисовки (0 - по числу ядер)")
+    serve.add_argument("--project-cache", type=int, default=PROJECT_CACHE_SIZE,
+                       help="Сколько проектов держать готовыми")
+    serve.add_argument("--template-cache", type=int, default=TEMPLATE_CACHE_SIZE,
+                       help="Сколько декодированных шаблонов держать в памяти")
+
+    render = commands.add_parser("render", help="Нарисовать один сертификат и выйти (без сервиса)")
+    render.add_argument("project", help="id проекта")
+    render.add_argument("name", help="ФИО")
+    render.add_argument("--projects", default=".", help="Папка с JSON файлами проектов")
+    render.add_argument("--output", required=True, help="Файл (расширение добавляется по формату)")
+
+    test = commands.add_parser("load-test", help="Нагрузочный тест: задержки и пропускная способность")
+    test.add_argument("--url", help="Адрес работающего сервиса; без него сервис запускается в этом процессе")
+    test.add_argument("--projects", default=".", help="Папка проектов для встроенного сервиса")
+    test.add_argument("--project", help="id проекта; без него создается синтетический проект benchmark.py")
+    test.add_argument("--template", default="1080p", choices=("1080p", "4k", "a4-300dpi"),
+                      help="Синтетический шаблон, если --project не указан")
+    test.add_argument("--preset", default="default", choices=sorted(OUTPUT_PRESETS),
+                      help="Пресет формата синтетического проекта")
+    test.add_argument("--requests", type=int, default=500, help="Запросов в каждом прогоне")
+    test.add_argument("--concurrency", type=int, nargs="+", default=[1, 8],
+                      help="Одновременных клиентов; несколько значений - несколько прогонов")
+    test.add_argument("--workers", type=int, nargs="+", default=[0],
+                      help="Процессов отрисовки встроенного сервиса (0 - по числу ядер); несколько значений - "
+                           "прогон на каждое")
+    test.add_argument("--cold-runs", type=int, default=5,
+                      help="Сколько раз нарисовать сертификат новым процессом для сравнения (0 - не сравнивать)")
+    test.add_argument("--seed", type=int, default=0)
+    test.add_argument("--output", default="-", help="JSON отчет (по умолчанию stdout)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.log_level != "WARNING":
+        configure_logging(args.log_level)
+
+    if args.command == "serve":
+        service = RenderService(args.projects, workers=args.workers, project_cache_size=args.project_cache,
+                                template_cache_size=args.template_cache)
+        server = RenderServer((args.host, args.port), service)
+        print(f"Сервис отрисовки: http://{args.host}:{server.server_address[1]}/render?project=...&name=... "
+              f"(процессов: {service.workers})", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.close()
+        return 0
+
+    if args.command == "render":
+        service = RenderService(args.projects, workers=1)
+        try:
+            _key, settings = service.project(args.project)
+            data, _content_type = service.render(args.project, args.name)
+        except ServiceError as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            return 1
+        finally:
+            service.close()
+        with open(f"{args.output}.{OutputFormat.from_settings(settings).extension}", "wb") as f:
+            f.write(data)
+        return 0
+
+    try:
+        report = load_test(args)
+    except ServiceError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(format_load_test(report), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Потоковое чтение колонки "ФИО" из Excel и CSV файлов.
+
+xlsx читается через openpyxl в режиме read-only построчно, CSV - модулем csv
+по строкам. Из каждой строки берется только колонка "ФИО", поэтому память
+не растет с размером файла, а генерация начинается с первых строк.
+"""
+import csv
+import os
+from datetime import date, datetime
+
+
+NAME_COLUMN = "ФИО"
+
+
+class RosterError(ValueError):
+    """Ошибка чтения файла с ФИО"""
+
+
+def find_name_column(header, column=NAME_COLUMN):
+    """Возвращает номер колонки с точным названием column (без учета пробелов по краям)"""
+    for index, title in enumerate(header):
+        if title is not None and str(title).strip() == column:
+            return index
+    raise RosterError(f"Не найдена колонка '{column}' в файле. Убедитесь, что в файле есть колонка с точным названием '{column}'.")
+
+
+def is_empty(value):
+    """Пустая ячейка: None, пустая строка или NaN"""
+    return value is None or value == "" or (isinstance(value, float) and value != value)
+
+
+def cell_text(value):
+    """Текст ячейки для вывода на сертификате: даты как ДД.ММ.ГГГГ, целые без .0"""
+    if is_empty(value):
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%d.%m.%Y")
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+class Roster:
+    """Список ФИО из файла, читаемый лениво при каждом проходе.
+
+    Итерация дает только ФИО; records() дает ФИО вместе со значениями
+    колонок extra_columns (для дополнительных полей сертификата).
+    """
+
+    def __init__(self, path, column=NAME_COLUMN, extra_columns=()):
+        self.path = path
+        self.column = column
+        self.extra_columns = [c for c in dict.fromkeys(extra_columns) if c != column]
+        self.kind = self._detect_kind(path)
+        # Проверяем заголовок сразу, чтобы ошибка появилась до начала генерации
+        with self._open_rows() as rows:
+            header = next(rows, [])
+            self.column_index = find_name_column(header, column)
+            self.extra_indexes = [find_name_column(header, c) for c in self.extra_columns]
+
+    @staticmethod
+    def _detect_kind(path):
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".csv":
+            return "csv"
+        if ext in (".xlsx", ".xlsm"):
+            return "xlsx"
+        return "excel"
+
+    def _open_rows(self, column_index=None, columns=None):
+        return _RowSource(self.path, self.kind, column_index, columns)
+
+    def __iter__(self):
+        with self._open_rows(self.column_index) as rows:
+            next(rows, None)  # заголовок
+            # xlsx отдает только нужную колонку, остальные форматы - строку целиком
+            index = 0 if self.kind == "xlsx" else self.column_index
+            for row in rows:
+                if index < len(row) and not is_empty(row[index]):
+                    yield row[index]
+
+    def records(self):
+        """Перебирает пары (ФИО, {колонка: текст}) для колонок extra_columns"""
+        if not self.extra_columns:
+            for name in self:
+                yield name, None
+            return
+        columns = sorted({self.column_index, *self.extra_indexes})
+        with self._open_rows(columns=columns) as rows:
+            next(rows, None)  # заголовок
+            for row in rows:
+                if self.column_index >= len(row) or is_empty(row[self.column_index]):
+                    continue
+                yield row[self.column_index], {
+                    column: cell_text(row[index]) if index < len(row) else ""
+                    for column, index in zip(self.extra_columns, self.extra_indexes)
+                }
+
+    def estimate_total(self):
+        """Примерное количество строк данных (для прогресс бара) или None"""
+        if self.kind == "xlsx":
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(self.path, read_only=True, data_only=True)
+            try:
+                max_row = workbook.active.max_row
+            finally:
+                workbook.close()
+            return max(0, max_row - 1) if max_row else None
+        if self.kind == "csv":
+            # Подсчет переводов строк по блокам - без разбора CSV
+            count = 0
+            last = b"\n"
+            with open(self.path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    count += block.count(b"\n")
+                    last = block[-1:]
+            if last != b"\n":
+                count += 1
+            return max(0, count - 1)
+        return None
+
+
+class _RowSource:
+    """Контекстный менеджер, выдающий строки файла как последовательности значений.
+
+    column_index - xlsx отдает только эту колонку; columns - номера колонок,
+    которые нужны вызывающему коду (pandas читает только их, остальные None).
+    """
+
+    def __init__(self, path, kind, column_index=None, columns=None):
+        self.path = path
+        self.kind = kind
+        self.column_index = column_index
+        self.columns = columns
+        self._close = None
+
+    def __enter__(self):
+        if self.kind == "csv":
+            f = open(self.path, "r", encoding="utf-8-sig", newline="")
+            self._close = f.close
+            return iter(csv.reader(f))
+        if self.kind == "xlsx":
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(self.path, read_only=True, data_only=True)
+            self._close = workbook.close
+            if self.column_index is None:
+                return iter(workbook.active.iter_rows(values_only=True))
+            column = self.column_index + 1
+            return iter(workbook.active.iter_rows(min_col=column, max_col=column, values_only=True))
+        # .xls и прочие форматы - через pandas, но только нужные колонки
+        import pandas as pd
+
+        header = pd.read_excel(self.path, nrows=0).columns.tolist()
+        if self.columns is None and self.column_index is None:
+            # Нужен только заголовок (проверка колонок)
+            return iter([header])
+        columns = sorted(self.columns or [self.column_index])
+        df = pd.read_excel(self.path, usecols=columns)
+        width = columns[-1] + 1
+
+        def padded(values):
+            row = [None] * width
+            for index, value in zip(columns, values):
+                row[index] = value
+            return row
+
+        rows = [padded([header[index] for index in columns])]
+        rows.extend(padded(values) for values in df.itertuples(index=False))
+        return iter(rows)
+
+    def __exit__(self, *exc):
+        if self._close:
+            self._close()
+
+
+def read_names(path):
+    """Читает весь список ФИО из Excel или CSV файла"""
+    names = list(Roster(path))
+    if not names:
+        raise RosterError("Не найдены данные в Excel файле")
+    return names
@@ -0,0 +1,44 @@
+"""Отмена и пауза генерации, запущенной в фоновом потоке.
+
+Поток генерации вызывает checkpoint() между сертификатами (например, из
+progress); управляющий поток вызывает pause(), resume() и cancel().
+"""
+import threading
+
+
+class RunCancelled(Exception):
+    """Генерация остановлена пользователем"""
+
+
+class RunControl:
+    """Флаги отмены и паузы, общие для управляющего и рабочего потоков"""
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Поток на паузе должен проснуться, чтобы заметить отмену
+        self._running.set()
+
+    def checkpoint(self):
+        """Ждет снятия паузы; при отмене выбрасывает RunCancelled"""
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise RunCancelled()
@@ -0,0 +1,144 @@
+"""Журнал и замер времени этапов генерации.
+
+Все модули пишут в логгер "certgen", который по умолчанию молчит
+(NullHandler); configure_logging включает вывод для CLI или отладки.
+StageTimer суммирует время этапов (шрифт, разметка, рисование,
+кодирование, запись) и сохраняет отчет о запуске в JSON.
+"""
+import json
+import logging
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+
+LOGGER_NAME = "certgen"
+
+logging.getLogger(LOGGER_NAME).addHandler(logging.NullHandler())
+
+STAGES = ("font", "layout", "draw", "encode", "save")
+
+STAGE_TITLES = {
+    "font": "шрифт",
+    "layout": "разметка",
+    "draw": "рисование",
+    "encode": "кодирование",
+    "save": "запись",
+}
+
+
+def get_logger(name):
+    """Логгер модуля внутри общего логгера certgen"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+def configure_logging(level="WARNING", path=None):
+    """Включает вывод журнала в stderr или в файл"""
+    handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.addHandler(handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+class _Stage:
+    """Контекстный менеджер одного замера"""
+
+    __slots__ = ("timer", "name", "count", "start")
+
+    def __init__(self, timer, name, count):
+        self.timer = timer
+        self.name = name
+        self.count = count
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.start, self.count)
+
+
+class StageTimer:
+    """Суммарное время и количество вызовов по этапам"""
+
+    def __init__(self):
+        self.started = datetime.now()
+        self._start = time.perf_counter()
+        self.reset()
+
+    def reset(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.counts = dict.fromkeys(STAGES, 0)
+
+    def stage(self, name, count=1):
+        """Замер этапа; count=0 добавляет время к этапу без увеличения числа элементов"""
+        return _Stage(self, name, count)
+
+    def add(self, name, seconds, count=1):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def snapshot(self):
+        """Данные для передачи из процесса пула"""
+        return {"seconds": dict(self.seconds), "counts": dict(self.counts)}
+
+    def merge(self, snapshot):
+        for name, seconds in snapshot["seconds"].items():
+            self.add(name, seconds, snapshot["counts"].get(name, 0))
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def summary_text(self):
+        """Краткая строка для строки состояния: время этапов и их доля"""
+        total = sum(self.seconds.values())
+        parts = []
+        for name in STAGES:
+            seconds = self.seconds.get(name, 0.0)
+            if self.counts.get(name):
+                share = seconds * 100 / total if total else 0
+                parts.append(f"{STAGE_TITLES[name]} {seconds * 1000:.0f} мс ({share:.0f}%)")
+        return ", ".join(parts)
+
+    def report(self, **extra):
+        stages = {}
+        for name in STAGES:
+            seconds = self.seconds.get(name, 0.0)
+            count = self.counts.get(name, 0)
+            stages[name] = {
+                "seconds": round(seconds, 6),
+                "count": count,
+                "ms_per_item": round(seconds * 1000 / count, 4) if count else None,
+            }
+        report = {
+            "started": self.started.isoformat(timespec="seconds"),
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "stages": stages,
+        }
+        report.update(extra)
+        return report
+
+    def write_report(self, path, **extra):
+        """Сохраняет отчет о запуске в JSON"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(**extra), f, ensure_ascii=False, indent=2)
+
+
+class NullTimer:
+    """Заглушка без замеров, когда отчет не нужен"""
+
+    _stage = nullcontext()
+
+    def stage(self, name, count=1):
+        return self._stage
+
+    def add(self, name, seconds, count=1):
+        pass
+
+    def merge(self, snapshot):
+        pass
+
+
+NULL_TIMER = NullTimer()
@@ -0,0 +1,329 @@
+"""Разбиение генерации на части для нескольких машин, слияние и проверка.
+
+certificate_cli.py --shard i/N рисует только строки списка с номером
+(с нуля) index % N == i - 1. Нумерация строк общая для всех частей,
+поэтому имена файлов certificate_{номер}_... не пересекаются и папки
+частей можно слить в одну. Каждая часть пишет рядом с сертификатами
+(или в ZIP архив) манифест части .certgen_shard_{i}of{N}.json: число
+строк в списке, хеши файла списка и настроек отрисовки и свои файлы
+(номер строки, имя, размер, SHA-256).
+
+Пример:
+    python sharding.py merge итог/ part1/ part2.zip part3/
+    python sharding.py verify итог/
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import zipfile
+
+from render_manifest import file_digest, stream_digest
+
+
+SHARD_MANIFEST_VERSION = 2
+
+# Манифест части i из N: .certgen_shard_{i}of{N}.json
+SHARD_MANIFEST_PATTERN = re.compile(r"^\.certgen_shard_(\d+)of(\d+)\.json$")
+
+# Имена сертификатов: certificate_{номер с единицы}_{ФИО}.{расширение}
+CERTIFICATE_PATTERN = re.compile(r"^certificate_(\d+)_.*\.\w+$")
+
+
+class ShardError(ValueError):
+    """Неверно задана часть или части не сходятся при слиянии"""
+
+
+class Shard:
+    """Часть number из count (с единицы): строки с номером index % count == number - 1"""
+
+    def __init__(self, number, count):
+        if count < 1 or not 1 <= number <= count:
+            raise ShardError(f"Часть должна быть от 1 до {count}, указано {number}/{count}")
+        self.number = number
+        self.count = count
+
+    @classmethod
+    def parse(cls, text):
+        """Часть из строки вида 'i/N'"""
+        match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", text)
+        if not match:
+            raise ShardError(f"Часть задается как i/N, например 1/4, а не '{text}'")
+        return cls(int(match.group(1)), int(match.group(2)))
+
+    def owns(self, index):
+        return index % self.count == self.number - 1
+
+    def share(self, total):
+        """Сколько строк из total достанется части"""
+        return len(range(self.number - 1, total, self.count))
+
+    def manifest_name(self):
+        return f".certgen_shard_{self.number}of{self.count}.json"
+
+    def __str__(self):
+        return f"{self.number}/{self.count}"
+
+
+def file_entry(entry):
+    """(номер строки, имя, размер, SHA-256) записи манифеста; в версии 1 хеша нет"""
+    index, filename, size, *rest = entry
+    return index, filename, size, (rest[0] if rest else None)
+
+
+def source_digest(names):
+    """SHA-256 файла списка ФИО или плана разметки, если names читается из файла"""
+    path = getattr(names, "path", None)
+    return file_digest(path) if path else None
+
+
+class ShardManifest:
+    """Манифест одной части: собирается по ходу генерации и пишется в приемник в конце"""
+
+    def __init__(self, shard):
+        self.shard = shard
+        self.source = None
+        self.fingerprint = None
+        self.rows = 0
+        self.files = []
+
+    def start(self, names, fingerprint):
+        """Запоминает хеш списка и настроек отрисовки (manifest_fingerprint) запуска"""
+        self.source = source_digest(names)
+        self.fingerprint = fingerprint
+        self.rows = 0
+        self.files = []
+
+    def take(self, index, filename):
+        """Учитывает строку списка; True, если она относится к этой части"""
+        self.rows = max(self.rows, index + 1)
+        if not self.shard.owns(index):
+            return False
+        self.files.append((index, filename))
+        return True
+
+    def to_dict(self, sink):
+        """Содержимое манифеста; размеры и хеши файлов берутся из приемника"""
+        return {
+            "version": SHARD_MANIFEST_VERSION,
+            "shard": [self.shard.number, self.shard.count],
+            "rows": self.rows,
+            "source": self.source,
+            "fingerprint": self.fingerprint,
+            "files": [[index, filename, sink.size(filename), sink.digest(filename)]
+                      for index, filename in self.files],
+        }
+
+    def write(self, sink):
+        """Пишет манифест в приемник (папку или архив) рядом с сертификатами"""
+        data = json.dumps(self.to_dict(sink), ensure_ascii=False).encode("utf-8")
+        sink.write_encoded(self.shard.manifest_name(), data)
+
+
+class ShardSource:
+    """Папка или ZIP архив с результатом одной или нескольких частей"""
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path) if os.path.isfile(path) else None
+
+    def names(self):
+        if self._zip is not None:
+            return self._zip.namelist()
+        return os.listdir(self.path)
+
+    def read(self, name):
+        if self._zip is not None:
+            return self._zip.read(name)
+        with open(os.path.join(self.path, name), "rb") as f:
+            return f.read()
+
+    def size(self, name):
+        try:
+            if self._zip is not None:
+                return self._zip.getinfo(name).file_size
+            return os.path.getsize(os.path.join(self.path, name))
+        except (KeyError, OSError):
+            return None
+
+    def digest(self, name):
+        if self._zip is not None:
+            with self._zip.open(name) as entry:
+                return stream_digest(entry)
+        return file_digest(os.path.join(self.path, name))
+
+    def copy(self, name, target):
+        if self._zip is not None:
+            with self._zip.open(name) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            shutil.copy2(os.path.join(self.path, name), target)
+
+    def manifests(self):
+        """Манифесты частей: список (имя файла манифеста, содержимое)"""
+        found = []
+        for name in sorted(self.names()):
+            if SHARD_MANIFEST_PATTERN.match(name):
+                found.append((name, json.loads(self.read(name).decode("utf-8"))))
+        return found
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+class VerifyReport:
+    """Итог проверки: строк, частей, найденные проблемы"""
+
+    def __init__(self):
+        self.rows = 0
+        self.shards = 0
+        self.files = 0
+        self.problems = []
+
+    @property
+    def ok(self):
+        return not self.problems
+
+    def problem(self, text):
+        self.problems.append(text)
+
+    def describe(self, limit=20):
+        if self.ok:
+            return f"Проверено: {self.files} сертификатов из {self.rows} строк, частей: {self.shards}; " \
+                   f"каждая строка нарисована ровно один раз"
+        lines = [f"Найдено проблем: {len(self.problems)}"]
+        lines.extend(f"  {text}" for text in self.problems[:limit])
+        if len(self.problems) > limit:
+            lines.append(f"  ... и еще {len(self.problems) - limit}")
+        return "\n".join(lines)
+
+
+def verify_shards(path):
+    """Проверяет, что части в папке (или архиве) покрывают каждую строку ровно один раз
+    и файлы совпадают с манифестами по размеру и SHA-256 (если он записан)"""
+    report = VerifyReport()
+    source = ShardSource(path)
+    try:
+        manifests = source.manifests()
+        if not manifests:
+            report.problem("Не найдено ни одного манифеста части (.certgen_shard_*.json)")
+            return report
+        first = manifests[0][1]
+        count = first["shard"][1]
+        report.rows = first["rows"]
+        report.shards = len(manifests)
+        numbers = set()
+        owner = {}
+        for name, manifest in manifests:
+            number, shard_count = manifest["shard"]
+            for key in ("rows", "source", "fingerprint"):
+                if manifest[key] != first[key]:
+                    report.problem(f"{name}: {key} не совпадает с {manifests[0][0]} - части от разных запусков")
+            if shard_count != count:
+                report.problem(f"{name}: частей {shard_count}, а в {manifests[0][0]} - {count}")
+                continue
+            numbers.add(number)
+            shard = Shard(number, shard_count)
+            for index, filename, size, digest in map(file_entry, manifest["files"]):
+                if not shard.owns(index):
+                    report.problem(f"{name}: строка {index + 1} не относится к части {shard}")
+                if index in owner:
+                    report.problem(f"Строка {index + 1} нарисована дважды: {owner[index]} и {name}")
+                    continue
+                owner[index] = name
+                actual = source.size(filename)
+                if actual is None:
+                    report.problem(f"Нет файла {filename} (часть {shard})")
+                elif size is not None and actual != size:
+                    report.problem(f"Размер {filename}: {actual} байт вместо {size} - файл поврежден")
+                elif digest is not None and source.digest(filename) != digest:
+                    report.problem(f"SHA-256 {filename} не совпадает с манифестом - файл поврежден")
+                else:
+                    report.files += 1
+        for number in sorted(set(range(1, count + 1)) - numbers):
+            report.problem(f"Нет манифеста части {number}/{count}")
+        missing = [index for index in range(report.rows) if index not in owner]
+        if missing and numbers == set(range(1, count + 1)):
+            report.problem(f"Не нарисовано строк: {len(missing)} (первая - {missing[0] + 1})")
+        listed = {file_entry(entry)[1] for _name, manifest in manifests for entry in manifest["files"]}
+        extra = [name for name in source.names() if CERTIFICATE_PATTERN.match(name) and name not in listed]
+        if extra:
+            report.problem(f"Файлы вне манифестов частей: {len(extra)} (например, {sorted(extra)[0]})")
+    finally:
+        source.close()
+    return report
+
+
+def merge_shards(target, sources, progress=None):
+    """Копирует сертификаты и манифесты частей из папок или архивов sources в папку target.
+
+    Файл, который уже есть в target с другим содержимым (SHA-256 из манифеста
+    части), не перезаписывается: это значит, что части от разных запусков.
+    Возвращает VerifyReport для target.
+    """
+    os.makedirs(target, exist_ok=True)
+    copied = 0
+    for path in sources:
+        source = ShardSource(path)
+        try:
+            manifests = source.manifests()
+            if not manifests:
+                raise ShardError(f"В {path} нет манифеста части (.certgen_shard_*.json)")
+            for name, manifest in manifests:
+                for _index, filename, _size, digest in map(file_entry, manifest["files"]):
+                    destination = os.path.join(target, filename)
+                    if os.path.exists(destination):
+                        if digest is None:
+                            # Манифест версии 1 без хешей: сравниваем хеши файлов
+                            digest = source.digest(filename)
+                        if file_digest(destination) != digest:
+                            raise ShardError(f"{filename} уже есть в {target} и отличается от файла из {path}")
+                        continue
+                    source.copy(filename, destination)
+                    copied += 1
+                    if progress:
+                        progress(copied)
+                manifest_path = os.path.join(target, name)
+                data = source.read(name)
+                if os.path.exists(manifest_path):
+                    with open(manifest_path, "rb") as f:
+                        if f.read() != data:
+                            raise ShardError(f"Манифест {name} из {path} отличается от уже скопированного")
+                else:
+                    with open(manifest_path, "wb") as f:
+                        f.write(data)
+        finally:
+            source.close()
+    return verify_shards(target)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Слияние и проверка частей генерации (--shard i/N)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge = commands.add_parser("merge", help="Скопировать части в одну папку и проверить результат")
+    merge.add_argument("target", help="Папка для объединенного результата")
+    merge.add_argument("sources", nargs="+", help="Папки или ZIP архивы частей")
+    verify = commands.add_parser("verify", help="Проверить, что каждая строка нарисована ровно один раз")
+    verify.add_argument("path", help="Папка или ZIP архив с частями")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == "merge":
+            report = merge_shards(args.target, args.sources)
+        else:
+            report = verify_shards(args.path)
+    except (ShardError, OSError, ValueError, KeyError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    print(report.describe())
+    return 0 if report.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
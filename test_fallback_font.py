@@ -0,0 +1,36 @@
+"""Встроенный шрифт Pillow вместо ненайденного: манифест не должен падать.
+
+Запуск: python -m pytest -q test_fallback_font.py
+"""
+from PIL import Image
+
+import certificate_renderer
+from certificate_renderer import RenderSettings, manifest_fingerprint
+from font_resolver import FontResolver, font_file
+from render_manifest import batch_fingerprint
+
+
+def empty_resolver():
+    """Резолвер без папок шрифтов и каталога: get_font отдает ImageFont.load_default()"""
+    return FontResolver(font_dirs=[], catalog_path=False)
+
+
+def test_builtin_font_has_no_file():
+    font = empty_resolver().get_font("НетТакогоШрифта", 40)
+    assert font_file(font) is None
+
+
+def test_batch_fingerprint_accepts_builtin_font():
+    font = empty_resolver().get_font("НетТакогоШрифта", 40)
+    template = Image.new("RGB", (40, 20), "white")
+    # path встроенного шрифта (BytesIO в Pillow >= 10.1) не хешируется как файл
+    fingerprint = batch_fingerprint(template, {}, getattr(font, "path", None))
+    assert fingerprint == batch_fingerprint(template, {}, None)
+
+
+def test_manifest_fingerprint_with_fallback_font(monkeypatch):
+    resolver = empty_resolver()
+    monkeypatch.setattr(certificate_renderer, "default_resolver", lambda: resolver)
+    settings = RenderSettings(selected_font="НетТакогоШрифта")
+    template = Image.new("RGB", (40, 20), "white")
+    assert manifest_fingerprint(template, settings) == manifest_fingerprint(template, settings)
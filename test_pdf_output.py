@@ -0,0 +1,71 @@
+"""PDF по плану разметки (--from-plan --pdf) совпадает с PDF по списку ФИО.
+
+Запуск: python -m pytest -q test_pdf_output.py
+"""
+import re
+import zlib
+
+import pytest
+from PIL import Image
+
+from certificate_renderer import RenderSettings, Roster, field_columns, load_font
+from font_resolver import font_file
+from layout_plan import LayoutPlan, write_plan
+from pdf_output import generate_pdf
+
+
+FONT = "DejaVuSans"
+
+ROWS = [
+    ("Иванов Иван Иванович", "Основы программирования на Python", "1001"),
+    ("Константинопольский Святослав Александрович", "Анализ данных для начинающих специалистов", "1002"),
+    ("Петрова Анна Сергеевна", "", "1003"),
+]
+
+
+def page_text(path):
+    """Операторы Tf, Tm и Tj всех потоков PDF по порядку"""
+    with open(path, "rb") as f:
+        data = f.read()
+    operators = []
+    for stream in re.findall(rb"stream\n(.*?)\nendstream", data, re.S):
+        try:
+            content = zlib.decompress(stream)
+        except zlib.error:
+            continue
+        operators.extend(re.findall(rb"/F\d+ [\d.]+ Tf|[-\d.]+ [-\d.]+ Tm <[0-9A-F]*> Tj", content))
+    return operators
+
+
+@pytest.fixture
+def settings():
+    if not font_file(load_font(FONT, 40)):
+        pytest.skip(f"Нет файла шрифта {FONT} для встраивания в PDF")
+    return RenderSettings(
+        selected_font=FONT, font_size=40, font_fit="name", min_font_size=12,
+        text_area_x1=100, text_area_y1=100, text_area_x2=600, text_area_y2=300,
+        text_fields=[
+            {"column": "Курс", "text_area_x1": 100, "text_area_y1": 320, "text_area_x2": 1100,
+             "text_area_y2": 450, "font_size": 30},
+            {"column": "Номер", "text_mode": "point", "text_x": 950, "text_y": 720, "font_size": 20},
+        ],
+    )
+
+
+def test_pdf_from_plan_matches_roster(tmp_path, settings):
+    roster_path = tmp_path / "names.csv"
+    roster_path.write_text("ФИО,Курс,Номер\n" + "".join(",".join(row) + "\n" for row in ROWS),
+                           encoding="utf-8")
+    roster = Roster(str(roster_path), extra_columns=field_columns(settings))
+    template = Image.new("RGB", (1200, 800), "white")
+    plan_path = str(tmp_path / "plan.jsonl")
+    write_plan(plan_path, roster, settings, template.size)
+
+    assert generate_pdf(template, roster, settings, str(tmp_path / "roster.pdf")) == len(ROWS)
+    plan = LayoutPlan(plan_path)
+    assert generate_pdf(template, plan, plan.settings, str(tmp_path / "plan.pdf")) == len(ROWS)
+
+    expected = page_text(tmp_path / "roster.pdf")
+    # ФИО (2 строки у длинного), курс (1 строка у двух записей) и номер на каждой странице
+    assert sum(b" Tj" in op for op in expected) >= 2 * len(ROWS) + 2
+    assert page_text(tmp_path / "plan.pdf") == expected